@@ -0,0 +1,256 @@
+"""Time the stages of the prepare/run/select pipeline on synthetic data"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint: disable=C0325
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+import pandas
+
+from bluepymm import tools
+from bluepymm.prepare_combos import create_mm_sqlite
+from bluepymm.run_combos import calculate_scores
+from bluepymm.select_combos import (megate_output, sqlite_io,
+                                    table_processing,
+                                    process_megate_config as proc_config)
+
+import synthetic_data
+
+
+STAGES = ['prepare', 'arg_list', 'run', 'expand', 'read', 'process_emodels',
+          'save_megate_results']
+
+
+@contextlib.contextmanager
+def timed(results, stage, quiet=True):
+    """Time the body of a with statement and append the result"""
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        wall_time = time.time() - start_time
+        if quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+        results.append({'stage': stage, 'wall_time': wall_time,
+                        'peak_rss_mb': tools.get_peak_rss_mb()})
+        print('%-20s %10.2f s' % (stage, wall_time))
+
+
+def prepare(inputs, scores_db_filename):
+    """Create the scores database"""
+    emodel_dirs = {emodel: inputs['emodel_dir']
+                   for emodel in inputs['final_dict']}
+    args = [scores_db_filename]
+    if 'circuitmvd3_filename' in inputs:
+        function = create_mm_sqlite.create_mm_sqlite_circuitmvd3
+        args.append(inputs['circuitmvd3_filename'])
+    else:
+        function = create_mm_sqlite.create_mm_sqlite
+        args.append(inputs['recipe_filename'])
+    function(*(args + [inputs['morph_dir'], inputs['morph_dir'],
+                       inputs['morph_dir'], inputs['emodel_etype_map'],
+                       inputs['final_dict'], emodel_dirs]))
+    return emodel_dirs
+
+
+def run_benchmarks(scale, output_dir, stages, n_processes=None,
+                   n_run_combos=1000, synthetic_evaluator=None,
+                   use_circuitmvd3=False, quiet=True):
+    """Generate synthetic data and time the stages of the pipeline.
+
+    Args:
+        scale: synthetic_data.SyntheticScale
+        output_dir: directory for the synthetic data and databases
+        stages: list of stages to time, see STAGES. The prepare stage always
+            runs, since the other stages need the scores database.
+        n_processes: number of processes of the run and select stages
+        n_run_combos: number of combos that run in the run stage, the other
+            combos of the run database get random scores
+        synthetic_evaluator: dict with arguments of
+            bluepymm.run_combos.synthetic.create, the features are set to the
+            features of the scale
+        use_circuitmvd3: use a circuit.mvd3 instead of a recipe
+        quiet: hide the output of the timed functions
+
+    Returns:
+        list of dicts with keys 'stage', 'wall_time' and 'peak_rss_mb'
+    """
+    results = []
+    synthetic_evaluator = dict(synthetic_evaluator or {},
+                               features=scale.features)
+    scores_db_filename = os.path.join(output_dir, 'scores.sqlite')
+
+    with timed(results, 'generate_inputs', quiet):
+        inputs = synthetic_data.write_inputs(scale, output_dir,
+                                             use_circuitmvd3=use_circuitmvd3)
+    with timed(results, 'prepare', quiet):
+        emodel_dirs = prepare(inputs, scores_db_filename)
+
+    if 'arg_list' in stages:
+        with timed(results, 'arg_list', quiet):
+            task_context = calculate_scores.create_task_context(
+                scores_db_filename, emodel_dirs, inputs['final_dict'],
+                use_apical_points=False,
+                synthetic_evaluator=synthetic_evaluator)
+            calculate_scores.create_task_list(scores_db_filename,
+                                              task_context)
+
+    if 'run' in stages:
+        run_db_filename = os.path.join(output_dir, 'run_scores.sqlite')
+        shutil.copy(scores_db_filename, run_db_filename)
+        synthetic_data.fill_scores(scale, run_db_filename,
+                                   first_index=n_run_combos)
+        with timed(results, 'run', quiet):
+            calculate_scores.calculate_scores(
+                inputs['final_dict'], emodel_dirs, run_db_filename,
+                use_apical_points=False, n_processes=n_processes,
+                synthetic_evaluator=synthetic_evaluator)
+
+    select_stages = ['expand', 'read', 'process_emodels',
+                     'save_megate_results']
+    if not set(select_stages).intersection(stages):
+        return results
+
+    synthetic_data.fill_scores(scale, scores_db_filename)
+    with timed(results, 'expand', quiet):
+        calculate_scores.expand_scores_to_score_values_table(
+            scores_db_filename)
+    with timed(results, 'read', quiet):
+        scores, score_values = \
+            sqlite_io.read_and_process_sqlite_score_tables(scores_db_filename)
+
+    to_skip_patterns, _ = proc_config.read_to_skip_features(
+        {'to_skip_features': []})
+    megate_patterns, _ = proc_config.read_megate_thresholds(
+        {'megate_thresholds': [{'emodel': ['.*'], 'fullmtype': ['.*'],
+                                'etype': ['.*'], 'features': ['.*'],
+                                'megate_threshold': 5}]})
+    emodels = sorted(scores[scores.is_original == 0].emodel.unique())
+    with timed(results, 'process_emodels', quiet):
+        emodel_infos = table_processing.process_emodels(
+            emodels, scores, score_values, to_skip_patterns,
+            megate_patterns, False, False, None, n_processes=n_processes)
+
+    if 'save_megate_results' in stages:
+        ext_neurondb = pandas.concat(
+            [emodel_info[0] for emodel_info in emodel_infos.values()
+             if emodel_info is not None]).reset_index(drop=True)
+        with timed(results, 'save_megate_results', quiet):
+            megate_output.save_megate_results(
+                ext_neurondb, os.path.join(output_dir, 'output_megate'),
+                sort_key='combo_name')
+
+    return [result for result in results
+            if result['stage'] in stages + ['generate_inputs', 'prepare']]
+
+
+def main(arg_list=None):
+    """Main"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n_combos', type=int, default=1000,
+                        help='Number of me-combinations')
+    parser.add_argument('--n_layers', type=int, default=6)
+    parser.add_argument('--n_mtypes_per_layer', type=int, default=5)
+    parser.add_argument('--n_etypes', type=int, default=10)
+    parser.add_argument('--n_etypes_per_mtype', type=int, default=2)
+    parser.add_argument('--n_emodels_per_etype', type=int, default=2)
+    parser.add_argument('--n_features', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--circuitmvd3', action='store_true',
+                        help='Prepare from a circuit.mvd3 instead of a '
+                        'recipe')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='Comma-separated list of stages to time, '
+                        'default: %(default)s')
+    parser.add_argument('--n_processes', type=int, default=None,
+                        help='Number of processes of the run and select '
+                        'stages')
+    parser.add_argument('--n_run_combos', type=int, default=1000,
+                        help='Number of combos run by the synthetic evaluator '
+                        'in the run stage')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Mean time (in s) the synthetic evaluator '
+                        'spends on a combo')
+    parser.add_argument('--failure_rate', type=float, default=0.0,
+                        help='Fraction of the combos that fail in the '
+                        'synthetic evaluator')
+    parser.add_argument('--output_dir', default=None,
+                        help='Directory for the synthetic data, is emptied '
+                        'first. Default: a new temporary directory')
+    parser.add_argument('--json', dest='json_filename', default=None,
+                        help='Write the results to a JSON file')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Show the output of the timed functions')
+    args = parser.parse_args(arg_list)
+
+    stages = args.stages.split(',')
+    unknown_stages = set(stages) - set(STAGES)
+    if unknown_stages:
+        parser.error('Unknown stages: %s' % ', '.join(sorted(unknown_stages)))
+
+    scale = synthetic_data.SyntheticScale(
+        args.n_combos, n_layers=args.n_layers,
+        n_mtypes_per_layer=args.n_mtypes_per_layer, n_etypes=args.n_etypes,
+        n_etypes_per_mtype=args.n_etypes_per_mtype,
+        n_emodels_per_etype=args.n_emodels_per_etype,
+        n_features=args.n_features, seed=args.seed)
+
+    if args.output_dir is None:
+        output_dir = tempfile.mkdtemp(prefix='bluepymm_bench_')
+    else:
+        output_dir = os.path.abspath(args.output_dir)
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+
+    print('Benchmarking %d me-combos (%d morphologies, %d e-models) in %s' %
+          (scale.n_combos, scale.n_morphs, len(scale.emodels), output_dir))
+    results = run_benchmarks(scale, output_dir, stages,
+                             n_processes=args.n_processes,
+                             n_run_combos=args.n_run_combos,
+                             synthetic_evaluator={
+                                 'latency': args.latency,
+                                 'failure_rate': args.failure_rate},
+                             use_circuitmvd3=args.circuitmvd3,
+                             quiet=not args.verbose)
+
+    if args.json_filename is not None:
+        with open(args.json_filename, 'w') as json_file:
+            json.dump({'n_combos': scale.n_combos,
+                       'arguments': vars(args),
+                       'results': results}, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
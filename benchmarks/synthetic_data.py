@@ -0,0 +1,293 @@
+"""Synthetic BluePyMM input data of configurable size"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""Every layer contains the same m-types, every m-type has the same number of
+e-types and every e-type has the same number of e-models, which apply to all
+layers. Every morphology therefore combines with
+
+    n_etypes_per_mtype * n_emodels_per_etype
+
+e-models, and the number of morphologies is chosen to obtain the requested
+number of me-combinations. All the e-models share one e-model directory
+without setup package, the run step uses the synthetic evaluator of
+bluepymm.run_combos.synthetic instead. Only the morphologies of the exemplars
+are written to disk.
+"""
+
+# pylint: disable=C0325
+
+import os
+import json
+import random
+import sqlite3
+
+import numpy
+
+
+class SyntheticScale(object):
+
+    """Shape of a synthetic circuit"""
+
+    def __init__(self, n_combos, n_layers=6, n_mtypes_per_layer=5,
+                 n_etypes=10, n_etypes_per_mtype=2, n_emodels_per_etype=2,
+                 n_features=20, seed=1):
+        """Constructor
+
+        Args:
+            n_combos: approximate number of (non-exemplar) me-combinations
+            n_layers: number of layers
+            n_mtypes_per_layer: number of m-types in every layer
+            n_etypes: number of e-types
+            n_etypes_per_mtype: number of e-types of every m-type in the
+                recipe, at most n_etypes
+            n_emodels_per_etype: number of e-models of every e-type
+            n_features: number of features scored per combo
+            seed: seed of the random number generators
+        """
+        self.n_layers = n_layers
+        self.n_mtypes_per_layer = n_mtypes_per_layer
+        self.n_etypes = n_etypes
+        self.n_etypes_per_mtype = min(n_etypes_per_mtype, n_etypes)
+        self.n_emodels_per_etype = n_emodels_per_etype
+        self.n_features = n_features
+        self.seed = seed
+
+        combos_per_morph = self.n_etypes_per_mtype * n_emodels_per_etype
+        self.n_morphs = max(1, -(-n_combos // combos_per_morph))
+        self.n_combos = self.n_morphs * combos_per_morph
+
+    @property
+    def layers(self):
+        """Layer names"""
+        return [str(layer) for layer in range(1, self.n_layers + 1)]
+
+    @property
+    def mtypes(self):
+        """M-type names"""
+        return ['L%s_MT%d' % (layer, mtype) for layer in self.layers
+                for mtype in range(self.n_mtypes_per_layer)]
+
+    @property
+    def etypes(self):
+        """E-type names"""
+        return ['ET%d' % etype for etype in range(self.n_etypes)]
+
+    @property
+    def emodels(self):
+        """List of (emodel, etype)-tuples"""
+        return [('em_%s_%d' % (etype, index), etype) for etype in self.etypes
+                for index in range(self.n_emodels_per_etype)]
+
+    @property
+    def features(self):
+        """Feature names"""
+        return ['Step%d.soma.feature%d' % (index % 3 + 1, index)
+                for index in range(self.n_features)]
+
+    def layer_mtypes(self):
+        """List of (layer, mtype)-tuples"""
+        return [(mtype.split('_')[0][1:], mtype) for mtype in self.mtypes]
+
+    def mtype_etypes(self, mtype_index):
+        """E-types of the m-type with a given index"""
+        return [self.etypes[(mtype_index + offset) % self.n_etypes]
+                for offset in range(self.n_etypes_per_mtype)]
+
+    def morphs(self):
+        """List of (morph_name, layer, mtype)-tuples"""
+        layer_mtypes = self.layer_mtypes()
+        return [('morph_%08d' % index,) + layer_mtypes[index %
+                                                       len(layer_mtypes)]
+                for index in range(self.n_morphs)]
+
+
+def write_recipe(scale, recipe_filename):
+    """Write a recipe in XML format"""
+    with open(recipe_filename, 'w') as recipe_file:
+        recipe_file.write('<?xml version="1.0" encoding="iso-8859-1"?>\n'
+                          '<Recipe>\n    <NeuronTypes>\n')
+        mtype_index = 0
+        for layer in scale.layers:
+            recipe_file.write('        <Layer id="%s" percentage="1.0">\n'
+                              % layer)
+            for _ in range(scale.n_mtypes_per_layer):
+                recipe_file.write(
+                    '            <StructuralType id="%s" percentage="1.0">\n'
+                    % scale.mtypes[mtype_index])
+                for etype in scale.mtype_etypes(mtype_index):
+                    recipe_file.write(
+                        '                <ElectroType id="%s" '
+                        'percentage="1.0"/>\n' % etype)
+                recipe_file.write('            </StructuralType>\n')
+                mtype_index += 1
+            recipe_file.write('        </Layer>\n')
+        recipe_file.write('    </NeuronTypes>\n</Recipe>\n')
+
+
+def write_neurondb(scale, morph_dir):
+    """Write neuronDB.xml with all morphologies"""
+    with open(os.path.join(morph_dir, 'neuronDB.xml'), 'w') as neurondb_file:
+        neurondb_file.write('<neurondb>\n    <listing>\n')
+        for morph_name, layer, mtype in scale.morphs():
+            neurondb_file.write(
+                '        <morphology>\n'
+                '            <name>%s</name>\n'
+                '            <mtype>%s</mtype>\n'
+                '            <msubtype />\n'
+                '            <layer>%s</layer>\n'
+                '        </morphology>\n' % (morph_name, mtype, layer))
+        neurondb_file.write('    </listing>\n</neurondb>\n')
+
+
+def write_circuitmvd3(scale, circuitmvd3_filename):
+    """Write circuit.mvd3 with one cell for every morphology and e-type of its
+    m-type"""
+    import h5py
+
+    layer_mtypes = scale.layer_mtypes()
+    morph_ids = numpy.arange(scale.n_morphs)
+    mtype_ids = morph_ids % len(layer_mtypes)
+    cell_morph_ids = numpy.repeat(morph_ids, scale.n_etypes_per_mtype)
+    cell_mtype_ids = numpy.repeat(mtype_ids, scale.n_etypes_per_mtype)
+    offsets = numpy.tile(numpy.arange(scale.n_etypes_per_mtype),
+                         scale.n_morphs)
+    cell_etype_ids = (cell_mtype_ids + offsets) % scale.n_etypes
+    cell_layer_ids = numpy.array(
+        [scale.layers.index(layer) for layer, _ in layer_mtypes])[
+            cell_mtype_ids]
+
+    def encode(names):
+        """Encode names as bytes for h5py"""
+        return numpy.array([name.encode('utf-8') for name in names])
+
+    with h5py.File(circuitmvd3_filename, 'w') as circuitmvd3_file:
+        properties = circuitmvd3_file.create_group('cells/properties')
+        properties['etype'] = cell_etype_ids
+        properties['mtype'] = cell_mtype_ids
+        properties['morphology'] = cell_morph_ids
+        properties['layer'] = cell_layer_ids
+        library = circuitmvd3_file.create_group('library')
+        library['etype'] = encode(scale.etypes)
+        library['mtype'] = encode(scale.mtypes)
+        library['morphology'] = encode(
+            [morph_name for morph_name, _, _ in scale.morphs()])
+        library['layer'] = encode(scale.layers)
+
+
+def write_emodels(scale, emodel_dir, morph_dir):
+    """Write the e-model e-type map, final.json and the exemplar morphologies.
+
+    Returns:
+        tuple with the e-model e-type map and the final dict
+    """
+    emodel_etype_map = {}
+    final_dict = {}
+    morphs = scale.morphs()
+    for index, (emodel, etype) in enumerate(scale.emodels):
+        exemplar_morph = morphs[index % len(morphs)][0]
+        emodel_etype_map[emodel] = {'mm_recipe': emodel, 'etype': etype,
+                                    'layer': scale.layers}
+        final_dict[emodel] = {
+            'main_path': '.', 'seed': 1, 'rank': 0, 'notes': '',
+            'branch': emodel, 'params': {'cm': 1.0},
+            'fitness': {feature: 1.0 for feature in scale.features},
+            'score': float(scale.n_features),
+            'morph_path': 'morphologies/%s.asc' % exemplar_morph}
+
+        open(os.path.join(morph_dir, '%s.asc' % exemplar_morph), 'w').close()
+
+    with open(os.path.join(emodel_dir, 'emodel_etype_map.json'), 'w') as fd:
+        json.dump(emodel_etype_map, fd, indent=2)
+    with open(os.path.join(emodel_dir, 'final.json'), 'w') as fd:
+        json.dump(final_dict, fd, indent=2)
+
+    return emodel_etype_map, final_dict
+
+
+def write_inputs(scale, output_dir, use_circuitmvd3=False):
+    """Write all inputs of the prepare step.
+
+    Returns:
+        dict with keys 'recipe_filename' or 'circuitmvd3_filename',
+        'morph_dir', 'emodel_dir', 'emodel_etype_map' and 'final_dict'
+    """
+    morph_dir = os.path.join(output_dir, 'morphs')
+    emodel_dir = os.path.join(output_dir, 'emodels')
+    for directory in [morph_dir, emodel_dir]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    inputs = {'morph_dir': morph_dir, 'emodel_dir': emodel_dir}
+    write_neurondb(scale, morph_dir)
+    if use_circuitmvd3:
+        inputs['circuitmvd3_filename'] = os.path.join(output_dir,
+                                                      'circuit.mvd3')
+        write_circuitmvd3(scale, inputs['circuitmvd3_filename'])
+    else:
+        inputs['recipe_filename'] = os.path.join(output_dir, 'recipe.xml')
+        write_recipe(scale, inputs['recipe_filename'])
+    inputs['emodel_etype_map'], inputs['final_dict'] = write_emodels(
+        scale, emodel_dir, morph_dir)
+
+    return inputs
+
+
+def random_scores(scale, n_rows, rng):
+    """Return a list of n_rows JSON strings with random scores. The scores
+    are absolute values of normally distributed values with standard deviation
+    2, so that a fraction of the combos fails a me-gate threshold of 5."""
+    values = numpy.abs(rng.normal(0.0, 2.0, (n_rows, scale.n_features)))
+    features = scale.features
+    return [json.dumps(dict(zip(features, row))) for row in values.tolist()]
+
+
+def fill_scores(scale, scores_db_filename, first_index=0, chunk_size=10000):
+    """Mark combos of a scores database as run, with random scores and extra
+    values.
+
+    Args:
+        scale: SyntheticScale
+        scores_db_filename: path to .sqlite database created by the prepare
+            step
+        first_index: index of the first row to fill, all the following rows
+            are filled as well
+        chunk_size: number of rows updated per transaction
+    """
+    rng = numpy.random.RandomState(scale.seed)
+    py_rng = random.Random(scale.seed)
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        indices = [index for (index,) in scores_db.execute(
+            'SELECT `index` FROM scores WHERE `index`>=? ORDER BY `index`',
+            (first_index,))]
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            scores = random_scores(scale, len(chunk), rng)
+            extra_values = [json.dumps(
+                {'holding_current': -py_rng.uniform(0.0, 0.2),
+                 'threshold_current': py_rng.uniform(0.1, 0.5)})
+                for _ in chunk]
+            scores_db.executemany(
+                'UPDATE scores SET scores=?, extra_values=?, to_run=0 '
+                'WHERE `index`=?', zip(scores, extra_values, chunk))
+            scores_db.commit()
+    scores_db.close()
@@ -24,15 +24,29 @@ import os
 import argparse
 import multiprocessing
 import csv
+import collections
 
 
 from bluepymm import tools, prepare_combos
 
+from . import hoc_archive
+
+
+# The .hoc code of an e-model is created once with these placeholders, which
+# are replaced by the template name and morphology of every combo
+TEMPLATE_NAME_PLACEHOLDER = 'BluePyMMTemplateNamePlaceholder'
+MORPHOLOGY_PLACEHOLDER = 'BluePyMMMorphologyPlaceholder'
+
+# Default maximal number of combos of which one process creates .hoc files
+CHUNK_SIZE = 1000
+
 
 def get_parser():
     """Return the argument parser"""
     parser = argparse.ArgumentParser(description='Create legacy .hoc files')
     parser.add_argument('conf_filename')
+    parser.add_argument('--n_processes', help='number of processes',
+                        type=int)
 
     return parser
 
@@ -72,27 +86,64 @@ def load_combinations_dict(mecombo_emodel_path):
     return combinations_dict
 
 
-def run_create_and_write_hoc_file(emodel, setup_dir, hoc_dir, emodel_params,
-                                  template, morph_path,
-                                  model_name):
-    """Run create_and_write_hoc_file in isolated environment.
+def create_emodel_hoc_files(args):
+    """Create the .hoc files of combinations of one e-model.
+
+    The .hoc code of the e-model is created once, and only the template name
+    and morphology are replaced for every combination.
 
     Args:
-        See create_and_write_hoc_file.
+        args: tuple with the e-model name, its setup directory, the directory
+            of the .hoc files, the e-model parameters, the template and a list
+            of (combination name, morphology path)-tuples. If the directory
+            is None, the .hoc code is returned instead of written.
+
+    Returns:
+        number of .hoc files written, or a list of (combination name, .hoc
+        code)-tuples if the directory is None
     """
-    pool = multiprocessing.pool.Pool(1, maxtasksperchild=1)
-    pool.apply(prepare_combos.prepare_emodel_dirs.create_and_write_hoc_file,
-               (emodel, setup_dir, hoc_dir, emodel_params, template,
-                morph_path, model_name))
-    pool.terminate()
-    pool.join()
-    del pool
+    emodel, setup_dir, hoc_dir, emodel_params, template, combos = args
+
+    cell_model, hoc = prepare_combos.prepare_emodel_dirs.create_hoc(
+        emodel, setup_dir, emodel_params, template,
+        morph_path=MORPHOLOGY_PLACEHOLDER,
+        model_name=TEMPLATE_NAME_PLACEHOLDER)
+
+    combo_hocs = []
+    for combination, morph_path in combos:
+        # same check as for the e-model name
+        cell_model.name = combination
+        cell_model.check_name()
+
+        combo_hoc = hoc.replace(TEMPLATE_NAME_PLACEHOLDER, combination)
+        combo_hoc = combo_hoc.replace(MORPHOLOGY_PLACEHOLDER,
+                                      os.path.basename(morph_path))
+        if hoc_dir is None:
+            combo_hocs.append((combination, combo_hoc))
+        else:
+            hoc_path = os.path.join(hoc_dir,
+                                    hoc_archive.hoc_filename(combination))
+            with open(hoc_path, 'w') as hoc_file:
+                hoc_file.write(combo_hoc)
+
+    if hoc_dir is None:
+        return combo_hocs
+    return len(combos)
 
 
 def create_hoc_files(combinations_dict, emodels_dir, final_dict, template,
-                     hoc_dir):
+                     hoc_dir, n_processes=None, chunk_size=CHUNK_SIZE,
+                     hoc_archive_path=None):
     """Create a .hoc file for every combination in a given database.
 
+    The combinations are grouped by e-model, and the groups are split in
+    chunks of at most chunk_size combinations. Every chunk is processed in a
+    fresh process, which loads the setup of its e-model once.
+
+    If hoc_archive_path is given, the .hoc files are packed in a single
+    archive instead, see hoc_archive. The processes return the .hoc code of
+    their chunk, which is added to the archive by the main process.
+
     Args:
         combinations_dict: Dictionary with e-model - morphology combinations.
         emodels_dir: Directory containing all e-model data as used by the
@@ -100,21 +151,55 @@ def create_hoc_files(combinations_dict, emodels_dir, final_dict, template,
         final_dict: Dictionary with e-model parameters.
         template: Template to be used to create .hoc files.
         hoc_dir: Directory where all create .hoc files will be written.
+                 Ignored if hoc_archive_path is not None.
+        n_processes: integer number of processes, `None` will use all of them
+        chunk_size: maximal number of combinations per process
+        hoc_archive_path: path of the archive to which the .hoc files will be
+                          written, None to write separate files
     """
+    emodel_combos = collections.OrderedDict()
     for combination, comb_data in combinations_dict.items():
-        print('Working on combination {}'.format(combination))
-        emodel = comb_data['emodel']
-        setup_dir = os.path.join(emodels_dir, emodel)
         morph_path = '{}.asc'.format(comb_data['morph_name'])
-        emodel_params = final_dict[emodel]['params']
+        emodel_combos.setdefault(comb_data['emodel'], []).append(
+            (combination, morph_path))
 
-        run_create_and_write_hoc_file(emodel,
-                                      setup_dir,
-                                      hoc_dir,
-                                      emodel_params,
-                                      template,
-                                      morph_path,
-                                      combination)
+    if hoc_archive_path is not None:
+        hoc_dir = None
+
+    arg_list = []
+    for emodel, combos in emodel_combos.items():
+        setup_dir = os.path.join(emodels_dir, emodel)
+        emodel_params = final_dict[emodel]['params']
+        for start in range(0, len(combos), chunk_size):
+            arg_list.append((emodel, setup_dir, hoc_dir, emodel_params,
+                             template, combos[start:start + chunk_size]))
+
+    print('Creating .hoc files of %d combinations of %d e-models' %
+          (len(combinations_dict), len(emodel_combos)))
+    # every chunk runs in a new process, since the setup modules of different
+    # e-models share the same name
+    pool = multiprocessing.pool.Pool(processes=n_processes,
+                                     maxtasksperchild=1)
+    writer = None
+    if hoc_archive_path is not None:
+        writer = hoc_archive.HocArchiveWriter(hoc_archive_path)
+    try:
+        n_done = 0
+        for result in pool.imap_unordered(create_emodel_hoc_files,
+                                          arg_list, chunksize=1):
+            if writer is None:
+                n_done += result
+            else:
+                for combination, hoc in result:
+                    writer.add(combination, hoc)
+                n_done += len(result)
+            print('Created %d/%d .hoc files' %
+                  (n_done, len(combinations_dict)))
+    finally:
+        pool.terminate()
+        pool.join()
+        if writer is not None:
+            writer.close()
 
 
 def main(arg_list):
@@ -132,12 +217,22 @@ def main(arg_list):
     final_dict = tools.load_json(config['final_json_path'])
     emodels_dir = config['emodels_tmp_dir']
 
-    # create output directory for .hoc files
-    tools.makedirs(config['hoc_output_dir'])
+    # the .hoc files are packed in an archive, or written to a directory
+    hoc_archive_path = config.get('hoc_output_archive')
+    hoc_output_dir = None
+    if hoc_archive_path is None:
+        hoc_output_dir = config['hoc_output_dir']
+        tools.makedirs(hoc_output_dir)
+    else:
+        tools.makedirs(os.path.dirname(os.path.abspath(hoc_archive_path)))
 
     # create hoc files
     create_hoc_files(combinations_dict, emodels_dir, final_dict,
-                     config['template'], config['hoc_output_dir'])
+                     config['template'], hoc_output_dir,
+                     n_processes=args.n_processes,
+                     hoc_archive_path=hoc_archive_path)
+    if hoc_archive_path is not None:
+        print('Wrote .hoc files to %s' % hoc_archive_path)
 
 
 if __name__ == '__main__':
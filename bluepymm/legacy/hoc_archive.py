@@ -0,0 +1,188 @@
+"""Archive of .hoc files"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""Writing millions of small .hoc files is slow on parallel filesystems. The
+.hoc files can instead be packed in a single zip archive, of which the central
+directory maps every file name to the offset of its data: HocArchive reads a
+single .hoc file without reading the rest of the archive, and extract writes
+them out as separate files again.
+
+Usage:
+    python -m bluepymm.legacy.hoc_archive <archive> <output_dir> [names ...]
+"""
+
+# pylint: disable=C0325
+
+import os
+import sys
+import argparse
+import zipfile
+
+from bluepymm import tools
+
+
+HOC_EXTENSION = '.hoc'
+
+
+def hoc_filename(model_name):
+    """Name of the .hoc file of a model in the archive"""
+    return '{}{}'.format(model_name, HOC_EXTENSION)
+
+
+class HocArchiveWriter(object):
+
+    """Write .hoc files to a zip archive"""
+
+    def __init__(self, archive_path, compression=zipfile.ZIP_DEFLATED):
+        """Constructor
+
+        Args:
+            archive_path: path of the archive, overwritten if it exists
+            compression: compression method of the zipfile module
+        """
+        self.archive_path = archive_path
+        self.archive = zipfile.ZipFile(archive_path, 'w',
+                                       compression=compression,
+                                       allowZip64=True)
+        self.n_files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, model_name, hoc):
+        """Add the .hoc code of a model"""
+        self.archive.writestr(hoc_filename(model_name), hoc)
+        self.n_files += 1
+
+    def add_file(self, hoc_path):
+        """Add a .hoc file, named after its basename"""
+        self.archive.write(hoc_path, os.path.basename(hoc_path))
+        self.n_files += 1
+
+    def close(self):
+        """Write the central directory and close the archive"""
+        self.archive.close()
+
+
+class HocArchive(object):
+
+    """Reader of a zip archive of .hoc files"""
+
+    def __init__(self, archive_path):
+        """Constructor
+
+        Args:
+            archive_path: path of the archive written by HocArchiveWriter
+        """
+        self.archive = zipfile.ZipFile(archive_path, 'r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the archive"""
+        self.archive.close()
+
+    def __len__(self):
+        return len(self.archive.infolist())
+
+    def __contains__(self, model_name):
+        return hoc_filename(model_name) in self.archive.NameToInfo
+
+    def model_names(self):
+        """Names of the models in the archive, in order of addition"""
+        return [name[:-len(HOC_EXTENSION)]
+                for name in self.archive.namelist()]
+
+    def read(self, model_name):
+        """Read the .hoc code of a model.
+
+        Raises:
+            KeyError: if the model isn't in the archive
+        """
+        return self.archive.read(hoc_filename(model_name)).decode('utf-8')
+
+
+def pack_hoc_dir(hoc_dir, archive_path):
+    """Pack all .hoc files of a directory in an archive.
+
+    Returns:
+        number of packed .hoc files
+    """
+    with HocArchiveWriter(archive_path) as writer:
+        for filename in sorted(os.listdir(hoc_dir)):
+            if filename.endswith(HOC_EXTENSION):
+                writer.add_file(os.path.join(hoc_dir, filename))
+        return writer.n_files
+
+
+def extract(archive_path, output_dir, model_names=None):
+    """Write the .hoc files of an archive to a directory.
+
+    Args:
+        archive_path: path of the archive
+        output_dir: directory to which the .hoc files are written, created if
+            it doesn't exist
+        model_names: names of the models to extract, None for all of them
+
+    Returns:
+        list of paths of the written .hoc files
+    """
+    tools.makedirs(output_dir)
+    hoc_paths = []
+    with HocArchive(archive_path) as archive:
+        if model_names is None:
+            model_names = archive.model_names()
+        for model_name in model_names:
+            hoc_path = os.path.join(output_dir, hoc_filename(model_name))
+            with open(hoc_path, 'w') as hoc_file:
+                hoc_file.write(archive.read(model_name))
+            hoc_paths.append(hoc_path)
+    return hoc_paths
+
+
+def get_parser():
+    """Return the argument parser"""
+    parser = argparse.ArgumentParser(
+        description='Extract .hoc files from an archive')
+    parser.add_argument('archive_path')
+    parser.add_argument('output_dir')
+    parser.add_argument('model_names', nargs='*',
+                        help='models to extract, all of them by default')
+    return parser
+
+
+def main(arg_list):
+    """Main"""
+    args = get_parser().parse_args(arg_list)
+    hoc_paths = extract(args.archive_path, args.output_dir,
+                        model_names=args.model_names or None)
+    print('Extracted %d .hoc files to %s' % (len(hoc_paths), args.output_dir))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
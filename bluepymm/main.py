@@ -25,6 +25,7 @@ import sys
 import argparse
 
 from bluepymm import prepare_combos, run_combos, select_combos, validate_output
+from bluepymm import profiling
 
 
 def get_parser():
@@ -34,9 +35,14 @@ def get_parser():
 
     prepare_combos.add_parser(actions)
     run_combos.add_parser(actions)
+    run_combos.add_merge_parser(actions)
+    run_combos.add_stats_parser(actions)
     select_combos.add_parser(actions)
     validate_output.add_parser(actions)
 
+    for action in ['prepare', 'run', 'select', 'validate']:
+        profiling.add_arguments(actions.choices[action])
+
     return parser
 
 
@@ -49,20 +55,35 @@ def run(arg_list):
 
     args = get_parser().parse_args(arg_list)
 
-    if args.action == "prepare":
-        prepare_combos.prepare_combos(conf_filename=args.conf_filename,
-                                      continu=args.continu,
-                                      n_processes=args.n_processes)
-    elif args.action == "run":
-        run_combos.run_combos(conf_filename=args.conf_filename,
-                              ipyp=args.ipyp,
-                              ipyp_profile=args.ipyp_profile,
-                              n_processes=args.n_processes)
-    elif args.action == "select":
-        select_combos.select_combos(conf_filename=args.conf_filename,
-                                    n_processes=args.n_processes)
-    elif args.action == "validate":
-        validate_output.validate_output(conf_filename=args.conf_filename)
+    with profiling.profile_from_args(args):
+        if args.action == "prepare":
+            prepare_combos.prepare_combos(conf_filename=args.conf_filename,
+                                          continu=args.continu,
+                                          n_processes=args.n_processes)
+        elif args.action == "run":
+            run_combos.run_combos(conf_filename=args.conf_filename,
+                                  ipyp=args.ipyp,
+                                  ipyp_profile=args.ipyp_profile,
+                                  n_processes=args.n_processes,
+                                  shard=args.shard,
+                                  claim=args.claim,
+                                  batch_size=args.batch_size,
+                                  lease_time=args.lease_time,
+                                  combo_timeout=args.combo_timeout,
+                                  combo_max_rss=args.combo_max_rss,
+                                  early_stop_select_config=args.early_stop,
+                                  status_file=args.status_file)
+        elif args.action == "merge":
+            run_combos.merge_combos(conf_filename=args.conf_filename)
+        elif args.action == "stats":
+            run_combos.stats_combos(conf_filename=args.conf_filename,
+                                    n_top=args.n_top)
+        elif args.action == "select":
+            select_combos.select_combos(conf_filename=args.conf_filename,
+                                        n_processes=args.n_processes,
+                                        sweep_only=args.sweep_only)
+        elif args.action == "validate":
+            validate_output.validate_output(conf_filename=args.conf_filename)
 
 
 def main():
@@ -27,11 +27,12 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import os
 import json
+import uuid
 
 import pandas
 import sqlite3
 
-from bluepymm import tools
+from bluepymm import tools, profiling
 from . import parse_files
 
 
@@ -204,6 +205,28 @@ def remove_morph_regex_failures(full_map):
     return full_map.reset_index(drop=True)
 
 
+def write_scores_db(full_map, output_filename):
+    """Write the scores table to the sqlite database.
+
+    The claims of batches of a previous run refer to the rows of the old
+    scores table, so they are removed. A new creation id is stored in the
+    table 'scores_info', shard databases of a previous run are recognised by
+    their different id.
+
+    Args:
+        full_map: pandas DataFrame with the e-model morphology combinations
+        output_filename: path to .sqlite database
+    """
+    with sqlite3.connect(output_filename) as conn:
+        full_map.to_sql('scores', conn, if_exists='replace')
+        conn.execute('DROP TABLE IF EXISTS claims')
+        conn.execute('DROP TABLE IF EXISTS scores_info')
+        conn.execute('CREATE TABLE scores_info (key TEXT PRIMARY KEY, '
+                     'value TEXT)')
+        conn.execute("INSERT INTO scores_info VALUES ('creation_id', ?)",
+                     (uuid.uuid4().hex,))
+
+
 def create_mm_sqlite_circuitmvd3(
         output_filename,
         circuitmvd3_path,
@@ -233,14 +256,16 @@ def create_mm_sqlite_circuitmvd3(
     print(
         'Reading repaired-morphologies neuronDB at %s' %
         rep_neurondb_filename)
-    rep_fullmtype_morph_map = parse_files.read_mtype_morph_map(
-        rep_neurondb_filename)
+    with profiling.stage('read repaired neuronDB'):
+        rep_fullmtype_morph_map = parse_files.read_mtype_morph_map(
+            rep_neurondb_filename)
     tools.check_no_null_nan_values(rep_fullmtype_morph_map,
                                    "the full m-type morphology map")
 
     # Contains layer, fullmtype, etype, morph_name
-    morph_fullmtype_etype_map = parse_files.read_circuitmvd3(
-        circuitmvd3_path)
+    with profiling.stage('read circuit.mvd3'):
+        morph_fullmtype_etype_map = parse_files.read_circuitmvd3(
+            circuitmvd3_path)
 
     tools.check_no_null_nan_values(morph_fullmtype_etype_map,
                                    "morph_fullmtype_etype_map")
@@ -250,16 +275,18 @@ def create_mm_sqlite_circuitmvd3(
 
     print('Creating emodel etype table')
     # Contains layer, fullmtype, etype, emodel, morph_regex, original_emodel
-    emodel_fullmtype_etype_map = parse_files.convert_emodel_etype_map(
-        original_emodel_etype_map, fullmtypes, etypes)
+    with profiling.stage('convert e-model e-type map'):
+        emodel_fullmtype_etype_map = parse_files.convert_emodel_etype_map(
+            original_emodel_etype_map, fullmtypes, etypes)
     tools.check_no_null_nan_values(emodel_fullmtype_etype_map,
                                    "e-model e-type map")
 
     print('Creating full table by merging subtables')
     # Contains layer, fullmtype, etype, morph_name, e_model, morph_regex
-    full_map = morph_fullmtype_etype_map.merge(
-        emodel_fullmtype_etype_map,
-        on=['layer', 'etype', 'fullmtype'], how='left')
+    with profiling.stage('merge e-models'):
+        full_map = morph_fullmtype_etype_map.merge(
+            emodel_fullmtype_etype_map,
+            on=['layer', 'etype', 'fullmtype'], how='left')
 
     null_emodel_rows = full_map[pandas.isnull(full_map['emodel'])]
 
@@ -273,7 +300,8 @@ def create_mm_sqlite_circuitmvd3(
 
     print('Filtering out morp_names that dont match regex')
     # Contains layer, fullmtype, etype, morph_name, e_model
-    full_map = remove_morph_regex_failures(full_map)
+    with profiling.stage('morphology regex filtering'):
+        full_map = remove_morph_regex_failures(full_map)
     tools.check_no_null_nan_values(full_map, "the full map")
 
     print('Adding exemplar rows')
@@ -288,15 +316,16 @@ def create_mm_sqlite_circuitmvd3(
     full_map.insert(len(full_map.columns), 'exception', None)
     full_map.insert(len(full_map.columns), 'to_run', True)
 
-    exemplar_rows = create_exemplar_rows(
-        final_dict,
-        rep_fullmtype_morph_map,
-        original_emodel_etype_map,
-        emodels,
-        emodel_dirs,
-        rep_morph_dir,
-        unrep_morph_dir,
-        skip_repaired_exemplar=skip_repaired_exemplar)
+    with profiling.stage('create exemplar rows'):
+        exemplar_rows = create_exemplar_rows(
+            final_dict,
+            rep_fullmtype_morph_map,
+            original_emodel_etype_map,
+            emodels,
+            emodel_dirs,
+            rep_morph_dir,
+            unrep_morph_dir,
+            skip_repaired_exemplar=skip_repaired_exemplar)
 
     # Prepend exemplar rows to full_map
     full_map = pandas.concat(
@@ -305,8 +334,8 @@ def create_mm_sqlite_circuitmvd3(
         sort=True)
 
     # Write full table to sqlite database
-    with sqlite3.connect(output_filename) as conn:
-        full_map.to_sql('scores', conn, if_exists='replace')
+    with profiling.stage('write database'):
+        write_scores_db(full_map, output_filename)
 
     print('Created sqlite db at %s' % output_filename)
 
@@ -339,13 +368,16 @@ def create_mm_sqlite(
 
     # Contains layer, fullmtype, etype
     print('Reading recipe at %s' % recipe_filename)
-    fullmtype_etype_map = parse_files.read_mm_recipe(recipe_filename)
+    with profiling.stage('read recipe'):
+        fullmtype_etype_map = parse_files.read_mm_recipe(recipe_filename)
     tools.check_no_null_nan_values(fullmtype_etype_map,
                                    "the full m-type e-type map")
 
     # Contains layer, fullmtype, mtype, submtype, morph_name
     print('Reading neuronDB at %s' % neurondb_filename)
-    fullmtype_morph_map = parse_files.read_mtype_morph_map(neurondb_filename)
+    with profiling.stage('read neuronDB'):
+        fullmtype_morph_map = parse_files.read_mtype_morph_map(
+            neurondb_filename)
     tools.check_no_null_nan_values(fullmtype_morph_map,
                                    "the full m-type morphology map")
 
@@ -353,15 +385,17 @@ def create_mm_sqlite(
     print(
         'Reading repaired-morphologies neuronDB at %s' %
         rep_neurondb_filename)
-    rep_fullmtype_morph_map = parse_files.read_mtype_morph_map(
-        rep_neurondb_filename)
+    with profiling.stage('read repaired neuronDB'):
+        rep_fullmtype_morph_map = parse_files.read_mtype_morph_map(
+            rep_neurondb_filename)
     tools.check_no_null_nan_values(rep_fullmtype_morph_map,
                                    "the full m-type morphology map")
 
     # Contains layer, fullmtype, etype, morph_name
     print('Merging recipe and neuronDB tables')
-    morph_fullmtype_etype_map = fullmtype_morph_map.merge(
-        fullmtype_etype_map, on=['fullmtype', 'layer'], how='left')
+    with profiling.stage('merge recipe and neuronDB'):
+        morph_fullmtype_etype_map = fullmtype_morph_map.merge(
+            fullmtype_etype_map, on=['fullmtype', 'layer'], how='left')
     tools.check_no_null_nan_values(morph_fullmtype_etype_map,
                                    "morph_fullmtype_etype_map")
 
@@ -370,16 +404,18 @@ def create_mm_sqlite(
 
     print('Creating emodel etype table')
     # Contains layer, fullmtype, etype, emodel, morph_regex, original_emodel
-    emodel_fullmtype_etype_map = parse_files.convert_emodel_etype_map(
-        original_emodel_etype_map, fullmtypes, etypes)
+    with profiling.stage('convert e-model e-type map'):
+        emodel_fullmtype_etype_map = parse_files.convert_emodel_etype_map(
+            original_emodel_etype_map, fullmtypes, etypes)
     tools.check_no_null_nan_values(emodel_fullmtype_etype_map,
                                    "e-model e-type map")
 
     print('Creating full table by merging subtables')
     # Contains layer, fullmtype, etype, morph_name, e_model, morph_regex
-    full_map = morph_fullmtype_etype_map.merge(
-        emodel_fullmtype_etype_map,
-        on=['layer', 'etype', 'fullmtype'], how='left')
+    with profiling.stage('merge e-models'):
+        full_map = morph_fullmtype_etype_map.merge(
+            emodel_fullmtype_etype_map,
+            on=['layer', 'etype', 'fullmtype'], how='left')
 
     null_emodel_rows = full_map[pandas.isnull(full_map['emodel'])]
 
@@ -393,7 +429,8 @@ def create_mm_sqlite(
 
     print('Filtering out morp_names that dont match regex')
     # Contains layer, fullmtype, etype, morph_name, e_model
-    full_map = remove_morph_regex_failures(full_map)
+    with profiling.stage('morphology regex filtering'):
+        full_map = remove_morph_regex_failures(full_map)
     tools.check_no_null_nan_values(full_map, "the full map")
 
     print('Adding exemplar rows')
@@ -408,15 +445,16 @@ def create_mm_sqlite(
     full_map.insert(len(full_map.columns), 'exception', None)
     full_map.insert(len(full_map.columns), 'to_run', True)
 
-    exemplar_rows = create_exemplar_rows(
-        final_dict,
-        rep_fullmtype_morph_map,
-        original_emodel_etype_map,
-        emodels,
-        emodel_dirs,
-        rep_morph_dir,
-        unrep_morph_dir,
-        skip_repaired_exemplar=skip_repaired_exemplar)
+    with profiling.stage('create exemplar rows'):
+        exemplar_rows = create_exemplar_rows(
+            final_dict,
+            rep_fullmtype_morph_map,
+            original_emodel_etype_map,
+            emodels,
+            emodel_dirs,
+            rep_morph_dir,
+            unrep_morph_dir,
+            skip_repaired_exemplar=skip_repaired_exemplar)
 
     # Prepend exemplar rows to full_map
     full_map = pandas.concat(
@@ -424,7 +462,7 @@ def create_mm_sqlite(
         ignore_index=True, sort=False)
 
     # Write full table to sqlite database
-    with sqlite3.connect(output_filename) as conn:
-        full_map.to_sql('scores', conn, if_exists='replace')
+    with profiling.stage('write database'):
+        write_scores_db(full_map, output_filename)
 
     print('Created sqlite db at %s' % output_filename)
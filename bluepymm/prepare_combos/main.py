@@ -24,7 +24,7 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import os
 
-from bluepymm import tools
+from bluepymm import tools, profiling
 from . import prepare_emodel_dirs as prepare_dirs
 from . import create_mm_sqlite
 
@@ -37,9 +37,10 @@ def prepare_emodels(conf_dict, continu, scores_db_path, n_processes):
 
     # Convert e-models input to BluePyMM file structure
     emodels_in_repo = prepare_dirs.check_emodels_in_repo(conf_dict)
-    tmp_emodels_dir = prepare_dirs.convert_emodel_input(emodels_in_repo,
-                                                        conf_dict,
-                                                        continu)
+    with profiling.stage('convert e-model input'):
+        tmp_emodels_dir = prepare_dirs.convert_emodel_input(emodels_in_repo,
+                                                            conf_dict,
+                                                            continu)
 
     # Get information from emodels repo
     print('Getting final emodels dict')
@@ -58,10 +59,11 @@ def prepare_emodels(conf_dict, continu, scores_db_path, n_processes):
     print('Preparing emodels in %s' % emodels_dir)
     emodels_hoc_dir = os.path.abspath(conf_dict['emodels_hoc_dir'])
     # Clone the emodels repo and prepare the dirs for all the emodels
-    emodel_dirs = prepare_dirs.prepare_emodel_dirs(
-        final_dict, emodel_etype_map, emodels_dir, opt_dir, emodels_hoc_dir,
-        emodels_in_repo, hoc_template, continu=continu,
-        n_processes=n_processes)
+    with profiling.stage('prepare e-model dirs'):
+        emodel_dirs = prepare_dirs.prepare_emodel_dirs(
+            final_dict, emodel_etype_map, emodels_dir, opt_dir,
+            emodels_hoc_dir, emodels_in_repo, hoc_template, continu=continu,
+            n_processes=n_processes)
 
     if not continu:
         print('Creating sqlite db at %s' % scores_db_path)
@@ -78,30 +80,32 @@ def prepare_emodels(conf_dict, continu, scores_db_path, n_processes):
                                  'and circuitmvd3_path in config file')
             circuitmvd3_path = conf_dict['circuitmvd3_path']
 
-            create_mm_sqlite.create_mm_sqlite_circuitmvd3(
-                scores_db_path,
-                circuitmvd3_path,
-                morph_dir,
-                rep_morph_dir,
-                unrep_morph_dir,
-                emodel_etype_map,
-                final_dict,
-                emodel_dirs,
-                skip_repaired_exemplar=skip_repaired_exemplar)
+            with profiling.stage('create database'):
+                create_mm_sqlite.create_mm_sqlite_circuitmvd3(
+                    scores_db_path,
+                    circuitmvd3_path,
+                    morph_dir,
+                    rep_morph_dir,
+                    unrep_morph_dir,
+                    emodel_etype_map,
+                    final_dict,
+                    emodel_dirs,
+                    skip_repaired_exemplar=skip_repaired_exemplar)
         else:
             recipe_filename = conf_dict['recipe_path']
 
             # Create a sqlite3 db with all the combos
-            create_mm_sqlite.create_mm_sqlite(
-                scores_db_path,
-                recipe_filename,
-                morph_dir,
-                rep_morph_dir,
-                unrep_morph_dir,
-                emodel_etype_map,
-                final_dict,
-                emodel_dirs,
-                skip_repaired_exemplar=skip_repaired_exemplar)
+            with profiling.stage('create database'):
+                create_mm_sqlite.create_mm_sqlite(
+                    scores_db_path,
+                    recipe_filename,
+                    morph_dir,
+                    rep_morph_dir,
+                    unrep_morph_dir,
+                    emodel_etype_map,
+                    final_dict,
+                    emodel_dirs,
+                    skip_repaired_exemplar=skip_repaired_exemplar)
 
     return final_dict, emodel_dirs
 
@@ -30,7 +30,7 @@ import traceback
 import multiprocessing
 import tarfile
 
-from bluepymm import tools
+from bluepymm import tools, profiling
 
 
 def check_emodels_in_repo(conf_dict):
@@ -121,25 +121,16 @@ def get_emodel_dicts(emodels_dir, final_json_path, emodel_etype_map_path):
     return final_dict, emodel_etype_map, dict_dir
 
 
-def create_and_write_hoc_file(emodel, emodel_dir, hoc_dir, emodel_params,
-                              template, morph_path=None,
-                              model_name=None):
+def create_hoc(emodel, emodel_dir, emodel_params, template, morph_path=None,
+               model_name=None):
     """Create .hoc code for a given e-model based on code from
-    '<emodel_dir>/setup', e-model parameters and a given template, and write
-    out the result to a file named <hoc_dir>/<model_name or emodel>.hoc.
+    '<emodel_dir>/setup', e-model parameters and a given template.
 
     Args:
-        emodel: e-model name
-        emodel_dir: the directory containing a module 'setup', which describes
-                    the e-model
-        hoc_dir: the directory to which the resulting .hoc file will be written
-                 out.
-        emodel_params: a dict with e-model parameters
-        template: template file used for the creation of the .hoc file
-        morph_path: path to morphology file, used to overwrite the original
-                    morphology of an e-model. Default is None.
-        model_name: used to name the .hoc file. If None, the e-model name is
-                    used. Default is None.
+        see create_and_write_hoc_file
+
+    Returns:
+        tuple with the cell model of the e-model and the .hoc code
     """
     setup = tools.load_module(
         'setup', os.path.join(emodel_dir, 'setup/__init__.py')
@@ -174,8 +165,34 @@ def create_and_write_hoc_file(emodel, emodel_dir, hoc_dir, emodel_params,
     hoc = evaluator.cell_model.create_hoc(emodel_params, template=template,
                                           template_dir=template_dir)
 
+    return evaluator.cell_model, hoc
+
+
+def create_and_write_hoc_file(emodel, emodel_dir, hoc_dir, emodel_params,
+                              template, morph_path=None,
+                              model_name=None):
+    """Create .hoc code for a given e-model based on code from
+    '<emodel_dir>/setup', e-model parameters and a given template, and write
+    out the result to a file named <hoc_dir>/<model_name or emodel>.hoc.
+
+    Args:
+        emodel: e-model name
+        emodel_dir: the directory containing a module 'setup', which describes
+                    the e-model
+        hoc_dir: the directory to which the resulting .hoc file will be written
+                 out.
+        emodel_params: a dict with e-model parameters
+        template: template file used for the creation of the .hoc file
+        morph_path: path to morphology file, used to overwrite the original
+                    morphology of an e-model. Default is None.
+        model_name: used to name the .hoc file. If None, the e-model name is
+                    used. Default is None.
+    """
+    _, hoc = create_hoc(emodel, emodel_dir, emodel_params, template,
+                        morph_path=morph_path, model_name=model_name)
+
     # write out result
-    hoc_file_name = '{}.hoc'.format(template_name)
+    hoc_file_name = '{}.hoc'.format(model_name or emodel)
     emodel_hoc_path = os.path.join(hoc_dir, hoc_file_name)
     with open(emodel_hoc_path, 'w') as emodel_hoc_file:
         emodel_hoc_file.write(hoc)
@@ -316,7 +333,8 @@ def prepare_emodel_dirs(
     else:
         print('Parallelising preparation of e-model directories')
         pool = multiprocessing.Pool(processes=n_processes,
-                                    maxtasksperchild=1)
+                                    maxtasksperchild=1,
+                                    initializer=profiling.init_worker)
         for emodel_dir_dict in pool.map(prepare_emodel_dir, arg_list,
                                         chunksize=1):
             emodel_dir_dicts.append(emodel_dir_dict)
@@ -0,0 +1,290 @@
+"""Per-stage profiling of the prepare, run and select steps"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""The steps wrap their stages in
+
+    with profiling.stage('name'):
+        ...
+
+which does nothing unless profiling was enabled with the --profile option.
+Stages can be nested. Every stage records its number of calls and its wall
+and CPU time, and optionally the peak memory allocated by Python (tracemalloc)
+and a cProfile of the outermost stages. Only the stages of the main process
+are recorded: work done in worker processes shows up as the time of the stage
+that waits for the workers. Worker pools call init_worker in their
+initializer, so forked workers don't inherit an enabled profiler.
+"""
+
+# pylint: disable=C0325
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+import collections
+
+
+PROFILE_OPTIONS = ['cprofile', 'tracemalloc']
+
+
+class StageProfiler(object):
+
+    """Record the resources used by nested stages"""
+
+    def __init__(self, use_cprofile=False, use_tracemalloc=False,
+                 output_dir=None, n_functions=15):
+        """Constructor
+
+        Args:
+            use_cprofile: profile the outermost stages with cProfile
+            use_tracemalloc: record the peak memory allocated by Python in
+                every stage
+            output_dir: if not None, the report and the cProfile statistics
+                of every outermost stage (<stage>.prof) are written to this
+                directory
+            n_functions: number of functions listed per outermost stage in
+                the cProfile part of the report
+        """
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+        self.output_dir = output_dir
+        self.n_functions = n_functions
+
+        # maps tuples with the names of a stage and its parents to dicts with
+        # keys 'calls', 'wall_time', 'cpu_time' and 'peak_mb'
+        self.stages = collections.OrderedDict()
+        self.cprofile_stats = collections.OrderedDict()
+        self._stack = []
+        self._profile = None
+
+    def start(self):
+        """Start recording"""
+        if self.use_tracemalloc:
+            tracemalloc.start()
+
+    def stop(self):
+        """Stop recording"""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile = None
+        if self.use_tracemalloc:
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the resources used by the body of a with statement"""
+        path = tuple(entry['name'] for entry in self._stack) + (name,)
+        record = self.stages.setdefault(
+            path, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0,
+                   'peak_mb': None})
+
+        profile = None
+        if self.use_cprofile and not self._stack:
+            profile = cProfile.Profile()
+
+        if self.use_tracemalloc:
+            if self._stack:
+                self._stack[-1]['peak'] = max(
+                    self._stack[-1]['peak'],
+                    tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        entry = {'name': name, 'peak': 0}
+        self._stack.append(entry)
+        start_time = time.time()
+        start_cpu_time = time.process_time()
+        if profile is not None:
+            self._profile = profile
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profile = None
+            record['calls'] += 1
+            record['wall_time'] += time.time() - start_time
+            record['cpu_time'] += time.process_time() - start_cpu_time
+            self._stack.pop()
+
+            if self.use_tracemalloc:
+                peak = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = max(record['peak_mb'] or 0.0,
+                                        peak / 1024.0 ** 2)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'],
+                                                  peak)
+                tracemalloc.reset_peak()
+
+            if profile is not None:
+                if name in self.cprofile_stats:
+                    self.cprofile_stats[name].add(profile)
+                else:
+                    self.cprofile_stats[name] = pstats.Stats(profile)
+
+    def report(self):
+        """Return the per-stage breakdown as a string"""
+        lines = ['%-50s %8s %12s %12s %10s' % ('Stage', 'Calls', 'Wall (s)',
+                                               'CPU (s)', 'Peak (MB)')]
+        for path, record in self.stages.items():
+            lines.append('%-50s %8d %12.3f %12.3f %10s' % (
+                '  ' * (len(path) - 1) + path[-1], record['calls'],
+                record['wall_time'], record['cpu_time'],
+                '-' if record['peak_mb'] is None
+                else '%.1f' % record['peak_mb']))
+
+        for name, stats in self.cprofile_stats.items():
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(self.n_functions)
+            lines.append('\ncProfile of stage %s:' % name)
+            lines.append(stream.getvalue().strip('\n'))
+
+        return '\n'.join(lines)
+
+    def write(self):
+        """Write the report and the cProfile statistics to the output
+        directory"""
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, 'profile.txt'), 'w') as fd:
+            fd.write(self.report() + '\n')
+        for name, stats in self.cprofile_stats.items():
+            stats.dump_stats(os.path.join(
+                self.output_dir, '%s.prof' % name.replace(' ', '_')))
+
+
+# Profiler of the current process, None if profiling is disabled
+_profiler = None
+
+
+def enable(use_cprofile=False, use_tracemalloc=False, output_dir=None):
+    """Enable profiling of the stages in the current process.
+
+    Args:
+        see StageProfiler
+    """
+    global _profiler  # pylint: disable=W0603
+    _profiler = StageProfiler(use_cprofile=use_cprofile,
+                              use_tracemalloc=use_tracemalloc,
+                              output_dir=output_dir)
+    _profiler.start()
+
+
+def disable():
+    """Disable profiling, print the report and write it to the output
+    directory of the profiler, if any.
+
+    Returns:
+        The StageProfiler, or None if profiling wasn't enabled.
+    """
+    global _profiler  # pylint: disable=W0603
+    profiler = _profiler
+    _profiler = None
+    if profiler is not None:
+        profiler.stop()
+        print('\nProfile per stage:')
+        print(profiler.report())
+        if profiler.output_dir is not None:
+            profiler.write()
+            print('Wrote profile to %s' % profiler.output_dir)
+    return profiler
+
+
+def init_worker():
+    """Disable profiling in a worker process forked from a profiled process.
+
+    The stages inherited from the parent process are discarded, they are
+    reported by the parent.
+    """
+    global _profiler  # pylint: disable=W0603
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record the resources used by the body of a with statement as stage
+    `name`, if profiling is enabled"""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.stage(name):
+            yield
+
+
+def iter_stage(name, iterable):
+    """Iterate over an iterable, recording the time spent waiting for every
+    item as stage `name`, if profiling is enabled"""
+    if _profiler is None:
+        return iter(iterable)
+    return _iter_stage(name, iterable)
+
+
+def _iter_stage(name, iterable):
+    """Generator of iter_stage"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def add_arguments(parser):
+    """Add the profiling options to the parser of a step"""
+    parser.add_argument('--profile', nargs='*', choices=PROFILE_OPTIONS,
+                        metavar='OPTION',
+                        help='Print the time spent in every stage. Add '
+                        '"cprofile" to profile the functions of the '
+                        'outermost stages, and/or "tracemalloc" to record '
+                        'the peak memory allocated in every stage')
+    parser.add_argument('--profile_dir',
+                        help='Write the profile report and the cProfile '
+                        'statistics to this directory, implies --profile')
+
+
+@contextlib.contextmanager
+def profile_from_args(args):
+    """Enable profiling within a with statement if it was requested on the
+    command line, see add_arguments"""
+    if getattr(args, 'profile', None) is None and \
+            getattr(args, 'profile_dir', None) is None:
+        yield
+        return
+
+    options = args.profile or []
+    enable(use_cprofile='cprofile' in options,
+           use_tracemalloc='tracemalloc' in options,
+           output_dir=args.profile_dir)
+    try:
+        with stage(args.action):
+            yield
+    finally:
+        disable()
@@ -20,4 +20,6 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 """
 
 
-from .main import add_parser, run_combos  # NOQA
+from .main import (add_parser, add_merge_parser,  # NOQA
+                   run_combos, merge_combos)
+from .stats import add_parser as add_stats_parser, stats_combos  # NOQA
@@ -25,16 +25,111 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import sys
 import os
+import time
+import glob
 import json
+import functools
+import queue
+import multiprocessing
 import ipyparallel
 import sqlite3
 import traceback
+import uuid
 import pandas
 
-from bluepymm import tools
+from bluepymm import tools, profiling
+from . import claims
+from . import early_stop as early_stop_module
+from . import progress
+from . import synthetic
 
 
-def run_emodel_morph_isolated(input_args):
+class ComboLimitError(Exception):
+
+    """A combo was stopped because it exceeded its resource limits, or its
+    isolated process died"""
+
+    def __init__(self, message, exception_type, peak_rss_mb=None):
+        """Constructor
+
+        Args:
+            message: description of the failure
+            exception_type: 'timeout', 'oom' or 'crash'
+            peak_rss_mb: highest resident set size (in MB) observed
+        """
+        super(ComboLimitError, self).__init__(message)
+        self.exception_type = exception_type
+        self.peak_rss_mb = peak_rss_mb
+
+
+# Interval (in s) at which the isolated process of a combo is checked
+LIMIT_POLL_INTERVAL = 0.5
+
+# Time (in s) a finished isolated process is given to deliver its result
+CRASH_GRACE_TIME = 5
+
+
+def wait_isolated(pool, async_result, combo_timeout=None,
+                  combo_max_rss_mb=None):
+    """Wait for the result of a combo running in a single-process pool, while
+    enforcing the limits of the combo.
+
+    Args:
+        pool: pool with a single worker process
+        async_result: result of the combo submitted to the pool
+        combo_timeout: maximum wall-clock time (in s), None for no limit
+        combo_max_rss_mb: maximum resident set size (in MB) of the worker
+            process, None for no limit. Only enforced on platforms where the
+            RSS of another process can be read (see tools.get_rss_mb).
+
+    Returns:
+        The result of the combo.
+
+    Raises:
+        ComboLimitError if a limit was exceeded or the worker process died.
+        The caller should terminate the pool in that case.
+    """
+    worker = pool._pool[0]  # pylint: disable=W0212
+    start_time = time.time()
+    peak_rss_mb = None
+
+    while not async_result.ready():
+        async_result.wait(LIMIT_POLL_INTERVAL)
+        if async_result.ready():
+            break
+
+        if combo_max_rss_mb is not None:
+            rss_mb = tools.get_rss_mb(worker.pid)
+            if rss_mb is not None:
+                peak_rss_mb = max(rss_mb, peak_rss_mb or 0)
+                if rss_mb > combo_max_rss_mb:
+                    raise ComboLimitError(
+                        'Combo exceeded memory limit: RSS of %.1f MB is '
+                        'above %.1f MB' % (rss_mb, combo_max_rss_mb),
+                        'oom', peak_rss_mb)
+
+        elapsed = time.time() - start_time
+        if combo_timeout is not None and elapsed > combo_timeout:
+            raise ComboLimitError(
+                'Combo exceeded time limit: no result after %.1f s' %
+                combo_timeout, 'timeout', peak_rss_mb)
+
+        if not worker.is_alive():
+            # the worker exits after delivering its result, give the result
+            # some time to arrive before concluding that it crashed
+            async_result.wait(CRASH_GRACE_TIME)
+            if not async_result.ready():
+                raise ComboLimitError(
+                    'Combo crashed: isolated process exited with code %s '
+                    '(killed by the system because it ran out of memory?)' %
+                    worker.exitcode, 'crash', peak_rss_mb)
+
+    return async_result.get()
+
+
+def run_emodel_morph_isolated(input_args, combo_timeout=None,
+                              combo_max_rss_mb=None, early_stop=None,
+                              synthetic_evaluator=None):
     """Run e-model morphology combination in isolated environment.
 
     Args:
@@ -46,9 +141,32 @@ def run_emodel_morph_isolated(input_args):
         - morph_path: path to morphology
         - apical_point_isec: integer value of the apical point isection
         - extra_values_error: boolean to raise an exception upon a missing key
+        combo_timeout: maximum wall-clock time (in s) of the combo, None for
+            no limit
+        combo_max_rss_mb: maximum resident set size (in MB) of the isolated
+            process, None for no limit
+        early_stop: dict with keys 'gate' and 'protocol_costs' to stop the
+            protocols as soon as the combo fails its gate (see early_stop
+            module), None to run all the protocols
+        synthetic_evaluator: dict with the arguments of synthetic.create to
+            replace the e-model by a synthetic evaluator, or None
 
     Returns:
-        Dict with keys 'exception', 'extra_values', 'scores', 'uid'.
+        Dict with keys 'early_stop_reason', 'exception', 'exception_type',
+        'extra_values', 'scores', 'uid' and 'timings'. 'early_stop_reason'
+        describes why the protocols were stopped early, or is None if all the
+        protocols ran. 'exception_type' is None if the combo
+        ran successfully, 'timeout' or 'oom' if it exceeded its limits,
+        'crash' if the isolated process died and 'error' if an exception was
+        raised. 'timings' is a dict with keys:
+        - 'wall_time': wall-clock time (in s) spent on the combination
+        - 'cpu_time': CPU time (in s) of the isolated process
+        - 'peak_rss_mb': peak resident set size (in MB) of the isolated
+          process
+        - 'protocol_times': dict mapping protocol names to the wall-clock time
+          (in s) spent on them
+        - 'worker': identifier of the worker that ran the combination
+        The values that can't be measured because of an exception are None.
     """
 
     (
@@ -61,44 +179,251 @@ def run_emodel_morph_isolated(input_args):
         extra_values_error
     ) = input_args
 
-    return_dict = {'uid': uid, 'exception': None}
+    return_dict = {'uid': uid, 'exception': None, 'exception_type': None,
+                   'early_stop_reason': None}
+    timings = {'cpu_time': None, 'peak_rss_mb': None, 'protocol_times': None,
+               'worker': tools.get_worker_id()}
+    start_time = time.time()
     pool = tools.NestedPool(1, maxtasksperchild=1)
 
     try:
-        return_dict['scores'], return_dict['extra_values'] = pool.apply(
-            run_emodel_morph, (emodel,
-                               emodel_dir,
-                               emodel_params,
-                               morph_path,
-                               apical_point_isec,
-                               extra_values_error
-                               ))
+        async_result = pool.apply_async(
+            _run_emodel_morph_timed, (emodel,
+                                      emodel_dir,
+                                      emodel_params,
+                                      morph_path,
+                                      apical_point_isec,
+                                      extra_values_error
+                                      ),
+            {'early_stop': early_stop,
+             'synthetic_evaluator': synthetic_evaluator})
+        return_dict['scores'], return_dict['extra_values'], \
+            process_timings, return_dict['early_stop_reason'] = \
+            wait_isolated(pool, async_result, combo_timeout, combo_max_rss_mb)
+        timings.update(process_timings)
+    except ComboLimitError as e:
+        return_dict['scores'] = None
+        return_dict['extra_values'] = None
+        return_dict['exception'] = '%s: %s' % (e.exception_type, e)
+        return_dict['exception_type'] = e.exception_type
+        timings['peak_rss_mb'] = e.peak_rss_mb
     except Exception:
         return_dict['scores'] = None
         return_dict['extra_values'] = None
         return_dict['exception'] = "".join(traceback.format_exception(
                                            *sys.exc_info()))
+        return_dict['exception_type'] = 'error'
 
     pool.terminate()
     pool.join()
     del pool
 
+    timings['wall_time'] = time.time() - start_time
+    return_dict['timings'] = timings
+
     return return_dict
 
 
+def _run_emodel_morph_timed(*args, **kwargs):
+    """Run e-model morphology combination and measure the resources used by
+    the current process.
+
+    Args:
+        See run_emodel_morph.
+
+    Returns:
+        tuple:
+            - dict that maps features to scores
+            - dict with extra values: 'holding_current' and 'threshold_current'
+            - dict with keys 'cpu_time', 'peak_rss_mb' and 'protocol_times'
+            - reason of early stop, or None
+    """
+    protocol_times = {}
+    early_stop = kwargs.get('early_stop')
+    if early_stop is not None:
+        early_stop = dict(early_stop)
+    scores, extra_values = run_emodel_morph(
+        *args,
+        protocol_times=protocol_times,
+        early_stop=early_stop,
+        synthetic_evaluator=kwargs.get('synthetic_evaluator'))
+    process_timings = {'cpu_time': time.process_time(),
+                       'peak_rss_mb': tools.get_peak_rss_mb(),
+                       'protocol_times': protocol_times}
+    early_stop_reason = None if early_stop is None \
+        else early_stop.get('reason')
+
+    return scores, extra_values, process_timings, early_stop_reason
+
+
+# Context shared by all the tasks that run in this process, see
+# init_task_context
+_task_context = None
+
+
+def init_task_context(task_context):
+    """Store the task context in the current (worker) process.
+
+    Args:
+        task_context: dict created by create_task_context
+    """
+    global _task_context  # pylint: disable=W0603
+    _task_context = task_context
+    profiling.init_worker()
+
+
+def run_task(task):
+    """Run the e-model morphology combination described by a compact task in
+    isolated environment.
+
+    Args:
+        task: (uid, emodel_id, morph_id)-tuple, ids refer to the task context
+            set by init_task_context. If early stopping is enabled, a fourth
+            element contains the gate id (see early_stop module).
+
+    Returns:
+        See run_emodel_morph_isolated.
+    """
+    if _task_context is None:
+        raise Exception('run_task: task context was not initialised in this '
+                        'process')
+
+    early_stop = None
+    if len(task) > 3 and task[3] is not None:
+        early_stop = {
+            'gate': _task_context['early_stop']['gates'][task[3]],
+            'protocol_costs': _task_context['early_stop']['protocol_costs']}
+
+    return run_emodel_morph_isolated(
+        expand_task(_task_context, task),
+        combo_timeout=_task_context['combo_timeout'],
+        combo_max_rss_mb=_task_context['combo_max_rss_mb'],
+        early_stop=early_stop,
+        synthetic_evaluator=_task_context['synthetic_evaluator'])
+
+
 def read_apical_point(morph_dir, morph_name):
     """Read apical point from apical point json file"""
 
-    json_filename = os.path.join(morph_dir, 'apical_points_isec.json')
+    # Get apic_point isec from dict, if not found return None
+    return read_apical_points_index([morph_dir])[morph_dir].get(morph_name)
+
 
-    with open(json_filename) as json_file:
-        apic_points = json.load(json_file)
+def read_apical_points_index(morph_dirs):
+    """Read the apical point json files of a set of morphology directories.
 
-    # Get apic_point isec from dict, if not found return None
-    if morph_name in apic_points:
-        return int(apic_points[morph_name])
-    else:
-        return None
+    Every file is parsed only once, so that the resulting index can be used
+    to look up the apical points of all the combos in a database.
+
+    Args:
+        morph_dirs: iterable with morphology directories
+
+    Returns:
+        A dict mapping every morphology directory to a dict that maps
+        morphology names to the integer value of their apical point isection.
+
+    Raises:
+        IOError, if one of the directories doesn't contain an apical point
+        json file.
+    """
+    apical_points_index = {}
+    for morph_dir in morph_dirs:
+        if morph_dir in apical_points_index:
+            continue
+        json_filename = os.path.join(morph_dir, 'apical_points_isec.json')
+        apical_points_index[morph_dir] = {
+            morph_name: int(apical_point_isec)
+            for morph_name, apical_point_isec in
+            tools.load_json(json_filename).items()}
+
+    return apical_points_index
+
+
+def run_protocols(evaluator, emodel_params, protocol_times=None,
+                  protocol_names=None):
+    """Run the fitness protocols of an evaluator one by one.
+
+    Args:
+        evaluator: cell evaluator
+        emodel_params: dict that maps e-model parameters to their values
+        protocol_times: if not None, a dict that is filled with the wall-clock
+            time (in s) spent on every protocol
+        protocol_names: names of the protocols to run, in order. If None, all
+            the fitness protocols are run.
+
+    Returns:
+        dict with the responses of the protocols
+    """
+    if protocol_names is None:
+        protocol_names = list(evaluator.fitness_protocols.keys())
+
+    responses = {}
+    for protocol_name in protocol_names:
+        protocol = evaluator.fitness_protocols[protocol_name]
+        start_time = time.time()
+        responses.update(evaluator.run_protocols([protocol], emodel_params))
+        if protocol_times is not None:
+            protocol_times[protocol_name] = time.time() - start_time
+
+    return responses
+
+
+def evaluate_protocols(evaluator, emodel_params, protocol_times=None,
+                       early_stop=None):
+    """Run the fitness protocols of an evaluator and calculate the scores.
+
+    Args:
+        evaluator: cell evaluator
+        emodel_params: dict that maps e-model parameters to their values
+        protocol_times: if not None, a dict that is filled with the wall-clock
+            time (in s) spent on every protocol
+        early_stop: dict with keys 'gate' and 'protocol_costs'. If not None,
+            the protocols are run cheapest-first and the objectives are scored
+            as soon as their recordings are available. Once a score fails the
+            gate, the remaining protocols are skipped and the reason is stored
+            under the key 'reason'. The protocols should not depend on each
+            other.
+
+    Returns:
+        tuple:
+            - dict with the responses of the protocols that ran
+            - dict that maps features to scores, only contains the features
+              that could be scored if the protocols were stopped early
+    """
+    if early_stop is None:
+        responses = run_protocols(evaluator, emodel_params, protocol_times)
+        return responses, evaluator.fitness_calculator.calculate_scores(
+            responses)
+
+    early_stop['reason'] = None
+    protocol_names = early_stop_module.order_protocols(
+        evaluator.fitness_protocols.keys(), early_stop['protocol_costs'])
+    objectives = [
+        (objective, early_stop_module.get_objective_recordings(objective))
+        for objective in evaluator.fitness_calculator.objectives]
+
+    responses = {}
+    scores = {}
+    for protocol_name in protocol_names:
+        responses.update(run_protocols(evaluator, emodel_params,
+                                       protocol_times, [protocol_name]))
+
+        new_scores = {}
+        for objective, recordings in objectives:
+            if objective.name not in scores and recordings is not None and \
+                    recordings.issubset(responses):
+                new_scores[objective.name] = objective.calculate_score(
+                    responses)
+        scores.update(new_scores)
+
+        reason = early_stop_module.check_gate(early_stop['gate'], new_scores)
+        if reason is not None:
+            early_stop['reason'] = '%s after protocol %s' % (
+                reason, protocol_name)
+            return responses, scores
+
+    scores.update(evaluator.fitness_calculator.calculate_scores(responses))
+    return responses, scores
 
 
 def run_emodel_morph(
@@ -107,7 +432,10 @@ def run_emodel_morph(
         emodel_params,
         morph_path,
         apical_point_isec,
-        extra_values_error=True):
+        extra_values_error=True,
+        protocol_times=None,
+        early_stop=None,
+        synthetic_evaluator=None):
     """Run e-model morphology combination.
 
     Args:
@@ -117,6 +445,14 @@ def run_emodel_morph(
         morph_path: path to morphology
         apical_point_isec: integer value of the apical point isection
         extra_values_error: boolean to raise an exception upon a missing key
+        protocol_times: if not None, a dict that is filled with the wall-clock
+            time (in s) spent on every protocol
+        early_stop: if not None, the protocols are stopped as soon as the
+            combo fails its gate, see evaluate_protocols. Missing extra values
+            don't raise an exception when the protocols were stopped early.
+        synthetic_evaluator: if not None, dict with the arguments of
+            synthetic.create. The setup package of the e-model is not used,
+            the combo is evaluated by a synthetic evaluator instead.
 
     Returns:
         tuple:
@@ -129,9 +465,12 @@ def run_emodel_morph(
         print('Running e-model %s on morphology %s in %s' %
               (emodel, morph_path, emodel_dir))
 
-        setup = tools.load_module(
-            'setup', os.path.join(emodel_dir, 'setup/__init__.py')
-        )
+        if synthetic_evaluator is None:
+            setup = tools.load_module(
+                'setup', os.path.join(emodel_dir, 'setup/__init__.py')
+            )
+        else:
+            setup = None
 
         print("Changing path to %s" % emodel_dir)
         with tools.cd(emodel_dir):
@@ -144,11 +483,10 @@ def run_emodel_morph(
 
                 evaluator = evaluator.evaluators[0]  # only one evaluator
 
-                responses = evaluator.run_protocols(
-                    evaluator.fitness_protocols.values(),
-                    emodel_params)
-                scores = evaluator.fitness_calculator.calculate_scores(
-                    responses)
+                responses, scores = evaluate_protocols(
+                    evaluator, emodel_params, protocol_times, early_stop)
+                stopped_early = early_stop is not None and \
+                    early_stop['reason'] is not None
 
                 extra_values = {}
 
@@ -161,21 +499,22 @@ def run_emodel_morph(
                         extra_values[extra_values_key] = responses[
                             response_key]
                     else:
-                        if extra_values_error:
+                        if extra_values_error and not stopped_early:
                             raise ValueError(
                                 "Key %s not found in responses: %s" %
                                 (response_key, str(responses)))
                         else:
                             extra_values[extra_values_key] = None
             else:
-                evaluator = setup.evaluator.create(etype='%s' % emodel)
+                if setup is None:
+                    evaluator = synthetic.create(etype='%s' % emodel,
+                                                 **synthetic_evaluator)
+                else:
+                    evaluator = setup.evaluator.create(etype='%s' % emodel)
                 evaluator.cell_model.morphology.morphology_path = morph_path
 
-                responses = evaluator.run_protocols(
-                    evaluator.fitness_protocols.values(),
-                    emodel_params)
-                scores = evaluator.fitness_calculator.calculate_scores(
-                    responses)
+                responses, scores = evaluate_protocols(
+                    evaluator, emodel_params, protocol_times, early_stop)
 
                 extra_values = {}
                 extra_values['holding_current'] = \
@@ -190,10 +529,16 @@ def run_emodel_morph(
             "".join(traceback.format_exception(*sys.exc_info())))
 
 
-def create_arg_list(scores_db_filename, emodel_dirs, final_dict,
-                    extra_values_error=False, use_apical_points=True):
-    """Create list of argument tuples to be used as an input for
-    run_emodel_morph.
+def create_task_context(scores_db_filename, emodel_dirs, final_dict,
+                        extra_values_error=False, use_apical_points=True,
+                        combo_timeout=None, combo_max_rss_mb=None,
+                        synthetic_evaluator=None):
+    """Create the context that is shared by all the tasks of a run.
+
+    The e-model parameters, directories and morphology paths are stored only
+    once in the context, which is sent to every worker when it is started.
+    The tasks themselves only refer to the context by integer ids, see
+    create_task_list.
 
     Args:
         scores_db_filename: path to .sqlite database
@@ -202,66 +547,418 @@ def create_arg_list(scores_db_filename, emodel_dirs, final_dict,
         final_dict: a dict mapping e-models to dicts with e-model parameters
         extra_values_error: boolean to raise an exception upon a missing key
         use_apical_points: boolean to use apical points or not
+        combo_timeout: maximum wall-clock time (in s) of a combo, None for no
+            limit
+        combo_max_rss_mb: maximum resident set size (in MB) of a combo, None
+            for no limit
+        synthetic_evaluator: dict with the arguments of synthetic.create to
+            run all combos with a synthetic evaluator, or None
 
-    Raises:
-        ValueError, if one of the database entries contains has value None for
-        the key 'emodel'.
+    Returns:
+        A dict with keys:
+        - 'emodels': list of (emodel, emodel_dir, emodel_params)-tuples,
+          indexed by e-model id
+        - 'emodel_ids': dict mapping (emodel, original_emodel) to e-model id
+        - 'morphs': list of (morph_path, apical_point_isec)-tuples, indexed by
+          morphology id
+        - 'morph_ids': dict mapping (morph_dir, morph_name, morph_ext) to
+          morphology id
+        - 'extra_values_error': boolean to raise an exception upon a missing
+          key
+        - 'combo_timeout', 'combo_max_rss_mb': limits of every combo
+        - 'synthetic_evaluator': arguments of the synthetic evaluator, or None
+        - 'early_stop': None, see add_early_stop_context to enable early
+          stopping
     """
+    task_context = {'emodels': [], 'emodel_ids': {},
+                    'morphs': [], 'morph_ids': {},
+                    'extra_values_error': extra_values_error,
+                    'combo_timeout': combo_timeout,
+                    'combo_max_rss_mb': combo_max_rss_mb,
+                    'synthetic_evaluator': synthetic_evaluator,
+                    'early_stop': None}
 
-    arg_list = []
     with sqlite3.connect(scores_db_filename) as scores_db:
         scores_db.row_factory = sqlite3.Row
 
         one_row = scores_db.execute('SELECT * FROM scores LIMIT 1').fetchone()
 
-        apical_points_isec = {}
-        setup = tools.load_module(
-            'setup',
-            os.path.join(emodel_dirs[one_row['emodel']], 'setup/__init__.py')
-        )
-        if hasattr(setup, 'multieval') and use_apical_points:
-            apical_points_isec = tools.load_json(
-                os.path.join(one_row['morph_dir'], "apical_points_isec.json")
+        apical_points_index = {}
+        if synthetic_evaluator is None:
+            setup = tools.load_module(
+                'setup',
+                os.path.join(emodel_dirs[one_row['emodel']],
+                             'setup/__init__.py')
             )
-
-        scores_cursor = scores_db.execute('SELECT * FROM scores')
-        for row in scores_cursor.fetchall():
-            index = row['index']
+        else:
+            setup = None
+        morph_rows = scores_db.execute(
+            'SELECT DISTINCT morph_dir, morph_name, morph_ext FROM scores '
+            'WHERE to_run=1').fetchall()
+        if hasattr(setup, 'multieval') and use_apical_points:
+            # the release morphologies must have apical points, the exemplar
+            # morphologies of the e-model repositories may not have them
+            columns = [column[1] for column in
+                       scores_db.execute('PRAGMA table_info(scores)')]
+            exemplar_condition = ' AND is_exemplar=0' \
+                if 'is_exemplar' in columns else ''
+            apical_points_index = read_apical_points_index(
+                row[0] for row in scores_db.execute(
+                    'SELECT DISTINCT morph_dir FROM scores WHERE to_run=1%s' %
+                    exemplar_condition))
+            for row in morph_rows:
+                json_filename = os.path.join(row['morph_dir'],
+                                             'apical_points_isec.json')
+                if row['morph_dir'] not in apical_points_index and \
+                        os.path.isfile(json_filename):
+                    apical_points_index.update(
+                        read_apical_points_index([row['morph_dir']]))
+
+        for row in morph_rows:
             morph_name = row['morph_name']
             morph_ext = row['morph_ext']
 
             if morph_ext is None:
                 morph_ext = '.asc'
 
-            apical_point_isec = None
-            if morph_name in apical_points_isec:
-                apical_point_isec = int(apical_points_isec[morph_name])
+            apical_point_isec = apical_points_index.get(
+                row['morph_dir'], {}).get(morph_name, None)
 
             morph_filename = morph_name + morph_ext
             morph_path = os.path.abspath(os.path.join(row['morph_dir'],
                                                       morph_filename))
-            if row['to_run'] == 1:
-                emodel = row['emodel']
-                original_emodel = row['original_emodel']
-                if emodel is None:
-                    raise ValueError(
-                        "scores db row %s for morph %s, etype %s, mtype %s, "
-                        "layer %s doesn't have an e-model assigned to it" %
-                        (index, morph_name, row['etype'], row['mtype'],
-                         row['layer']))
-                args = (index, emodel,
-                        os.path.abspath(emodel_dirs[emodel]),
-                        final_dict[original_emodel]['params'],
-                        morph_path, apical_point_isec, extra_values_error)
-                arg_list.append(args)
+            task_context['morph_ids'][tuple(row)] = \
+                len(task_context['morphs'])
+            task_context['morphs'].append((morph_path, apical_point_isec))
+
+        emodel_rows = scores_db.execute(
+            'SELECT DISTINCT emodel, original_emodel FROM scores '
+            'WHERE to_run=1 AND emodel IS NOT NULL').fetchall()
+        for emodel, original_emodel in emodel_rows:
+            task_context['emodel_ids'][(emodel, original_emodel)] = \
+                len(task_context['emodels'])
+            task_context['emodels'].append(
+                (emodel,
+                 os.path.abspath(emodel_dirs[emodel]),
+                 final_dict[original_emodel]['params']))
+
+    return task_context
+
+
+def add_early_stop_context(task_context, scores_db_filename,
+                           early_stop_config):
+    """Enable early stopping of the tasks that are read by iter_tasks.
+
+    The gates depend on the scores of the exemplars, so this should be called
+    after the exemplars have run (unless skip_repaired_exemplar is set).
+
+    Args:
+        task_context: dict created by create_task_context
+        scores_db_filename: path to .sqlite database
+        early_stop_config: dict created by
+            early_stop.read_early_stop_config
+    """
+    gates, gate_ids = early_stop_module.create_gates(scores_db_filename,
+                                                     early_stop_config)
+    task_context['early_stop'] = {
+        'gates': gates,
+        'gate_ids': gate_ids,
+        'protocol_costs': early_stop_module.read_protocol_costs(
+            scores_db_filename)}
+
+
+def _task_condition(shard=None, index_range=None, is_exemplar=None):
+    """Return SQL condition and parameters selecting the rows of a shard
+    and/or of a range of indices, and/or the (non-)exemplar rows"""
+    condition = ''
+    params = ()
+    if is_exemplar is not None:
+        condition += ' AND is_exemplar=?'
+        params += (int(is_exemplar),)
+    if shard is not None:
+        shard_index, n_shards = shard
+        condition += ' AND `index`%? = ?'
+        params += (n_shards, shard_index)
+    if index_range is not None:
+        condition += ' AND `index` BETWEEN ? AND ?'
+        params += tuple(index_range)
+    return condition, params
+
+
+def iter_tasks(scores_db_filename, task_context, page_size=10000,
+               shard=None, index_range=None, is_exemplar=None):
+    """Lazily read the combinations that still have to run from a database
+    and yield compact argument tuples to be used as an input for run_task.
+
+    The database is read in pages of `page_size` rows, so that memory usage
+    doesn't depend on the size of the database and the first tasks are
+    available immediately. The connection is closed between pages, so that
+    results can be written to the same database while tasks are read.
+
+    Args:
+        scores_db_filename: path to .sqlite database
+        task_context: dict created by create_task_context
+        page_size: number of rows read from the database at once
+        shard: (shard_index, n_shards)-tuple. If not None, only the rows for
+            which `index` modulo n_shards equals shard_index are read.
+        index_range: (first_index, last_index)-tuple. If not None, only the
+            rows with first_index <= `index` <= last_index are read.
+        is_exemplar: if not None, only the exemplar rows (True) or the
+            non-exemplar rows (False) are read.
+
+    Yields:
+        (uid, emodel_id, morph_id)-tuples, one for every combination that
+        still has to run. If the task context enables early stopping, the
+        gate id of the combination is added as a fourth element.
+
+    Raises:
+        ValueError, if one of the database entries contains has value None for
+        the key 'emodel'.
+    """
+    emodel_ids = task_context['emodel_ids']
+    morph_ids = task_context['morph_ids']
+    early_stop = task_context.get('early_stop')
+
+    # Fail before any task is yielded if there are rows without e-model
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        scores_db.row_factory = sqlite3.Row
+        row = scores_db.execute(
+            'SELECT * FROM scores WHERE to_run=1 AND emodel IS NULL '
+            'LIMIT 1').fetchone()
+    if row is not None:
+        raise ValueError(
+            "scores db row %s for morph %s, etype %s, mtype %s, "
+            "layer %s doesn't have an e-model assigned to it" %
+            (row['index'], row['morph_name'], row['etype'], row['mtype'],
+             row['layer']))
+
+    task_condition, task_params = _task_condition(shard, index_range,
+                                                  is_exemplar)
+    columns = '`index`, emodel, original_emodel, morph_dir, morph_name, ' \
+        'morph_ext'
+    if early_stop is not None:
+        columns += ', fullmtype, etype'
+    last_index = None
+    while True:
+        with sqlite3.connect(scores_db_filename) as scores_db:
+            if last_index is None:
+                rows = scores_db.execute(
+                    'SELECT %s FROM scores WHERE to_run=1%s '
+                    'ORDER BY `index` LIMIT ?' % (columns, task_condition),
+                    task_params + (page_size,)).fetchall()
+            else:
+                rows = scores_db.execute(
+                    'SELECT %s FROM scores WHERE to_run=1%s AND '
+                    '`index`>? ORDER BY `index` LIMIT ?' %
+                    (columns, task_condition),
+                    task_params + (last_index, page_size)).fetchall()
+        scores_db.close()
+
+        for row in rows:
+            index, emodel, original_emodel, morph_dir, morph_name, \
+                morph_ext = row[:6]
+            task = (index,
+                    emodel_ids[(emodel, original_emodel)],
+                    morph_ids[(morph_dir, morph_name, morph_ext)])
+            if early_stop is not None:
+                task += (early_stop['gate_ids'].get(
+                    (emodel,) + tuple(row[6:])),)
+            yield task
+
+        if len(rows) < page_size:
+            break
+        last_index = rows[-1][0]
+
+
+def count_tasks(scores_db_filename, shard=None, index_range=None,
+                is_exemplar=None):
+    """Return the number of combinations in a database that still have to
+    run, optionally restricted to a shard, range of indices and/or
+    (non-)exemplar rows (see iter_tasks)."""
+    task_condition, task_params = _task_condition(shard, index_range,
+                                                  is_exemplar)
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        n_tasks = scores_db.execute(
+            'SELECT COUNT(*) FROM scores WHERE to_run=1%s' % task_condition,
+            task_params).fetchone()[0]
+    scores_db.close()
+    return n_tasks
+
+
+def count_tasks_per_emodel(scores_db_filename, shard=None, index_range=None,
+                           is_exemplar=None):
+    """Return a dict mapping e-models to the number of their combinations
+    that still have to run, with the same restrictions as count_tasks."""
+    task_condition, task_params = _task_condition(shard, index_range,
+                                                  is_exemplar)
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        emodel_counts = dict(scores_db.execute(
+            'SELECT emodel, COUNT(*) FROM scores WHERE to_run=1%s '
+            'GROUP BY emodel' % task_condition, task_params))
+    scores_db.close()
+    return emodel_counts
+
+
+def expand_task(task_context, task):
+    """Expand a compact task to the argument tuple of run_emodel_morph.
+
+    Args:
+        task_context: dict created by create_task_context
+        task: (uid, emodel_id, morph_id)-tuple, possibly followed by a gate id
+
+    Returns:
+        A (uid, emodel, emodel_dir, emodel_params, morph_path,
+        apical_point_isec, extra_values_error)-tuple.
+    """
+    uid, emodel_id, morph_id = task[:3]
+    emodel, emodel_dir, emodel_params = task_context['emodels'][emodel_id]
+    morph_path, apical_point_isec = task_context['morphs'][morph_id]
+
+    return (uid, emodel, emodel_dir, emodel_params, morph_path,
+            apical_point_isec, task_context['extra_values_error'])
+
+
+def create_arg_list(scores_db_filename, emodel_dirs, final_dict,
+                    extra_values_error=False, use_apical_points=True):
+    """Create list of argument tuples to be used as an input for
+    run_emodel_morph.
+
+    Args:
+        scores_db_filename: path to .sqlite database
+        emodel_dirs: a dict mapping e-models to the directories with e-model
+            input files
+        final_dict: a dict mapping e-models to dicts with e-model parameters
+        extra_values_error: boolean to raise an exception upon a missing key
+        use_apical_points: boolean to use apical points or not
+
+    Raises:
+        ValueError, if one of the database entries contains has value None for
+        the key 'emodel'.
+    """
+    task_context = create_task_context(
+        scores_db_filename, emodel_dirs, final_dict,
+        extra_values_error=extra_values_error,
+        use_apical_points=use_apical_points)
+
+    return [expand_task(task_context, task) for task in
+            create_task_list(scores_db_filename, task_context)]
+
+
+def create_task_list(scores_db_filename, task_context):
+    """Create list of compact argument tuples to be used as an input for
+    run_task.
+
+    Args:
+        scores_db_filename: path to .sqlite database
+        task_context: dict created by create_task_context
+
+    Returns:
+        A list of (uid, emodel_id, morph_id)-tuples, one for every
+        combination that still has to run.
+
+    Raises:
+        ValueError, if one of the database entries contains has value None for
+        the key 'emodel'.
+    """
+    arg_list = list(iter_tasks(scores_db_filename, task_context))
 
     print('Found %d rows in score database to run' % len(arg_list))
 
     return arg_list
 
 
+def imap_bounded(submit, tasks, max_pending):
+    """Submit tasks while they are consumed from an iterable and yield the
+    results as they come in, in arbitrary order.
+
+    At most `max_pending` tasks are submitted but not yet returned at any
+    time, so that `tasks` can be a generator over a very large number of
+    tasks.
+
+    Args:
+        submit: function submit(task, callback) that starts a task
+            asynchronously and calls callback with the result, or with the
+            exception raised by the task, once it is finished
+        tasks: iterable with tasks
+        max_pending: maximum number of tasks in flight
+
+    Yields:
+        the results of the tasks
+
+    Raises:
+        the exception raised by a task, if any
+    """
+    finished = queue.Queue()
+    tasks = iter(tasks)
+    n_pending = 0
+    tasks_left = True
+
+    while True:
+        while tasks_left and n_pending < max_pending:
+            try:
+                task = next(tasks)
+            except StopIteration:
+                tasks_left = False
+            else:
+                submit(task, finished.put)
+                n_pending += 1
+
+        if n_pending == 0:
+            return
+
+        result = finished.get()
+        n_pending -= 1
+        if isinstance(result, BaseException):
+            raise result
+        yield result
+
+
+def _put_ipyp_result(callback, async_result):
+    """Pass the result of a finished ipyparallel task to a callback"""
+    try:
+        callback(async_result.get())
+    except Exception as exception:  # pylint: disable=W0703
+        callback(exception)
+
+
+# Columns of the scores table that store the resources used by a combo, see
+# run_emodel_morph_isolated
+TIMING_COLUMNS = [('wall_time', 'REAL'),
+                  ('cpu_time', 'REAL'),
+                  ('peak_rss_mb', 'REAL'),
+                  ('protocol_times', 'TEXT'),
+                  ('worker', 'TEXT')]
+
+# Columns added to the scores table by run, next to the ones created by
+# prepare
+RESULT_COLUMNS = [('exception_type', 'TEXT'),
+                  ('early_stop_reason', 'TEXT')] + TIMING_COLUMNS
+
+
+def add_result_columns(scores_db_filename, table='scores'):
+    """Add the result columns to a table of a database if they don't exist
+    yet."""
+    with sqlite3.connect(scores_db_filename,
+                         timeout=claims.DB_TIMEOUT) as scores_db:
+        existing_columns = [
+            column[1] for column in
+            scores_db.execute('PRAGMA table_info(%s)' % table)]
+        for column, column_type in RESULT_COLUMNS:
+            if column not in existing_columns:
+                scores_db.execute('ALTER TABLE %s ADD COLUMN %s %s' %
+                                  (table, column, column_type))
+
+
+def _timing_values(timings):
+    """Convert timings dict to values of the timing columns"""
+    timings = dict(timings)
+    timings['protocol_times'] = json.dumps(timings.get('protocol_times'))
+    return tuple(timings.get(column) for column, _ in TIMING_COLUMNS)
+
+
 def save_scores(scores_db_filename, uid, scores, extra_values, exception,
-                float_representation='.17g'):
+                float_representation='.17g', ignore_executed=False,
+                timings=None, exception_type=None, early_stop_reason=None):
     """Update a specific entry in a given database with scores and related
     parameters.
 
@@ -273,13 +970,27 @@ def save_scores(scores_db_filename, uid, scores, extra_values, exception,
         exception: description of exception that may have happened during score
                    calculation
         float_representation: use for json encoding. Default is '.17g'.
+        ignore_executed: if True, an entry that has already been updated is
+            left untouched and a warning is printed instead of raising an
+            exception. Default is False.
+        timings: dict with the resources used by the combo, as returned by
+            run_emodel_morph_isolated. If not None, it is saved in the timing
+            columns, which should exist (see add_result_columns).
+        exception_type: type of the exception, as returned by
+            run_emodel_morph_isolated. If not None, it is saved in the
+            exception_type column, which should exist (see
+            add_result_columns).
+        early_stop_reason: reason why the protocols were stopped early. If
+            not None, it is saved in the early_stop_reason column, which
+            should exist (see add_result_columns).
 
     Returns:
         ValueError if entry has already been updated.
     """
     json.encoder.FLOAT_REPR = lambda x: format(x, float_representation)
 
-    with sqlite3.connect(scores_db_filename) as scores_db:
+    with sqlite3.connect(scores_db_filename,
+                         timeout=claims.DB_TIMEOUT) as scores_db:
         # make sure we don't update a row that was already executed
         scores_cursor = scores_db.execute(
             'SELECT `index` FROM scores WHERE `index`=? AND to_run=?',
@@ -290,11 +1001,193 @@ def save_scores(scores_db_filename, uid, scores, extra_values, exception,
                               'exception=?, to_run=? WHERE `index`=?',
                               (json.dumps(scores), json.dumps(extra_values),
                                exception, False, uid))
+            if exception_type is not None:
+                scores_db.execute(
+                    'UPDATE scores SET exception_type=? WHERE `index`=?',
+                    (exception_type, uid))
+            if early_stop_reason is not None:
+                scores_db.execute(
+                    'UPDATE scores SET early_stop_reason=? WHERE `index`=?',
+                    (early_stop_reason, uid))
+            if timings is not None:
+                scores_db.execute(
+                    'UPDATE scores SET %s WHERE `index`=?' %
+                    ', '.join('%s=?' % column for column, _ in TIMING_COLUMNS),
+                    _timing_values(timings) + (uid,))
+        elif ignore_executed:
+            print('WARNING: scores of row %d were already saved, ignoring '
+                  'new scores' % uid)
         else:
             raise ValueError('save_scores: trying to update scores in a row '
                              'that was already executed: %d' % uid)
 
 
+def get_shard_db_filename(scores_db_filename, shard_index, n_shards):
+    """Return path to the database with the results of a shard.
+
+    The shard databases are stored next to the scores database, e.g.
+    'scores.shard_3_of_8.sqlite' for 'scores.sqlite'.
+    """
+    base, ext = os.path.splitext(scores_db_filename)
+    return '%s.shard_%d_of_%d%s' % (base, shard_index, n_shards, ext)
+
+
+def find_shard_db_filenames(scores_db_filename):
+    """Return the sorted paths of all shard databases of a scores database"""
+    base, ext = os.path.splitext(scores_db_filename)
+    return sorted(glob.glob('%s.shard_*_of_*%s' % (glob.escape(base), ext)))
+
+
+def get_scores_db_id(scores_db_filename):
+    """Return the creation id of a scores database.
+
+    The id is written by prepare every time the scores table is created. A
+    database without id, e.g. one created by an older version, gets a new
+    id.
+    """
+    conn = sqlite3.connect(scores_db_filename, timeout=claims.DB_TIMEOUT,
+                           isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('CREATE TABLE IF NOT EXISTS scores_info (key TEXT '
+                     'PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT OR IGNORE INTO scores_info VALUES "
+                     "('creation_id', ?)", (uuid.uuid4().hex,))
+        (scores_db_id,) = conn.execute(
+            "SELECT value FROM scores_info WHERE key='creation_id'").fetchone()
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    return scores_db_id
+
+
+def _init_shard_db(shard_db_filename, scores_db_id=None):
+    """Create results table in shard database if it doesn't exist yet.
+
+    If scores_db_id is not None, the shard database is tied to the scores
+    database with this creation id.
+
+    Raises:
+        ValueError: the shard database belongs to another scores database,
+            e.g. one created by an earlier prepare.
+    """
+    with sqlite3.connect(shard_db_filename) as shard_db:
+        shard_db.execute(
+            'CREATE TABLE IF NOT EXISTS shard_scores (`index` INTEGER '
+            'PRIMARY KEY, scores TEXT, extra_values TEXT, exception TEXT, '
+            '%s)' % ', '.join('%s %s' % column for column in RESULT_COLUMNS))
+        if scores_db_id is not None:
+            shard_db.execute('CREATE TABLE IF NOT EXISTS shard_info (key TEXT '
+                             'PRIMARY KEY, value TEXT)')
+            shard_db.execute("INSERT OR IGNORE INTO shard_info VALUES "
+                             "('scores_db_id', ?)", (scores_db_id,))
+            (shard_scores_db_id,) = shard_db.execute(
+                "SELECT value FROM shard_info WHERE key='scores_db_id'"
+            ).fetchone()
+            if shard_scores_db_id != scores_db_id:
+                raise ValueError(
+                    'Shard database %s was created for another scores '
+                    'database, probably by an earlier prepare. Remove it to '
+                    'rerun the shard.' % shard_db_filename)
+
+
+def read_shard_uids(shard_db_filename, scores_db_id):
+    """Return set with the uids of the combos saved in a shard database
+
+    Args:
+        shard_db_filename: path to .sqlite database of the shard
+        scores_db_id: creation id of the scores database, see
+            get_scores_db_id
+
+    Raises:
+        ValueError: the shard database belongs to another scores database
+    """
+    _init_shard_db(shard_db_filename, scores_db_id)
+    with sqlite3.connect(shard_db_filename) as shard_db:
+        return {uid for (uid,) in shard_db.execute(
+            'SELECT `index` FROM shard_scores')}
+
+
+def save_shard_scores(shard_db_filename, uid, scores, extra_values,
+                      exception, timings=None, exception_type=None,
+                      early_stop_reason=None):
+    """Save the scores and related parameters of a combo in a shard database.
+
+    Args:
+        shard_db_filename: path to .sqlite database of the shard, created
+            if it doesn't exist
+        uid: unique identifier of the combo in the scores database
+        scores: scores dict to be saved as a json string
+        extra_values: dict to be saved as a json string
+        exception: description of exception that may have happened during score
+                   calculation
+        timings: dict with the resources used by the combo, as returned by
+            run_emodel_morph_isolated
+        exception_type: type of the exception, as returned by
+            run_emodel_morph_isolated
+        early_stop_reason: reason why the protocols were stopped early
+    """
+    _init_shard_db(shard_db_filename)
+    with sqlite3.connect(shard_db_filename) as shard_db:
+        shard_db.execute(
+            'INSERT OR REPLACE INTO shard_scores (`index`, scores, '
+            'extra_values, exception, exception_type, early_stop_reason, '
+            '%s) VALUES (?, ?, ?, ?, ?, ?, %s)' %
+            (', '.join(column for column, _ in TIMING_COLUMNS),
+             ', '.join('?' for _ in TIMING_COLUMNS)),
+            (uid, json.dumps(scores), json.dumps(extra_values), exception,
+             exception_type, early_stop_reason) +
+            _timing_values(timings or {}))
+
+
+def merge_shard_scores(scores_db_filename, shard_db_filenames):
+    """Fold the results of shard databases into the scores database.
+
+    Only rows that still have to run are updated, so merging the same shard
+    more than once has no effect.
+
+    All the shard databases are checked before anything is merged, nothing
+    is merged if one of them belongs to another scores database.
+
+    Args:
+        scores_db_filename: path to .sqlite database with e-model morphology
+            combinations
+        shard_db_filenames: paths to the shard databases
+
+    Returns:
+        The number of rows of the scores database that were updated.
+
+    Raises:
+        ValueError: a shard database belongs to another scores database
+    """
+    scores_db_id = get_scores_db_id(scores_db_filename)
+    for shard_db_filename in shard_db_filenames:
+        _init_shard_db(shard_db_filename, scores_db_id)
+
+    add_result_columns(scores_db_filename)
+    result_columns = [column for column, _ in RESULT_COLUMNS]
+
+    n_merged = 0
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        for shard_db_filename in shard_db_filenames:
+            print('Merging shard results from %s' % shard_db_filename)
+            with sqlite3.connect(shard_db_filename) as shard_db:
+                shard_cursor = shard_db.execute(
+                    'SELECT scores, extra_values, exception, %s, `index` '
+                    'FROM shard_scores' % ', '.join(result_columns))
+                scores_cursor = scores_db.executemany(
+                    'UPDATE scores SET scores=?, extra_values=?, '
+                    'exception=?, %s, to_run=0 WHERE `index`=? AND '
+                    'to_run=1' %
+                    ', '.join('%s=?' % column for column in result_columns),
+                    shard_cursor)
+                n_merged += scores_cursor.rowcount
+            shard_db.close()
+
+    return n_merged
+
+
 def expand_scores_to_score_values_table(scores_sqlite_filename):
     """Read scores from sqlite table, expand to dataframe, and store in new
     table 'score_values'. Each column of the new table corresponds to a
@@ -321,9 +1214,67 @@ def expand_scores_to_score_values_table(scores_sqlite_filename):
                             index=False)
 
 
+def start_workers(task_context, use_ipyp=False, ipyp_profile=None, timeout=10,
+                  n_processes=None):
+    """Start the workers that run the tasks of a task context.
+
+    Args:
+        task_context: dict created by create_task_context
+        use_ipyp: bool indicating whether ipyparallel is used
+        ipyp_profile: path to ipyparallel profile
+        timeout: timeout for the ipyparallel client
+        n_processes: the integer number of processes. If `None`, all
+            processes are going to be used.
+
+    Returns:
+        A tuple:
+        - submit function, see imap_bounded
+        - the number of workers
+        - function to stop the workers
+    """
+    if use_ipyp:
+        # use ipyparallel, broadcast the task context to all the engines
+        client = ipyparallel.Client(profile=ipyp_profile, timeout=timeout)
+        client[:].apply_sync(init_task_context, task_context)
+        lview = client.load_balanced_view(targets=n_processes)
+        n_workers = len(client.ids)
+
+        def submit(task, callback):
+            """Submit task to ipyparallel"""
+            lview.apply_async(run_task, task).add_done_callback(
+                lambda async_result: _put_ipyp_result(callback, async_result))
+
+        def stop_workers():
+            """The engines keep running"""
+            pass
+    else:
+        # use multiprocessing, every worker receives the task context once
+        pool = tools.NestedPool(processes=n_processes,
+                                initializer=init_task_context,
+                                initargs=(task_context,))
+        n_workers = n_processes or multiprocessing.cpu_count()
+
+        def submit(task, callback):
+            """Submit task to multiprocessing pool"""
+            pool.apply_async(run_task, (task,), callback=callback,
+                             error_callback=callback)
+
+        def stop_workers():
+            """Stop the pool"""
+            pool.terminate()
+            pool.join()
+
+    return submit, n_workers, stop_workers
+
+
 def calculate_scores(final_dict, emodel_dirs, scores_db_filename,
                      use_ipyp=False, ipyp_profile=None, timeout=10,
-                     use_apical_points=True, n_processes=None):
+                     use_apical_points=True, n_processes=None,
+                     max_pending=None, shard=None, claim=False,
+                     batch_size=100, lease_time=600, combo_timeout=None,
+                     combo_max_rss_mb=None, early_stop=None,
+                     synthetic_evaluator=None, progress_interval=10.0,
+                     status_filename=None):
     """Calculate scores of e-model morphology combinations and update the
     database accordingly.
 
@@ -339,42 +1290,180 @@ def calculate_scores(final_dict, emodel_dirs, scores_db_filename,
         use_apical_points: boolean to use apical points or not
         n_processes: the integer number of processes. If `None`,
         all processes are going to be used.
+        max_pending: maximum number of combos that are submitted to the
+            workers but not finished yet. If `None`, four times the number of
+            workers is used.
+        shard: (shard_index, n_shards)-tuple. If not None, only the combos
+            for which the index modulo n_shards equals shard_index are run.
+            The results are written to a separate shard database (see
+            get_shard_db_filename) instead of the scores database, combos
+            already saved in the shard database are skipped. Use
+            merge_shard_scores to fold them into the scores database.
+        claim: if True, batches of combos are claimed dynamically from a
+            claims table in the scores database (see claims module), so that
+            any number of processes sharing the database can run the combos
+            together. The process that completes the last batch creates the
+            score values table.
+        batch_size: number of combos per batch when claiming batches
+        lease_time: time (in s) after which the batch of a worker that
+            stopped renewing its lease can be claimed by another worker
+        combo_timeout: maximum wall-clock time (in s) of a combo. A combo
+            that runs longer is stopped and saved with exception type
+            'timeout'. If `None`, there is no limit.
+        combo_max_rss_mb: maximum resident set size (in MB) of a combo. A
+            combo that uses more memory is stopped and saved with exception
+            type 'oom'. If `None`, there is no limit.
+        early_stop: dict created by early_stop.read_early_stop_config. If not
+            None, the protocols of a combo are stopped as soon as it can't
+            pass the me-gating anymore, see early_stop module. The exemplars
+            run first (unless skip_repaired_exemplar is set), since the
+            me-gate thresholds depend on their scores. Can't be combined with
+            shards or claims.
+        synthetic_evaluator: dict with the arguments of synthetic.create. If
+            not None, the combos are evaluated by a synthetic evaluator
+            instead of their e-models, to measure the overhead of the run
+            step.
+        progress_interval: minimal time (in s) between two progress reports,
+            see progress module. When claiming batches, the progress refers
+            to the batches claimed so far by this process.
+        status_filename: if not None, the progress reports are appended to
+            this file in JSON-lines format
     """
+    if shard is not None and claim:
+        raise ValueError('calculate_scores: shards and claims can not be '
+                         'combined')
+    if early_stop is not None and (shard is not None or claim):
+        raise ValueError('calculate_scores: early stopping can not be '
+                         'combined with shards or claims')
+
+    print('Creating task context for parallelisation')
+    with profiling.stage('create task context'):
+        task_context = create_task_context(
+            scores_db_filename,
+            emodel_dirs,
+            final_dict,
+            use_apical_points=use_apical_points,
+            combo_timeout=combo_timeout,
+            combo_max_rss_mb=combo_max_rss_mb,
+            synthetic_evaluator=synthetic_evaluator)
+    if shard is None:
+        add_result_columns(scores_db_filename)
+
+    if claim:
+        save_function = functools.partial(save_scores, scores_db_filename,
+                                          ignore_executed=True)
+    elif shard is None:
+        save_function = functools.partial(save_scores, scores_db_filename)
+    else:
+        shard_db_filename = get_shard_db_filename(scores_db_filename, *shard)
+        print('Saving results of shard %d/%d in %s' %
+              (shard[0], shard[1], shard_db_filename))
+        save_function = functools.partial(save_shard_scores,
+                                          shard_db_filename)
+
+    pending_emodels = {}
+    reporter = progress.ProgressReporter(interval=progress_interval,
+                                         status_filename=status_filename,
+                                         worker=tools.get_worker_id())
+
+    def track_tasks(tasks):
+        """Remember the e-model of the pending tasks"""
+        for task in tasks:
+            pending_emodels[task[0]] = task_context['emodels'][task[1]][0]
+            yield task
+
+    def skip_tasks(tasks, skipped_uids):
+        """Skip tasks of which the uid is in skipped_uids"""
+        for task in tasks:
+            if task[0] in skipped_uids:
+                reporter.skip_task(task_context['emodels'][task[1]][0])
+            else:
+                yield task
+
+    def save_results(submit, n_workers, tasks):
+        """Run tasks, every time a result comes in, save the score"""
+        results = imap_bounded(submit, track_tasks(tasks),
+                               max_pending or 4 * n_workers)
+        for result in profiling.iter_stage('wait for results', results):
+            uid = result['uid']
+            scores = result['scores']
+            extra_values = result['extra_values']
+            exception = result['exception']
+            emodel = pending_emodels.pop(uid)
+            with profiling.stage('save scores'):
+                save_function(uid, scores, extra_values, exception,
+                              timings=result['timings'],
+                              exception_type=result['exception_type'],
+                              early_stop_reason=result['early_stop_reason'])
+            reporter.update(emodel, result['exception_type'],
+                            result['early_stop_reason'])
+
+    if early_stop is not None:
+        if not early_stop['skip_repaired_exemplar']:
+            emodel_counts = count_tasks_per_emodel(scores_db_filename,
+                                                   is_exemplar=True)
+            print('Early stopping: running %d exemplar me-combos first' %
+                  sum(emodel_counts.values()))
+            reporter.add_tasks(emodel_counts)
+            submit, n_workers, stop_workers = start_workers(
+                task_context, use_ipyp, ipyp_profile, timeout, n_processes)
+            save_results(submit, n_workers,
+                         iter_tasks(scores_db_filename, task_context,
+                                    is_exemplar=True))
+            stop_workers()
+        add_early_stop_context(task_context, scores_db_filename, early_stop)
+        print('Early stopping: created %d me-gates' %
+              len(task_context['early_stop']['gates']))
+
+    emodel_counts = count_tasks_per_emodel(scores_db_filename, shard=shard)
+    n_tasks = sum(emodel_counts.values())
+    tasks = iter_tasks(scores_db_filename, task_context, shard=shard)
+    if shard is not None:
+        # skip combos that were already run by a previous run of this shard
+        shard_uids = read_shard_uids(shard_db_filename,
+                                     get_scores_db_id(scores_db_filename))
+        if shard_uids:
+            print('Skipping %d me-combos that were already run in this '
+                  'shard' % len(shard_uids))
+            n_tasks = max(0, n_tasks - len(shard_uids))
+            tasks = skip_tasks(tasks, shard_uids)
+
+    print('Parallelising score evaluation of %d me-combos' % n_tasks)
+    submit, n_workers, stop_workers = start_workers(
+        task_context, use_ipyp, ipyp_profile, timeout, n_processes)
+
+    all_combos_run = shard is None
+    if claim:
+        worker_id = tools.get_worker_id()
+        n_batches = claims.init_claims_table(scores_db_filename, batch_size)
+        print('Worker %s: %d batches left to run' % (worker_id, n_batches))
+        all_combos_run = n_batches == 0
+        while True:
+            batch = claims.claim_batch(scores_db_filename, worker_id,
+                                       lease_time)
+            if batch is None:
+                break
+            batch_id, first_index, last_index = batch
+            print('Worker %s claimed batch %d' % (worker_id, batch_id))
+            with claims.LeaseRenewer(scores_db_filename, batch_id, worker_id,
+                                     lease_time):
+                reporter.add_tasks(count_tasks_per_emodel(
+                    scores_db_filename,
+                    index_range=(first_index, last_index)))
+                save_results(submit, n_workers, iter_tasks(
+                    scores_db_filename, task_context,
+                    index_range=(first_index, last_index)))
+            all_combos_run = claims.complete_batch(
+                scores_db_filename, batch_id, worker_id)
+        print('Worker %s: no batches left to claim' % worker_id)
+    else:
+        reporter.add_tasks(emodel_counts)
+        save_results(submit, n_workers, tasks)
 
-    print('Creating argument list for parallelisation')
-    arg_list = create_arg_list(scores_db_filename,
-                               emodel_dirs,
-                               final_dict,
-                               use_apical_points=use_apical_points)
+    stop_workers()
+    reporter.close()
 
-    print('Parallelising score evaluation of %d me-combos' % len(arg_list))
-    if use_ipyp:
-        # use ipyparallel
-        client = ipyparallel.Client(profile=ipyp_profile, timeout=timeout)
-        lview = client.load_balanced_view(targets=n_processes)
-        results = lview.imap(run_emodel_morph_isolated,
-                             arg_list, ordered=False)
-    else:
-        # use multiprocessing
-        pool = tools.NestedPool(processes=n_processes)
-        results = pool.imap_unordered(run_emodel_morph_isolated, arg_list)
-
-    # every time a result comes in, save the score in the database
-    for uids_received, result in enumerate(results, start=1):
-        uid = result['uid']
-        scores = result['scores']
-        extra_values = result['extra_values']
-        exception = result['exception']
-        save_scores(scores_db_filename, uid, scores, extra_values, exception)
-
-        print('Saved scores for uid %s (%d out of %d) %s' %
-              (uid, uids_received, len(arg_list),
-               'with exception' if exception else ''))
-        sys.stdout.flush()
-
-    if not use_ipyp:
-        pool.terminate()
-        pool.join()
-
-    print('Converting score json strings to scores values ...')
-    expand_scores_to_score_values_table(scores_db_filename)
+    if all_combos_run:
+        print('Converting score json strings to scores values ...')
+        with profiling.stage('expand score values'):
+            expand_scores_to_score_values_table(scores_db_filename)
@@ -0,0 +1,217 @@
+"""Lease-based claiming of batches of me-combinations"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""The me-combinations that still have to run are split in batches of
+consecutive rows of the scores database. Every batch is stored in the table
+'claims' of the scores database, and goes through the states
+
+    pending -> claimed -> done
+
+A worker claims a batch for a limited lease time, and renews its lease
+regularly while it is running the batch. If a worker dies, its lease expires
+and the batch can be claimed again by another worker. All state transitions
+happen in 'BEGIN IMMEDIATE' transactions, so any number of workers on
+different nodes can share the scores database, provided the filesystem
+supports the file locking used by SQLite.
+"""
+
+# pylint: disable=C0325
+
+import time
+import sqlite3
+import threading
+
+
+# Time (in s) a connection waits for a lock on the database
+DB_TIMEOUT = 600
+
+
+def _connect(scores_db_filename):
+    """Connect to database in autocommit mode, transactions are started
+    explicitly"""
+    return sqlite3.connect(scores_db_filename, timeout=DB_TIMEOUT,
+                           isolation_level=None)
+
+
+def init_claims_table(scores_db_filename, batch_size):
+    """Create the claims table if it doesn't exist yet.
+
+    Only the first worker creates the table, all the other workers use the
+    existing batches.
+
+    Args:
+        scores_db_filename: path to .sqlite database with e-model morphology
+            combinations
+        batch_size: number of me-combinations per batch
+
+    Returns:
+        The number of batches that are not done yet.
+    """
+    conn = _connect(scores_db_filename)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        table_exists = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND "
+            "name='claims'").fetchone() is not None
+        if not table_exists:
+            conn.execute(
+                'CREATE TABLE claims (batch_id INTEGER PRIMARY KEY, '
+                'first_index INTEGER, last_index INTEGER, '
+                "status TEXT DEFAULT 'pending', worker TEXT, "
+                'lease_expiry REAL, n_claims INTEGER DEFAULT 0)')
+            batches = []
+            batch = []
+            for (index,) in conn.execute(
+                    'SELECT `index` FROM scores WHERE to_run=1 '
+                    'ORDER BY `index`'):
+                batch.append(index)
+                if len(batch) == batch_size:
+                    batches.append((batch[0], batch[-1]))
+                    batch = []
+            if batch:
+                batches.append((batch[0], batch[-1]))
+            conn.executemany(
+                'INSERT INTO claims (first_index, last_index) VALUES (?, ?)',
+                batches)
+        n_open = conn.execute(
+            "SELECT COUNT(*) FROM claims WHERE status!='done'").fetchone()[0]
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    return n_open
+
+
+def claim_batch(scores_db_filename, worker_id, lease_time):
+    """Claim a pending batch, or a batch of which the lease expired.
+
+    Args:
+        scores_db_filename: path to .sqlite database with claims table
+        worker_id: string identifying the worker
+        lease_time: time (in s) the batch is reserved for this worker
+
+    Returns:
+        A (batch_id, first_index, last_index)-tuple, or None if there are no
+        batches left to claim.
+    """
+    conn = _connect(scores_db_filename)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        batch = conn.execute(
+            "SELECT batch_id, first_index, last_index FROM claims "
+            "WHERE status='pending' OR (status='claimed' AND lease_expiry<?) "
+            "ORDER BY batch_id LIMIT 1", (now,)).fetchone()
+        if batch is not None:
+            conn.execute(
+                "UPDATE claims SET status='claimed', worker=?, "
+                "lease_expiry=?, n_claims=n_claims+1 WHERE batch_id=?",
+                (worker_id, now + lease_time, batch[0]))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    return batch
+
+
+def renew_lease(scores_db_filename, batch_id, worker_id, lease_time):
+    """Extend the lease of a claimed batch.
+
+    Returns:
+        True if the worker still holds the lease, False if the batch was
+        claimed by another worker in the meantime.
+    """
+    conn = _connect(scores_db_filename)
+    try:
+        cursor = conn.execute(
+            "UPDATE claims SET lease_expiry=? WHERE batch_id=? AND worker=? "
+            "AND status='claimed'",
+            (time.time() + lease_time, batch_id, worker_id))
+        renewed = cursor.rowcount == 1
+    finally:
+        conn.close()
+
+    return renewed
+
+
+def complete_batch(scores_db_filename, batch_id, worker_id):
+    """Mark a batch as done.
+
+    Returns:
+        True if this was the last batch that was not done, i.e. if all the
+        me-combinations of the database have run. This is the case for
+        exactly one worker.
+    """
+    conn = _connect(scores_db_filename)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.execute(
+            "UPDATE claims SET status='done' WHERE batch_id=? AND worker=? "
+            "AND status='claimed'", (batch_id, worker_id))
+        completed = cursor.rowcount == 1
+        n_open = conn.execute(
+            "SELECT COUNT(*) FROM claims WHERE status!='done'").fetchone()[0]
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    return completed and n_open == 0
+
+
+class LeaseRenewer(object):
+
+    """Context manager that renews the lease of a batch in a background
+    thread while the batch is running"""
+
+    def __init__(self, scores_db_filename, batch_id, worker_id, lease_time):
+        """Constructor
+
+        Args:
+            scores_db_filename: path to .sqlite database with claims table
+            batch_id: id of the claimed batch
+            worker_id: string identifying the worker
+            lease_time: lease time (in s), the lease is renewed three times
+                per lease time
+        """
+        self.scores_db_filename = scores_db_filename
+        self.batch_id = batch_id
+        self.worker_id = worker_id
+        self.lease_time = lease_time
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew)
+        self._thread.daemon = True
+
+    def _renew(self):
+        """Renew the lease until stopped"""
+        while not self._stop.wait(self.lease_time / 3.0):
+            if not renew_lease(self.scores_db_filename, self.batch_id,
+                               self.worker_id, self.lease_time):
+                print('WARNING: worker %s lost the lease of batch %d' %
+                      (self.worker_id, self.batch_id))
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,276 @@
+"""Stop the protocols of me-combinations that can't pass the me-gating"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""The select step rejects a combo as soon as one of its (non-skipped) scores
+is above the me-gate threshold of that score, see
+select_combos.table_processing. When early stopping is enabled, run applies
+the same rule while the protocols of a combo are running: after every protocol
+the objectives of which all recordings are available are scored, and the
+remaining protocols are skipped if one of these scores fails the gate. The
+protocols are ordered cheapest-first, based on the protocol times of the
+combos that already ran.
+
+The gate of a combo depends on its e-model, full m-type and e-type, and on the
+scores of the repaired exemplar of its e-model (unless skip_repaired_exemplar
+is set), so the exemplars have to run before the other combos.
+"""
+
+# pylint: disable=C0325
+
+import json
+import sqlite3
+
+from bluepymm.select_combos import process_megate_config as proc_config
+
+
+def read_early_stop_config(select_conf_dict):
+    """Read the me-gating rules used for early stopping from a select
+    configuration.
+
+    Args:
+        select_conf_dict: dict with the configuration of the select step
+
+    Returns:
+        dict with keys 'megate_patterns', 'to_skip_patterns' and
+        'skip_repaired_exemplar'
+
+    Raises:
+        ValueError if the selection is based on 'select_perc_best', since
+        a ranking of the combos can't be decided per combo.
+    """
+    if select_conf_dict.get('select_perc_best', None) is not None:
+        raise ValueError('Early stopping can not be used with '
+                         'select_perc_best, which ranks the combos instead of '
+                         'applying the me-gate thresholds')
+
+    megate_patterns, _ = proc_config.read_megate_thresholds(select_conf_dict)
+    to_skip_patterns, _ = proc_config.read_to_skip_features(select_conf_dict)
+
+    return {'megate_patterns': megate_patterns,
+            'to_skip_patterns': to_skip_patterns,
+            'skip_repaired_exemplar': select_conf_dict.get(
+                'skip_repaired_exemplar', False)}
+
+
+def read_exemplar_scores(scores_db_filename):
+    """Read the scores of the repaired exemplar of every e-model.
+
+    The exemplar is chosen as in select_combos.table_processing.process_emodel.
+
+    Returns:
+        dict mapping e-models to dicts with scores, or to None if the
+        exemplar didn't run successfully
+    """
+    exemplar_scores = {}
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        emodel_morphs = scores_db.execute(
+            'SELECT emodel, morph_name FROM scores WHERE `index` IN '
+            '(SELECT MIN(`index`) FROM scores GROUP BY emodel)').fetchall()
+        for emodel, morph_name in emodel_morphs:
+            row = scores_db.execute(
+                'SELECT scores FROM scores WHERE emodel=? AND morph_name=? '
+                'AND is_exemplar=1 AND is_repaired=1 AND is_original=0 '
+                'AND to_run=0', (emodel, morph_name)).fetchone()
+            exemplar_scores[emodel] = \
+                json.loads(row[0]) if row is not None and row[0] else None
+    scores_db.close()
+
+    return exemplar_scores
+
+
+def read_protocol_costs(scores_db_filename):
+    """Read the mean time (in s) spent on every protocol by the combos that
+    already ran.
+
+    Returns:
+        dict mapping protocol names to mean times. Empty if the scores table
+        doesn't have protocol times.
+    """
+    totals = {}
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        columns = [column[1] for column in
+                   scores_db.execute('PRAGMA table_info(scores)')]
+        if 'protocol_times' in columns:
+            for (protocol_times_str,) in scores_db.execute(
+                    'SELECT protocol_times FROM scores WHERE to_run=0 AND '
+                    'protocol_times IS NOT NULL'):
+                for protocol_name, protocol_time in \
+                        (json.loads(protocol_times_str) or {}).items():
+                    total, count = totals.get(protocol_name, (0.0, 0))
+                    totals[protocol_name] = (total + protocol_time, count + 1)
+    scores_db.close()
+
+    return {protocol_name: total / count
+            for protocol_name, (total, count) in totals.items()}
+
+
+def create_gate(megate_patterns, to_skip_patterns, emodel, fullmtype, etype,
+                exemplar_scores=None):
+    """Create the gate of the combos of an e-model, full m-type and e-type.
+
+    Args:
+        megate_patterns: list of megate patterns, see
+            process_megate_config.read_megate_thresholds
+        to_skip_patterns: list of compiled regular expressions of features
+            that are ignored
+        emodel, fullmtype, etype: identify the combos
+        exemplar_scores: dict with the scores of the repaired exemplar of the
+            e-model, or None if skip_repaired_exemplar is set
+
+    Returns:
+        dict with keys 'feature_thresholds' (list of (compiled feature regex,
+        threshold)-tuples, of which the last matching one applies),
+        'to_skip_patterns' and 'exemplar_scores', or None if no me-gate
+        threshold applies to the combos.
+    """
+    if fullmtype is None or etype is None:
+        return None
+
+    feature_thresholds = [
+        (pattern['megate_feature_threshold']['features'],
+         pattern['megate_feature_threshold']['megate_threshold'])
+        for pattern in megate_patterns
+        if (pattern['emodel'].match(emodel) and
+            pattern['fullmtype'].match(fullmtype) and
+            pattern['etype'].match(etype))]
+    if not feature_thresholds:
+        return None
+
+    return {'feature_thresholds': feature_thresholds,
+            'to_skip_patterns': to_skip_patterns,
+            'exemplar_scores': exemplar_scores}
+
+
+def create_gates(scores_db_filename, early_stop_config):
+    """Create the gates of all the non-exemplar combos that still have to run.
+
+    Args:
+        scores_db_filename: path to .sqlite database
+        early_stop_config: dict created by read_early_stop_config
+
+    Returns:
+        A tuple:
+        - list of gates, indexed by gate id, see create_gate
+        - dict mapping (emodel, fullmtype, etype) to gate id, or to None if
+          the combos can't be stopped early
+    """
+    if early_stop_config['skip_repaired_exemplar']:
+        exemplar_scores = None
+    else:
+        exemplar_scores = read_exemplar_scores(scores_db_filename)
+
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        groups = scores_db.execute(
+            'SELECT DISTINCT emodel, fullmtype, etype FROM scores '
+            'WHERE to_run=1 AND is_exemplar=0').fetchall()
+    scores_db.close()
+
+    gates = []
+    gate_ids = {}
+    for emodel, fullmtype, etype in groups:
+        if exemplar_scores is None:
+            emodel_exemplar_scores = None
+        else:
+            emodel_exemplar_scores = exemplar_scores.get(emodel)
+            if emodel_exemplar_scores is None:
+                print('WARNING: no scores of the repaired exemplar of '
+                      'e-model %s, its combos will not be stopped early' %
+                      emodel)
+                gate_ids[(emodel, fullmtype, etype)] = None
+                continue
+
+        gate = create_gate(
+            early_stop_config['megate_patterns'],
+            early_stop_config['to_skip_patterns'],
+            emodel, fullmtype, etype,
+            exemplar_scores=emodel_exemplar_scores)
+        if gate is None:
+            gate_ids[(emodel, fullmtype, etype)] = None
+        else:
+            gate_ids[(emodel, fullmtype, etype)] = len(gates)
+            gates.append(gate)
+
+    return gates, gate_ids
+
+
+def get_score_bound(gate, feature):
+    """Return the highest score of a feature that passes a gate, or None if
+    the feature is not gated"""
+    if any(pattern.match(feature) for pattern in gate['to_skip_patterns']):
+        return None
+
+    threshold = None
+    for features_pattern, megate_threshold in gate['feature_thresholds']:
+        if features_pattern.match(feature):
+            threshold = megate_threshold
+    if threshold is None:
+        return None
+
+    if gate['exemplar_scores'] is None:
+        return threshold
+    elif gate['exemplar_scores'].get(feature) is None:
+        return None
+    else:
+        return max(threshold, threshold * gate['exemplar_scores'][feature])
+
+
+def check_gate(gate, scores):
+    """Check scores against a gate.
+
+    Args:
+        gate: dict created by create_gate
+        scores: dict mapping features to scores
+
+    Returns:
+        None if all scores pass the gate, otherwise a string describing the
+        first score that failed
+    """
+    for feature, score in scores.items():
+        bound = get_score_bound(gate, feature)
+        if bound is not None and score is not None and score > bound:
+            return 'Score %s of %s is above megate threshold %s' % (
+                score, feature, bound)
+    return None
+
+
+def order_protocols(protocol_names, protocol_costs):
+    """Order protocols cheapest-first. Protocols without known cost keep their
+    order and run after the others."""
+    return sorted(
+        protocol_names,
+        key=lambda name: (name not in protocol_costs,
+                          protocol_costs.get(name, 0.0)))
+
+
+def get_objective_recordings(objective):
+    """Return the set of recordings needed to score an objective, or None if
+    they can't be determined"""
+    if not hasattr(objective, 'features'):
+        return None
+    recordings = set()
+    for feature in objective.features:
+        recording_names = getattr(feature, 'recording_names', None)
+        if recording_names is None:
+            return None
+        recordings.update(recording_names.values())
+    return recordings
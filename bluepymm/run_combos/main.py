@@ -23,9 +23,25 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 
 import os
+import argparse
 
 from bluepymm import tools
-from . import calculate_scores
+from . import calculate_scores, early_stop
+
+
+def parse_shard(shard_str):
+    """Parse shard specification 'i/N' into a (shard_index, n_shards)-tuple,
+    with 0 <= i < N"""
+    try:
+        shard_index, n_shards = [int(value) for value in shard_str.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Shard should be specified as i/N, got %s' % shard_str)
+    if not 0 <= shard_index < n_shards:
+        raise argparse.ArgumentTypeError(
+            'Shard index should be in [0, %d), got %d' %
+            (n_shards, shard_index))
+    return shard_index, n_shards
 
 
 def add_parser(action):
@@ -43,10 +59,53 @@ def add_parser(action):
                         help='Timeout for ipyparallel clients')
     parser.add_argument('--n_processes', help='number of processes',
                         type=int)
+    parser.add_argument('--shard', type=parse_shard,
+                        help='Only run shard i/N of the me-combinations and '
+                        'save the results in a separate shard database, e.g. '
+                        '$SLURM_ARRAY_TASK_ID/$SLURM_ARRAY_TASK_COUNT. Use '
+                        '"bluepymm merge" to merge the shard results')
+    parser.add_argument('--claim', action='store_true',
+                        help='Claim batches of me-combinations dynamically '
+                        'from the scores database, so that any number of '
+                        'bluepymm run processes can share the work')
+    parser.add_argument('--batch_size', type=int, default=100,
+                        help='Number of me-combinations per claimed batch')
+    parser.add_argument('--lease_time', type=float, default=600,
+                        help='Time (in s) after which the batch of a worker '
+                        'that stopped responding can be claimed again')
+    parser.add_argument('--combo_timeout', type=float,
+                        help='Maximum wall-clock time (in s) of a '
+                        'me-combination, overrides "combo_timeout" of the '
+                        'configuration file')
+    parser.add_argument('--combo_max_rss', type=float,
+                        help='Maximum memory (resident set size in MB) of a '
+                        'me-combination, overrides "combo_max_rss" of the '
+                        'configuration file')
+    parser.add_argument('--early_stop', metavar='SELECT_CONF_FILENAME',
+                        help='Stop the protocols of a me-combination as soon '
+                        'as it fails the me-gate thresholds of this select '
+                        'configuration file, overrides '
+                        '"early_stop_select_config" of the configuration file')
+    parser.add_argument('--status_file',
+                        help='Append the progress reports to this file in '
+                        'JSON-lines format, overrides "status_file" of the '
+                        'configuration file')
+
+
+def add_merge_parser(action):
+    """Add parser for merging shard results"""
+    parser = action.add_parser(
+        'merge',
+        help='Merge results of sharded runs into the scores database')
+    parser.add_argument('conf_filename',
+                        help='path to configuration file')
 
 
 def run_combos_from_conf(conf_dict, ipyp=None, ipyp_profile=None, timeout=10,
-                         n_processes=None):
+                         n_processes=None, shard=None, claim=False,
+                         batch_size=100, lease_time=600, combo_timeout=None,
+                         combo_max_rss=None, early_stop_select_config=None,
+                         status_file=None):
     """Run combos from conf dictionary"""
     output_dir = conf_dict['output_dir']
     final_dict = tools.load_json(
@@ -64,6 +123,35 @@ def run_combos_from_conf(conf_dict, ipyp=None, ipyp_profile=None, timeout=10,
     else:
         use_apical_points = True
 
+    if combo_timeout is None:
+        combo_timeout = conf_dict.get('combo_timeout')
+    if combo_max_rss is None:
+        combo_max_rss = conf_dict.get('combo_max_rss')
+
+    if early_stop_select_config is None:
+        early_stop_select_config = conf_dict.get('early_stop_select_config')
+    if early_stop_select_config is not None:
+        print('Reading early stopping me-gate thresholds at %s' %
+              early_stop_select_config)
+        early_stop_config = early_stop.read_early_stop_config(
+            tools.load_json(early_stop_select_config))
+    else:
+        early_stop_config = None
+
+    # "synthetic_evaluator" can be true, or a dict with the arguments of
+    # synthetic.create
+    synthetic_evaluator = conf_dict.get('synthetic_evaluator', False)
+    if synthetic_evaluator:
+        if not isinstance(synthetic_evaluator, dict):
+            synthetic_evaluator = {}
+        print('WARNING: running all me-combos with a synthetic evaluator, '
+              'the scores are random')
+    else:
+        synthetic_evaluator = None
+
+    if status_file is None:
+        status_file = conf_dict.get('status_file')
+
     print('Calculating scores')
     calculate_scores.calculate_scores(
         final_dict,
@@ -73,14 +161,60 @@ def run_combos_from_conf(conf_dict, ipyp=None, ipyp_profile=None, timeout=10,
         ipyp_profile=ipyp_profile,
         timeout=timeout,
         use_apical_points=use_apical_points,
-        n_processes=n_processes)
-
-
-def run_combos(conf_filename, ipyp=None, ipyp_profile=None, n_processes=None):
+        n_processes=n_processes,
+        shard=shard,
+        claim=claim,
+        batch_size=batch_size,
+        lease_time=lease_time,
+        combo_timeout=combo_timeout,
+        combo_max_rss_mb=combo_max_rss,
+        early_stop=early_stop_config,
+        synthetic_evaluator=synthetic_evaluator,
+        progress_interval=conf_dict.get('progress_interval', 10.0),
+        status_filename=status_file)
+
+
+def run_combos(conf_filename, ipyp=None, ipyp_profile=None, n_processes=None,
+               shard=None, claim=False, batch_size=100, lease_time=600,
+               combo_timeout=None, combo_max_rss=None,
+               early_stop_select_config=None, status_file=None):
     """Run combos"""
 
     print('Reading configuration at %s' % conf_filename)
     conf_dict = tools.load_json(conf_filename)
 
     run_combos_from_conf(conf_dict, ipyp, ipyp_profile,
-                         n_processes=n_processes)
+                         n_processes=n_processes, shard=shard, claim=claim,
+                         batch_size=batch_size, lease_time=lease_time,
+                         combo_timeout=combo_timeout,
+                         combo_max_rss=combo_max_rss,
+                         early_stop_select_config=early_stop_select_config,
+                         status_file=status_file)
+
+
+def merge_combos_from_conf(conf_dict):
+    """Merge shard results into the scores database from conf dictionary"""
+    scores_db_path = os.path.abspath(conf_dict['scores_db'])
+
+    shard_db_paths = calculate_scores.find_shard_db_filenames(scores_db_path)
+    print('Found %d shard databases' % len(shard_db_paths))
+    n_merged = calculate_scores.merge_shard_scores(scores_db_path,
+                                                   shard_db_paths)
+    print('Merged results of %d me-combos' % n_merged)
+
+    n_left = calculate_scores.count_tasks(scores_db_path)
+    if n_left == 0:
+        print('Converting score json strings to scores values ...')
+        calculate_scores.expand_scores_to_score_values_table(scores_db_path)
+    else:
+        print('WARNING: %d me-combos still have to run, not converting '
+              'scores to score values' % n_left)
+
+
+def merge_combos(conf_filename):
+    """Merge shard results into the scores database"""
+
+    print('Reading configuration at %s' % conf_filename)
+    conf_dict = tools.load_json(conf_filename)
+
+    merge_combos_from_conf(conf_dict)
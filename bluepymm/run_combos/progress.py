@@ -0,0 +1,171 @@
+"""Progress, throughput and ETA reporting of the run step"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint: disable=C0325
+
+import sys
+import json
+import time
+import datetime
+import collections
+
+
+class ProgressReporter(object):
+
+    """Count the finished me-combinations and report the progress at most
+    once per interval"""
+
+    def __init__(self, interval=10.0, window=60.0, status_filename=None,
+                 worker=None):
+        """Constructor
+
+        Args:
+            interval: minimal time (in s) between two reports
+            window: the throughput is averaged over the combos that finished
+                during this time (in s)
+            status_filename: if not None, every report is appended to this
+                file as a line of JSON
+            worker: identifier of the worker, added to the status lines
+        """
+        self.interval = interval
+        self.window = window
+        self.status_filename = status_filename
+        self.worker = worker
+
+        self.n_tasks = 0
+        self.n_done = 0
+        self.n_errors = 0
+        self.n_stopped_early = 0
+        self.emodel_totals = collections.Counter()
+        self.emodel_done = collections.Counter()
+        self.start_time = time.time()
+        self.last_report_time = self.start_time
+        self._finish_times = collections.deque()
+
+    def add_tasks(self, emodel_counts):
+        """Add combos that have to run.
+
+        Args:
+            emodel_counts: dict mapping e-models to numbers of combos
+        """
+        self.emodel_totals.update(emodel_counts)
+        self.n_tasks += sum(emodel_counts.values())
+
+    def skip_task(self, emodel):
+        """Remove a combo that was added but doesn't have to run anymore"""
+        self.emodel_totals[emodel] -= 1
+        self.n_tasks -= 1
+
+    def update(self, emodel, exception_type=None, early_stop_reason=None,
+               now=None):
+        """Count a finished combo, and report if the last report is older
+        than the interval.
+
+        Args:
+            emodel: e-model of the combo
+            exception_type: exception type of the combo, None if it ran
+                successfully
+            early_stop_reason: reason of early stop of the combo, or None
+            now: current time, by default time.time()
+        """
+        now = time.time() if now is None else now
+        self.n_done += 1
+        self.emodel_done[emodel] += 1
+        if exception_type is not None:
+            self.n_errors += 1
+        if early_stop_reason is not None:
+            self.n_stopped_early += 1
+        self._finish_times.append(now)
+
+        if now - self.last_report_time >= self.interval:
+            self.report(now)
+
+    def throughput(self, now=None):
+        """Number of combos finished per second during the last window"""
+        now = time.time() if now is None else now
+        while self._finish_times and \
+                self._finish_times[0] < now - self.window:
+            self._finish_times.popleft()
+        elapsed = min(self.window, now - self.start_time)
+        if elapsed <= 0:
+            return 0.0
+        return len(self._finish_times) / elapsed
+
+    def status(self, now=None):
+        """Return a dict with the progress.
+
+        The dict has keys 'time', 'worker', 'n_done', 'n_tasks', 'n_errors',
+        'n_stopped_early', 'elapsed', 'throughput', 'eta' (in s, None if
+        unknown) and 'emodels', which maps e-models to (n_done,
+        n_tasks)-lists.
+        """
+        now = time.time() if now is None else now
+        throughput = self.throughput(now)
+        n_left = max(0, self.n_tasks - self.n_done)
+        return {'time': now,
+                'worker': self.worker,
+                'n_done': self.n_done,
+                'n_tasks': self.n_tasks,
+                'n_errors': self.n_errors,
+                'n_stopped_early': self.n_stopped_early,
+                'elapsed': now - self.start_time,
+                'throughput': throughput,
+                'eta': n_left / throughput if throughput > 0 else None,
+                'emodels': {emodel: [self.emodel_done[emodel], total]
+                            for emodel, total in self.emodel_totals.items()}}
+
+    def report(self, now=None):
+        """Print the progress and append it to the status file"""
+        status = self.status(now)
+        self.last_report_time = status['time']
+        print(format_status(status))
+        sys.stdout.flush()
+
+        if self.status_filename is not None:
+            with open(self.status_filename, 'a') as status_file:
+                status_file.write(json.dumps(status) + '\n')
+
+    def close(self):
+        """Report the final progress"""
+        self.report()
+
+
+def format_status(status):
+    """Format a status dict created by ProgressReporter.status as a line"""
+    n_done = status['n_done']
+    n_tasks = status['n_tasks']
+    line = 'Progress: %d/%d me-combos (%.1f%%), %.2f combos/s, ETA %s' % (
+        n_done, n_tasks, 100.0 * n_done / n_tasks if n_tasks else 100.0,
+        status['throughput'],
+        'unknown' if status['eta'] is None else
+        datetime.timedelta(seconds=int(round(status['eta']))))
+    line += ', %d errors (%.1f%%)' % (
+        status['n_errors'],
+        100.0 * status['n_errors'] / n_done if n_done else 0.0)
+    if status['n_stopped_early']:
+        line += ', %d stopped early' % status['n_stopped_early']
+    emodels = status['emodels']
+    line += ', %d/%d e-models complete' % (
+        sum(1 for done, total in emodels.values() if done >= total),
+        len(emodels))
+    return line
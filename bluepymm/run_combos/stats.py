@@ -0,0 +1,176 @@
+"""Summarise the resources used by the me-combinations"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+# pylint: disable=C0325
+
+import os
+import json
+import sqlite3
+
+import pandas
+
+from bluepymm import tools
+from . import calculate_scores
+
+
+def read_timings(scores_db_filename):
+    """Read the timings of the me-combinations that have run.
+
+    Args:
+        scores_db_filename: path to .sqlite database with scores table
+
+    Returns:
+        pandas dataframe with columns 'emodel', 'morph_name', 'exception' and
+        the result columns of the scores table. Returns an empty dataframe if
+        the scores table doesn't have result columns.
+    """
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        columns = [column[1] for column in
+                   scores_db.execute('PRAGMA table_info(scores)')]
+        result_columns = [column for column, _ in
+                          calculate_scores.RESULT_COLUMNS]
+        if not set(result_columns).issubset(columns):
+            return pandas.DataFrame(
+                columns=['emodel', 'morph_name', 'exception'] +
+                result_columns)
+        timings = pandas.read_sql(
+            'SELECT `index`, emodel, morph_name, exception, %s FROM scores '
+            'WHERE to_run=0 AND wall_time IS NOT NULL' %
+            ', '.join(result_columns), scores_db, index_col='index')
+
+    return timings
+
+
+def summarise_by(timings, column):
+    """Summarise the timings per value of a column.
+
+    Args:
+        timings: dataframe as returned by read_timings
+        column: column to group by, e.g. 'emodel' or 'morph_name'
+
+    Returns:
+        pandas dataframe indexed by the values of the column, with the number
+        of combos, the total, mean and maximal wall time, the maximal peak RSS
+        and the number of exceptions, sorted by decreasing total wall time
+    """
+    grouped = timings.groupby(column)
+    summary = pandas.DataFrame({
+        'n_combos': grouped['wall_time'].count(),
+        'total_wall_time': grouped['wall_time'].sum(),
+        'mean_wall_time': grouped['wall_time'].mean(),
+        'max_wall_time': grouped['wall_time'].max(),
+        'max_peak_rss_mb': grouped['peak_rss_mb'].max(),
+        'n_exceptions': grouped['exception'].count()})
+
+    return summary.sort_values('total_wall_time', ascending=False)
+
+
+def summarise_protocols(timings):
+    """Summarise the time spent per protocol.
+
+    Args:
+        timings: dataframe as returned by read_timings
+
+    Returns:
+        pandas dataframe indexed by protocol name, with the number of runs and
+        the total, mean and maximal time, sorted by decreasing total time
+    """
+    protocol_times = {}
+    for protocol_times_str in timings['protocol_times']:
+        for protocol_name, protocol_time in \
+                (json.loads(protocol_times_str) or {}).items():
+            protocol_times.setdefault(protocol_name, []).append(protocol_time)
+
+    summary = pandas.DataFrame(
+        [(protocol_name, len(values), sum(values),
+          sum(values) / len(values), max(values))
+         for protocol_name, values in protocol_times.items()],
+        columns=['protocol', 'n_runs', 'total_time', 'mean_time',
+                 'max_time']).set_index('protocol')
+
+    return summary.sort_values('total_time', ascending=False)
+
+
+def print_stats(scores_db_filename, n_top=10):
+    """Print a summary of the resources used by the me-combinations.
+
+    Args:
+        scores_db_filename: path to .sqlite database with scores table
+        n_top: number of e-models, morphologies, protocols and combos listed
+            in every table
+    """
+    timings = read_timings(scores_db_filename)
+    if len(timings) == 0:
+        print('No timings found in %s' % scores_db_filename)
+        return
+
+    print('Timings of %d me-combos run by %d workers' %
+          (len(timings), timings['worker'].nunique()))
+    print('Wall time (s): total %.1f, mean %.2f, median %.2f, max %.2f' %
+          (timings['wall_time'].sum(), timings['wall_time'].mean(),
+           timings['wall_time'].median(), timings['wall_time'].max()))
+    print('CPU time (s): total %.1f' % timings['cpu_time'].sum())
+    print('Peak RSS (MB): median %.1f, max %.1f' %
+          (timings['peak_rss_mb'].median(), timings['peak_rss_mb'].max()))
+    n_stopped_early = timings['early_stop_reason'].count()
+    if n_stopped_early > 0:
+        print('Stopped early: %d me-combos' % n_stopped_early)
+    exception_counts = timings['exception_type'].value_counts()
+    if len(exception_counts) > 0:
+        print('Failed me-combos: %s' %
+              ', '.join('%d %s' % (count, exception_type)
+                        for exception_type, count
+                        in exception_counts.items()))
+
+    with pandas.option_context('display.width', 200,
+                               'display.max_columns', 20):
+        print('\nE-models by total wall time:')
+        print(summarise_by(timings, 'emodel').head(n_top))
+        print('\nMorphologies by total wall time:')
+        print(summarise_by(timings, 'morph_name').head(n_top))
+        print('\nProtocols by total time:')
+        print(summarise_protocols(timings).head(n_top))
+        print('\nSlowest me-combos:')
+        print(timings.sort_values('wall_time', ascending=False)[
+            ['emodel', 'morph_name', 'wall_time', 'cpu_time', 'peak_rss_mb',
+             'worker']].head(n_top))
+
+
+def add_parser(action):
+    """Add parser"""
+    parser = action.add_parser(
+        'stats',
+        help='Summarise the resources used by the me-combinations')
+    parser.add_argument('conf_filename',
+                        help='path to configuration file')
+    parser.add_argument('--n_top', type=int, default=10,
+                        help='Number of entries listed per table')
+
+
+def stats_combos(conf_filename, n_top=10):
+    """Print the resources used by the me-combinations"""
+
+    print('Reading configuration at %s' % conf_filename)
+    conf_dict = tools.load_json(conf_filename)
+
+    print_stats(os.path.abspath(conf_dict['scores_db']), n_top=n_top)
@@ -0,0 +1,199 @@
+"""Synthetic cell evaluator to measure the overhead of the run step"""
+
+from __future__ import print_function
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""When the run configuration contains the key "synthetic_evaluator", the
+setup packages of the e-models are replaced by the evaluator of this module,
+which doesn't run NEURON. Its protocols only sleep, and its scores are drawn
+from a normal distribution. Everything else of the run step (workers,
+isolated processes, limits, database) runs as usual, so that its overhead can
+be measured and the number of workers can be tuned on any machine.
+
+The value of "synthetic_evaluator" is true, or a dict with the keyword
+arguments of create. The scores, latencies and failures of a combo only
+depend on its e-model, morphology and the seed.
+"""
+
+# pylint: disable=C0325
+
+import time
+import random
+
+
+class SyntheticFailure(Exception):
+
+    """Failure of a combo simulated by the synthetic evaluator"""
+
+
+class SyntheticMorphology(object):
+
+    """Morphology of which only the path is used"""
+
+    def __init__(self):
+        self.morphology_path = None
+
+
+class SyntheticCellModel(object):
+
+    """Cell model"""
+
+    def __init__(self):
+        self.morphology = SyntheticMorphology()
+
+
+class SyntheticProtocol(object):
+
+    """Protocol of which only the name is used"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class SyntheticFeature(object):
+
+    """Feature that uses the voltage recording of one protocol"""
+
+    def __init__(self, protocol_name):
+        self.recording_names = {'': '%s.soma.v' % protocol_name}
+
+
+class SyntheticObjective(object):
+
+    """Objective with a single feature"""
+
+    def __init__(self, name, evaluator):
+        self.name = name
+        self.features = [SyntheticFeature(name.split('.')[0])]
+        self.evaluator = evaluator
+
+    def calculate_score(self, responses):
+        """Calculate score"""
+        return self.evaluator.draw_score(self.name)
+
+
+class SyntheticFitnessCalculator(object):
+
+    """Fitness calculator"""
+
+    def __init__(self, objectives):
+        self.objectives = objectives
+
+    def calculate_scores(self, responses):
+        """Calculate the scores of all objectives"""
+        return {objective.name: objective.calculate_score(responses)
+                for objective in self.objectives}
+
+
+class SyntheticEvaluator(object):
+
+    """Cell evaluator with the interface used by run_emodel_morph"""
+
+    def __init__(self, etype, features, latency=0.0, latency_jitter=0.0,
+                 score_mean=0.0, score_sd=2.0, failure_rate=0.0, seed=0):
+        """Constructor
+
+        Args:
+            etype: e-model name
+            features: list of feature names. The part before the first dot is
+                the name of the protocol of a feature.
+            latency, latency_jitter, score_mean, score_sd, failure_rate,
+                seed: see create
+        """
+        self.etype = etype
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.score_mean = score_mean
+        self.score_sd = score_sd
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.cell_model = SyntheticCellModel()
+
+        self.fitness_protocols = {}
+        for feature in features:
+            protocol_name = feature.split('.')[0]
+            if protocol_name not in self.fitness_protocols:
+                self.fitness_protocols[protocol_name] = \
+                    SyntheticProtocol(protocol_name)
+        self.fitness_calculator = SyntheticFitnessCalculator(
+            [SyntheticObjective(feature, self) for feature in features])
+
+    def _random(self, *keys):
+        """Random number generator that only depends on the combo and keys"""
+        return random.Random(' '.join(
+            str(key) for key in (self.seed, self.etype,
+                                 self.cell_model.morphology.morphology_path) +
+            keys))
+
+    def draw_score(self, feature):
+        """Draw the score of a feature, scores are never negative"""
+        return abs(self._random('score', feature).gauss(self.score_mean,
+                                                        self.score_sd))
+
+    def run_protocols(self, protocols, param_values):
+        """Sleep for the latency of every protocol and return responses.
+
+        Raises:
+            SyntheticFailure for a fraction failure_rate of the combos, in the
+            first protocol that runs
+        """
+        responses = {'bpo_holding_current': -0.1,
+                     'bpo_threshold_current': 0.2}
+        morph_path = self.cell_model.morphology.morphology_path
+        if self._random('failure').random() < self.failure_rate:
+            raise SyntheticFailure('Synthetic failure of e-model %s on '
+                                   'morphology %s' % (self.etype, morph_path))
+        for protocol in protocols:
+            time.sleep(self.latency / len(self.fitness_protocols) *
+                       self._random('latency', protocol.name).uniform(
+                           1.0 - self.latency_jitter,
+                           1.0 + self.latency_jitter))
+            responses['%s.soma.v' % protocol.name] = None
+        return responses
+
+
+def create(etype, features=None, n_features=10, n_protocols=3, latency=0.0,
+           latency_jitter=0.0, score_mean=0.0, score_sd=2.0, failure_rate=0.0,
+           seed=0):
+    """Create a synthetic evaluator.
+
+    Args:
+        etype: e-model name
+        features: list of feature names, by default n_features features
+            spread over n_protocols protocols
+        n_features: number of features if features is None
+        n_protocols: number of protocols if features is None
+        latency: mean time (in s) that the protocols of a combo sleep
+        latency_jitter: the time of every protocol is uniformly distributed
+            within this fraction of its mean
+        score_mean, score_sd: mean and standard deviation of the normal
+            distribution of which the absolute values are the scores
+        failure_rate: fraction of the combos that raise an exception
+        seed: seed of the random number generators
+    """
+    if features is None:
+        features = ['Step%d.soma.feature%d' % (index % n_protocols + 1, index)
+                    for index in range(n_features)]
+
+    return SyntheticEvaluator(
+        etype, features, latency=latency, latency_jitter=latency_jitter,
+        score_mean=score_mean, score_sd=score_sd, failure_rate=failure_rate,
+        seed=seed)
@@ -0,0 +1,173 @@
+"""Aggregation of the selection results for the report"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""Every function computes its counts in a single groupby pass over the
+combos, the groups are ordered by their first appearance in the combos.
+"""
+
+# pylint: disable=C0325
+
+import collections
+
+import pandas
+
+
+class ResultAccumulator(object):
+
+    """Collect the parts of result tables and concatenate every table once"""
+
+    def __init__(self, names):
+        """Constructor
+
+        Args:
+            names: list of table names
+        """
+        self.parts = collections.OrderedDict((name, []) for name in names)
+
+    def add(self, **parts):
+        """Add parts, the keyword arguments map table names to
+        pandas.DataFrames"""
+        for name, part in parts.items():
+            self.parts[name].append(part)
+
+    def concat(self, name):
+        """Concatenate the parts of a table, preserving their indices.
+
+        Returns:
+            pandas.DataFrame, empty if no parts were added
+        """
+        if not self.parts[name]:
+            return pandas.DataFrame()
+        return pandas.concat(self.parts[name], axis=0)
+
+
+def metype_column(data_frame):
+    """Create the me-type of every row.
+
+    Args:
+        data_frame: pandas.DataFrame with columns 'etype' and 'fullmtype'
+
+    Returns:
+        pandas.Series with <etype>_<fullmtype>
+    """
+    return data_frame['etype'].astype(str) + '_' + \
+        data_frame['fullmtype'].astype(str)
+
+
+def morphology_label_column(data_frame):
+    """Create the morphology label of every row.
+
+    Args:
+        data_frame: pandas.DataFrame with columns 'morph_name', 'fullmtype',
+                    and 'etype'
+
+    Returns:
+        pandas.Series with <morph_name> (<fullmtype>, <etype>)
+    """
+    return data_frame['morph_name'].astype(str) + ' (' + \
+        data_frame['fullmtype'].astype(str) + ', ' + \
+        data_frame['etype'].astype(str) + ')'
+
+
+def count_passed_per_mtype(fullmtypes, megate_scores):
+    """Count the passed and failed combos per m-type.
+
+    Args:
+        fullmtypes: pandas.Series with m-types, one entry per run combo
+        megate_scores: pandas.DataFrame with megate scores and column
+            'Passed all', one entry per run combo
+
+    Returns:
+        pandas.DataFrame with m-types as index and columns 'passed' and
+        'failed'
+    """
+    grouped = megate_scores['Passed all'].astype(bool).groupby(
+        fullmtypes, sort=False)
+    sums = pandas.DataFrame({'passed': grouped.sum()})
+    sums['failed'] = grouped.size() - sums['passed']
+    sums.index.name = None
+    return sums
+
+
+def count_results_per_group(data, final_db, key, labels=None):
+    """Count the passed, error and failed non-exemplar combos per value of a
+    column.
+
+    Args:
+        data: pandas.DataFrame with data on run combos, with columns
+            'is_exemplar', 'exception' and key
+        final_db: pandas.DataFrame with data on selected combos, with column
+            key
+        key: column name of the groups
+        labels: optional pandas.Series with the label of every row of data.
+            The label of the first combo of a group is used as index.
+
+    Returns:
+        pandas.DataFrame with columns 'passed', 'error' and 'failed'
+    """
+    non_exemplars = data[data['is_exemplar'] == 0]
+    grouped = non_exemplars.groupby(key, sort=False)
+    nb_combos = grouped.size()
+    nb_errors = grouped['exception'].count()
+    nb_matches = final_db[key].value_counts().reindex(nb_combos.index,
+                                                      fill_value=0)
+
+    sums = pandas.DataFrame({'passed': nb_matches,
+                             'error': nb_errors,
+                             'failed': nb_combos - nb_matches - nb_errors},
+                            columns=['passed', 'error', 'failed'])
+    if labels is not None:
+        first_labels = labels.loc[non_exemplars.index].groupby(
+            non_exemplars[key], sort=False).first()
+        sums.index = first_labels.loc[sums.index].values
+    sums.index.name = None
+    return sums
+
+
+def count_results_per_morphology(data, final_db):
+    """Count the passed, error and failed non-exemplar combos per morphology.
+
+    Args:
+        data: pandas.DataFrame with data on run combos
+        final_db: pandas.DataFrame with data on selected combos
+
+    Returns:
+        pandas.DataFrame indexed by morphology label, see
+        count_results_per_group
+    """
+    return count_results_per_group(data, final_db, 'morph_name',
+                                   labels=morphology_label_column(data))
+
+
+def count_results_per_metype(data, final_db):
+    """Count the passed, error and failed non-exemplar combos per me-type.
+
+    Args:
+        data: pandas.DataFrame with data on run combos
+        final_db: pandas.DataFrame with data on selected combos
+
+    Returns:
+        pandas.DataFrame indexed by me-type, see count_results_per_group
+    """
+    return count_results_per_group(
+        data.assign(metype=metype_column(data)),
+        final_db.assign(metype=metype_column(final_db)),
+        'metype')
@@ -25,30 +25,36 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import os
 
-from bluepymm import tools
+from bluepymm import tools, profiling
 
-from . import sqlite_io, reporting, megate_output
+from . import sqlite_io, reporting, megate_output, mecombo_release
+from . import threshold_sweep
 from . import process_megate_config as proc_config
 
 
-def select_combos(conf_filename, n_processes):
+def select_combos(conf_filename, n_processes, sweep_only=False):
     """Parse conf file and run select combos"""
     # Parse configuration file
     conf_dict = tools.load_json(conf_filename)
 
-    select_combos_from_conf(conf_dict, n_processes)
+    select_combos_from_conf(conf_dict, n_processes, sweep_only=sweep_only)
 
 
-def select_combos_from_conf(conf_dict, n_processes=None):
+def select_combos_from_conf(conf_dict, n_processes=None, sweep_only=False):
     """Compare scores of me-combinations to thresholds, select successful
     combinations, and write results out to file.
 
+    If the configuration contains 'threshold_sweep', the pass rates of its
+    grid of thresholds are written to threshold_sweep.csv as well.
+
     Args:
         conf_filename: filename of configuration (.json file)
         n_processes: integer number of processes, `None` will use all of them
+        sweep_only: only write the threshold sweep, skip the selection
     """
     scores_db_filename = conf_dict['scores_db']
-    pdf_filename = conf_dict['pdf_filename']
+    write_report = conf_dict.get('write_report', True)
+    pdf_filename = conf_dict['pdf_filename'] if write_report else None
     output_dir = conf_dict['output_dir']
 
     print('Reading configuration files')
@@ -66,46 +72,78 @@ def select_combos_from_conf(conf_dict, n_processes=None):
 
     print('Reading tables from sqlite')
     # read score tables
-    scores, score_values = sqlite_io.read_and_process_sqlite_score_tables(
-        scores_db_filename)
+    with profiling.stage('read score tables'):
+        scores, score_values = \
+            sqlite_io.read_and_process_sqlite_score_tables(scores_db_filename)
 
     print('Checking if all combos have run')
     tools.check_all_combos_have_run(scores, scores_db_filename)
 
-    print('Start creation of ext_neurondb')
-    # create final database and write report
-    ext_neurondb = \
-        reporting.create_final_db_and_write_report(
-            pdf_filename,
-            to_skip_features,
-            to_skip_patterns,
-            megate_thresholds,
-            megate_patterns,
-            conf_dict.get('skip_repaired_exemplar', False),
-            conf_dict.get('check_opt_scores', True),
-            scores, score_values,
-            conf_dict.get('plot_emodels_per_morphology', False),
-            output_dir,
-            select_perc_best,
-            n_processes=n_processes)
-    print('Wrote pdf to %s' % os.path.abspath(pdf_filename))
-
-    # write output files
+    if 'threshold_sweep' in conf_dict:
+        with profiling.stage('threshold sweep'):
+            threshold_sweep.write_threshold_sweep(
+                output_dir, scores, score_values, to_skip_patterns,
+                megate_patterns,
+                conf_dict.get('skip_repaired_exemplar', False),
+                conf_dict['threshold_sweep'])
+    elif sweep_only:
+        raise ValueError('No threshold_sweep in the select configuration')
+    if sweep_only:
+        return
+
+    # the rows of the final database are sorted while they are created
     compliant = conf_dict.get('make_names_neuron_compliant', False)
-    extneurondb_path, mecombo_emodel_path = \
-        megate_output.save_megate_results(
-            ext_neurondb,
+    with megate_output.MegateResultsWriter(
             output_dir,
             sort_key='combo_name',
-            make_names_neuron_compliant=compliant)
+            make_names_neuron_compliant=compliant,
+            sort_buffer_rows=conf_dict.get(
+                'sort_buffer_rows',
+                megate_output.SORT_BUFFER_ROWS)) as results_writer:
+
+        print('Start creation of ext_neurondb')
+        # create final database and write report
+        with profiling.stage('create final db and report'):
+            reporting.create_final_db_and_write_report(
+                pdf_filename,
+                to_skip_features,
+                to_skip_patterns,
+                megate_thresholds,
+                megate_patterns,
+                conf_dict.get('skip_repaired_exemplar', False),
+                conf_dict.get('check_opt_scores', True),
+                scores, score_values,
+                conf_dict.get('plot_emodels_per_morphology', False),
+                output_dir,
+                select_perc_best,
+                n_processes=n_processes,
+                write_report=write_report,
+                results_writer=results_writer)
+        if write_report:
+            print('Wrote pdf to %s' % os.path.abspath(pdf_filename))
+
+        # write output files
+        with profiling.stage('save megate results'):
+            extneurondb_path, mecombo_emodel_path = results_writer.close()
+
+    # indexed binary copy of mecombo_emodel.tsv, only on request since the
+    # whole table is loaded in memory
+    mecombo_release_h5_path = None
+    if conf_dict.get('write_mecombo_release_h5', False):
+        with profiling.stage('write mecombo release h5'):
+            mecombo_release_h5_path = mecombo_release.write_mecombo_release(
+                mecombo_release.read_mecombo_emodel_tsv(mecombo_emodel_path),
+                os.path.join(output_dir, 'mecombo_release.h5'))
 
     emodels_hoc_path = conf_dict['emodels_hoc_dir']
 
-    megate_output.write_mecomboreleasejson(
-        output_dir,
-        emodels_hoc_path,
-        extneurondb_path,
-        mecombo_emodel_path)
+    with profiling.stage('write mecombo release'):
+        megate_output.write_mecomboreleasejson(
+            output_dir,
+            emodels_hoc_path,
+            extneurondb_path,
+            mecombo_emodel_path,
+            mecombo_release_h5_path=mecombo_release_h5_path)
 
 
 def add_parser(action):
@@ -116,3 +154,6 @@ def add_parser(action):
     parser.add_argument('conf_filename')
     parser.add_argument('--n_processes', help='number of processes',
                         type=int)
+    parser.add_argument('--sweep_only', action='store_true',
+                        help='only write the pass rates of the threshold '
+                        'sweep of the configuration, skip the selection')
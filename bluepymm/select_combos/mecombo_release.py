@@ -0,0 +1,270 @@
+"""Indexed HDF5 release of the selected me-combinations"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""The release contains the rows of mecombo_emodel.tsv, sorted by combo_name:
+
+    /columns/combo_name                 strings
+    /columns/<name>/categories          sorted unique strings
+    /columns/<name>/codes               index of every row in the categories
+    /columns/threshold_current          floats, NaN if unknown
+    /columns/holding_current            floats, NaN if unknown
+    /index/<key>/keys                   sorted key of every row
+    /index/<key>/rows                   row of every sorted key
+
+where <name> is one of morph_name, layer, fullmtype, etype and emodel, and
+<key> is morph_name or metype. The key of metype is
+
+    fullmtype code * number of etype categories + etype code
+
+Since every dataset that is searched is sorted, MEComboRelease finds combos
+with binary searches that read O(log n) values from the file.
+"""
+
+# pylint: disable=C0325
+
+import h5py
+import numpy
+import pandas
+
+
+VERSION = '1.0'
+CATEGORICAL_COLUMNS = ['morph_name', 'layer', 'fullmtype', 'etype', 'emodel']
+CURRENT_COLUMNS = ['threshold_current', 'holding_current']
+# Number of categories above which all categories are read at once
+MAX_CATEGORY_READS = 1000
+COLUMNS = ['morph_name', 'layer', 'fullmtype', 'etype', 'emodel',
+           'combo_name', 'threshold_current', 'holding_current']
+
+
+def read_mecombo_emodel_tsv(mecombo_emodel_path):
+    """Read mecombo_emodel.tsv.
+
+    Returns:
+        pandas.DataFrame with string columns, and float columns
+        'threshold_current' and 'holding_current'
+    """
+    data = pandas.read_csv(mecombo_emodel_path, sep='\t', dtype=str,
+                           keep_default_na=False)
+    for column in CURRENT_COLUMNS:
+        data[column] = pandas.to_numeric(data[column], errors='coerce')
+    return data
+
+
+def _write_index(group, keys):
+    """Write the sorted keys and their rows"""
+    rows = numpy.argsort(keys, kind='mergesort')
+    group['keys'] = keys[rows]
+    group['rows'] = rows
+
+
+def write_mecombo_release(extneurondb, release_path):
+    """Write the indexed HDF5 release.
+
+    Args:
+        extneurondb: pandas.DataFrame with the columns of mecombo_emodel.tsv
+        release_path: path of the HDF5 file
+    """
+    string_dtype = h5py.string_dtype('utf-8')
+    extneurondb = extneurondb.sort_values(
+        'combo_name', kind='mergesort').reset_index(drop=True)
+
+    with h5py.File(release_path, 'w') as release:
+        release.attrs['version'] = VERSION
+        release.attrs['n_combos'] = len(extneurondb)
+
+        columns = release.create_group('columns')
+        columns.create_dataset(
+            'combo_name', data=extneurondb['combo_name'].astype(str).values,
+            dtype=string_dtype)
+        codes = {}
+        for column in CATEGORICAL_COLUMNS:
+            categories, codes[column] = numpy.unique(
+                extneurondb[column].astype(str).values, return_inverse=True)
+            codes[column] = codes[column].astype(numpy.int64)
+            group = columns.create_group(column)
+            group.create_dataset('categories', data=categories.astype(object),
+                                 dtype=string_dtype)
+            group['codes'] = codes[column]
+        for column in CURRENT_COLUMNS:
+            columns[column] = pandas.to_numeric(
+                extneurondb[column]).values.astype(float)
+
+        index = release.create_group('index')
+        _write_index(index.create_group('morph_name'), codes['morph_name'])
+        n_etypes = len(columns['etype/categories'])
+        _write_index(index.create_group('metype'),
+                     codes['fullmtype'] * n_etypes + codes['etype'])
+
+    print('Wrote mecombo release to %s' % release_path)
+    return release_path
+
+
+def _bisect(dataset, value, side='left', decode=False):
+    """Binary search in a sorted dataset, reading O(log n) values.
+
+    Args:
+        dataset: sorted h5py dataset
+        value: value to search
+        side: 'left' for the first position where value can be inserted,
+            'right' for the last one
+        decode: decode the strings of the dataset
+
+    Returns:
+        insertion position
+    """
+    low, high = 0, len(dataset)
+    while low < high:
+        middle = (low + high) // 2
+        item = dataset[middle]
+        if decode:
+            item = item.decode('utf-8')
+        if item < value or (side == 'right' and item == value):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class MEComboRelease(object):
+
+    """Reader of the indexed HDF5 release"""
+
+    def __init__(self, release_path):
+        """Constructor
+
+        Args:
+            release_path: path of the HDF5 file written by
+                write_mecombo_release
+        """
+        self.release = h5py.File(release_path, 'r')
+        self.columns = self.release['columns']
+        self.index = self.release['index']
+        self._categories = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the file"""
+        self.release.close()
+
+    def __len__(self):
+        return int(self.release.attrs['n_combos'])
+
+    def categories(self, column):
+        """Sorted unique values of a categorical column"""
+        if column not in self._categories:
+            self._categories[column] = \
+                self.columns[column]['categories'].asstr()[()]
+        return self._categories[column]
+
+    def _code(self, column, value):
+        """Code of a value of a categorical column, None if unknown"""
+        categories = self.columns[column]['categories']
+        position = _bisect(categories, value, decode=True)
+        if position < len(categories) and \
+                categories[position].decode('utf-8') == value:
+            return position
+        return None
+
+    def _decode(self, column, codes):
+        """Values of the codes of a categorical column. Only the categories
+        of the codes are read, unless there are many."""
+        unique_codes, inverse = numpy.unique(codes, return_inverse=True)
+        if len(unique_codes) > MAX_CATEGORY_READS:
+            return self.categories(column)[codes]
+        categories = self.columns[column]['categories'].asstr()[
+            unique_codes]
+        return numpy.asarray(categories, dtype=object)[inverse]
+
+    def _rows(self, rows):
+        """Read the given rows as a pandas.DataFrame"""
+        rows = numpy.sort(numpy.asarray(rows, dtype=numpy.int64))
+        if len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows):
+            # contiguous rows are read as a slice
+            selection = slice(rows[0], rows[-1] + 1)
+        else:
+            selection = rows
+
+        data = {}
+        for column in COLUMNS:
+            if len(rows) == 0:
+                values = []
+            elif column in CATEGORICAL_COLUMNS:
+                values = self._decode(column,
+                                      self.columns[column]['codes'][selection])
+            elif column == 'combo_name':
+                values = self.columns[column].asstr()[selection]
+            else:
+                values = self.columns[column][selection]
+            data[column] = values
+        return pandas.DataFrame(data, columns=COLUMNS, index=rows)
+
+    def _find(self, key, value):
+        """Rows of which the index key equals value"""
+        keys = self.index[key]['keys']
+        start = _bisect(keys, value)
+        end = _bisect(keys, value, side='right')
+        return self._rows(self.index[key]['rows'][start:end])
+
+    def get_combo(self, combo_name):
+        """Find a combo by name.
+
+        Returns:
+            dict with the columns of the combo, None if it doesn't exist
+        """
+        combo_names = self.columns['combo_name']
+        position = _bisect(combo_names, combo_name, decode=True)
+        if position < len(combo_names) and \
+                combo_names[position].decode('utf-8') == combo_name:
+            return self._rows([position]).iloc[0].to_dict()
+        return None
+
+    def find_by_morph_name(self, morph_name):
+        """Find the combos of a morphology.
+
+        Returns:
+            pandas.DataFrame with the combos, indexed by row
+        """
+        code = self._code('morph_name', morph_name)
+        if code is None:
+            return self._rows([])
+        return self._find('morph_name', code)
+
+    def find_by_metype(self, fullmtype, etype):
+        """Find the combos of a me-type.
+
+        Returns:
+            pandas.DataFrame with the combos, indexed by row
+        """
+        mtype_code = self._code('fullmtype', fullmtype)
+        etype_code = self._code('etype', etype)
+        if mtype_code is None or etype_code is None:
+            return self._rows([])
+        n_etypes = len(self.columns['etype']['categories'])
+        return self._find('metype', mtype_code * n_etypes + etype_code)
+
+    def to_dataframe(self):
+        """Read all combos as a pandas.DataFrame"""
+        return self._rows(numpy.arange(len(self)))
@@ -24,25 +24,239 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 
 import os
+import heapq
+import pickle
+import shutil
+import tempfile
+
+import pandas
+
 from bluepymm import tools
 from . import table_processing
 
 
-def _write_extneurondbdat(extneurondb, filename):
-    """Write extneurondb.dat"""
-    pure_extneuron_db = extneurondb.copy()
+# Columns of extneurondb.dat and mecombo_emodel.tsv
+EXTNEURONDB_COLUMNS = ['morph_name', 'layer', 'fullmtype', 'etype',
+                       'combo_name']
+MECOMBO_EMODEL_COLUMNS = ['morph_name', 'layer', 'fullmtype', 'etype',
+                          'emodel', 'combo_name', 'threshold_current',
+                          'holding_current']
+
+# Default number of rows that MegateResultsWriter sorts in memory
+SORT_BUFFER_ROWS = 1000000
 
-    # Select the correct columns
-    column_order = ['morph_name', 'layer', 'fullmtype', 'etype', 'combo_name']
-    # pure_extneuron_db = pure_extneuron_db[column_order]
-    pure_extneuron_db.to_csv(
+
+def _write_extneurondbdat(extneurondb, filename):
+    """Write extneurondb.dat to a path or an open file"""
+    extneurondb.to_csv(
         filename,
         sep=' ',
-        columns=column_order,
+        columns=EXTNEURONDB_COLUMNS,
         index=False,
         header=False)
 
 
+def _warn_null_extra_values(extneurondb):
+    """Print a warning for rows without holding or threshold current"""
+    for extra_values_key in ['holding_current', 'threshold_current']:
+        null_rows = extneurondb[extra_values_key].isnull()
+        if null_rows.sum() > 0:
+            # TODO reenable this for release !
+            # raise ValueError(
+            #    "There are rows with None for "
+            #    "holding current: %s" % str(
+            #        extneurondb[null_rows]))
+            print("WARNING ! There are rows with None for "
+                  "holding current: %s" % str(extneurondb[null_rows]))
+
+
+def _csv_lines(data_frame, sep, columns):
+    """Format the rows of a pandas.DataFrame like to_csv, without header"""
+    return data_frame.to_csv(sep=sep, columns=columns, index=False,
+                             header=False).splitlines()
+
+
+def _read_run(run_path):
+    """Iterate over the rows of a sorted run written by
+    MegateResultsWriter"""
+    with open(run_path, 'rb') as run_file:
+        while True:
+            try:
+                yield pickle.load(run_file)
+            except EOFError:
+                return
+
+
+class MegateResultsWriter(object):
+
+    """Write the results of megating from chunks of the extended neuron
+    database, e.g. one chunk per e-model.
+
+    If the rows are sorted, up to sort_buffer_rows rows are kept in memory.
+    Larger databases are sorted in runs that are written to a temporary
+    directory in output_dir, and the runs are merged into the output files
+    by close. Used as a context manager, the runs are removed if an exception
+    happens before close.
+    """
+
+    def __init__(self, output_dir,
+                 extneurondb_filename='extneurondb.dat',
+                 mecombo_emodel_filename='mecombo_emodel.tsv',
+                 sort_key=None,
+                 make_names_neuron_compliant=False,
+                 extra_value_errors=True,
+                 sort_buffer_rows=SORT_BUFFER_ROWS):
+        """Constructor
+
+        Args:
+            output_dir, extneurondb_filename, mecombo_emodel_filename,
+            sort_key, make_names_neuron_compliant, extra_value_errors: see
+                save_megate_results
+            sort_buffer_rows: maximal number of rows sorted in memory
+        """
+        self.output_dir = tools.makedirs(output_dir)
+        self.extneurondb_path = os.path.join(output_dir, extneurondb_filename)
+        self.mecombo_emodel_path = os.path.join(output_dir,
+                                                mecombo_emodel_filename)
+        self.sort_key = sort_key
+        self.make_names_neuron_compliant = make_names_neuron_compliant
+        self.extra_value_errors = extra_value_errors
+        self.sort_buffer_rows = sort_buffer_rows
+
+        self.log_path = os.path.join(output_dir, 'log_neuron_compliance.csv')
+        self.n_chunks = 0
+        self._buffer = []
+        self._n_buffered_rows = 0
+        self._runs_dir = None
+        self._run_paths = []
+
+        if sort_key is None:
+            # without sorting, the chunks are appended to the output files
+            pandas.DataFrame(columns=MECOMBO_EMODEL_COLUMNS).to_csv(
+                self.mecombo_emodel_path, sep='\t', index=False)
+            open(self.extneurondb_path, 'w').close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self.abort()
+
+    def abort(self):
+        """Remove the sorted runs, without writing the output files"""
+        if self._runs_dir is not None:
+            shutil.rmtree(self._runs_dir, ignore_errors=True)
+        self._runs_dir = None
+        self._run_paths = []
+        self._buffer = []
+        self._n_buffered_rows = 0
+
+    def add(self, extneurondb):
+        """Add a chunk of the extended neuron database.
+
+        Args:
+            extneurondb: pandas.DataFrame with result of me-gating
+        """
+        if len(extneurondb) == 0:
+            return
+
+        if self.make_names_neuron_compliant:
+            extneurondb = extneurondb.copy()
+            table_processing.process_combo_name(
+                extneurondb, self.log_path, append=self.n_chunks > 0)
+        self.n_chunks += 1
+
+        if self.extra_value_errors:
+            _warn_null_extra_values(extneurondb)
+
+        if self.sort_key is None:
+            with open(self.extneurondb_path, 'a') as extneurondb_file:
+                _write_extneurondbdat(extneurondb, extneurondb_file)
+            extneurondb.to_csv(self.mecombo_emodel_path, sep='\t',
+                               columns=MECOMBO_EMODEL_COLUMNS, index=False,
+                               header=False, mode='a')
+            return
+
+        self._buffer.append(extneurondb)
+        self._n_buffered_rows += len(extneurondb)
+        if self._n_buffered_rows >= self.sort_buffer_rows:
+            self._spill()
+
+    def _sorted_buffer(self):
+        """Concatenate and sort the buffered chunks"""
+        if not self._buffer:
+            return pandas.DataFrame(columns=MECOMBO_EMODEL_COLUMNS)
+        data = pandas.concat(self._buffer, axis=0)
+        self._buffer = []
+        self._n_buffered_rows = 0
+        return data.sort_values(self.sort_key,
+                                kind='mergesort').reset_index(drop=True)
+
+    def _sort_keys(self, data):
+        """Values of the sort key of every row"""
+        if isinstance(self.sort_key, str):
+            return data[self.sort_key].tolist()
+        return list(zip(*[data[key].tolist() for key in self.sort_key]))
+
+    def _spill(self):
+        """Write the buffered chunks as a sorted run to disk"""
+        data = self._sorted_buffer()
+        if self._runs_dir is None:
+            self._runs_dir = tempfile.mkdtemp(prefix='sorted_runs_',
+                                              dir=self.output_dir)
+        run_path = os.path.join(self._runs_dir,
+                                'run_%06d.pickle' % len(self._run_paths))
+        with open(run_path, 'wb') as run_file:
+            for row in zip(self._sort_keys(data),
+                           _csv_lines(data, ' ', EXTNEURONDB_COLUMNS),
+                           _csv_lines(data, '\t', MECOMBO_EMODEL_COLUMNS)):
+                pickle.dump(row, run_file, pickle.HIGHEST_PROTOCOL)
+        self._run_paths.append(run_path)
+
+    def close(self):
+        """Write the remaining rows and finish the output files.
+
+        Returns:
+            tuple with the paths of extneurondb.dat and mecombo_emodel.tsv
+        """
+        if self.sort_key is not None and not self._run_paths:
+            # everything fits in memory
+            data = self._sorted_buffer()
+            _write_extneurondbdat(data, self.extneurondb_path)
+            data.to_csv(self.mecombo_emodel_path, sep='\t',
+                        columns=MECOMBO_EMODEL_COLUMNS, index=False)
+        elif self.sort_key is not None:
+            if self._buffer:
+                self._spill()
+            print('Merging %d sorted runs' % len(self._run_paths))
+            try:
+                self._merge_runs()
+            finally:
+                self.abort()
+
+        print(
+            'Wrote extneurondb.dat to {}'.format(
+                os.path.abspath(self.extneurondb_path)))
+        print(
+            'Wrote mecombo_emodel tsv to {}'.format(
+                os.path.abspath(self.mecombo_emodel_path)))
+
+        return self.extneurondb_path, self.mecombo_emodel_path
+
+    def _merge_runs(self):
+        """K-way merge of the sorted runs into the output files"""
+        with open(self.extneurondb_path, 'w') as extneurondb_file, \
+                open(self.mecombo_emodel_path, 'w') as mecombo_emodel_file:
+            mecombo_emodel_file.write(
+                '\t'.join(MECOMBO_EMODEL_COLUMNS) + '\n')
+            runs = [_read_run(run_path) for run_path in self._run_paths]
+            for _, extneurondb_line, mecombo_emodel_line in heapq.merge(
+                    *runs, key=lambda row: row[0]):
+                extneurondb_file.write(extneurondb_line + '\n')
+                mecombo_emodel_file.write(mecombo_emodel_line + '\n')
+
+
 def save_megate_results(extneurondb, output_dir,
                         extneurondb_filename='extneurondb.dat',
                         mecombo_emodel_filename='mecombo_emodel.tsv',
@@ -69,68 +283,40 @@ def save_megate_results(extneurondb, output_dir,
                                      is False. If set to True, a log file with
                                      the conversion info is written out to
                                      <output_dir>/log_neuron_compliance.csv
-    """
-    tools.makedirs(output_dir)
-
-    if make_names_neuron_compliant:
-        log_filename = 'log_neuron_compliance.csv'
-        log_path = os.path.join(output_dir, log_filename)
-        table_processing.process_combo_name(extneurondb, log_path)
-
-    if sort_key is not None:
-        extneurondb = extneurondb.sort_values(sort_key).reset_index(drop=True)
-
-    extneurondb_path = os.path.join(output_dir, extneurondb_filename)
-    _write_extneurondbdat(extneurondb, extneurondb_path)
-    print(
-        'Wrote extneurondb.dat to {}'.format(
-            os.path.abspath(extneurondb_path)))
-
-    mecombo_emodel_path = os.path.join(output_dir, mecombo_emodel_filename)
-
-    if extra_value_errors:
-        for extra_values_key in ['holding_current', 'threshold_current']:
-            null_rows = extneurondb[extra_values_key].isnull()
-            if null_rows.sum() > 0:
-                # TODO reenable this for release !
-                # raise ValueError(
-                #    "There are rows with None for "
-                #    "holding current: %s" % str(
-                #        extneurondb[null_rows]))
-                print("WARNING ! There are rows with None for "
-                      "holding current: %s" % str(extneurondb[null_rows]))
-
-    extneurondb.to_csv(
-        mecombo_emodel_path,
-        columns=[
-            'morph_name',
-            'layer',
-            'fullmtype',
-            'etype',
-            'emodel',
-            'combo_name',
-            'threshold_current',
-            'holding_current'],
-        sep='\t',
-        index=False)
-    print(
-        'Wrote mecombo_emodel tsv to {}'.format(
-            os.path.abspath(mecombo_emodel_path)))
+        extra_value_errors: boolean indicating whether to warn about rows
+                            without holding or threshold current
 
-    return extneurondb_path, mecombo_emodel_path
+    Returns:
+        tuple with the paths of extneurondb.dat and mecombo_emodel.tsv. See
+        MegateResultsWriter to write the results from chunks.
+    """
+    writer = MegateResultsWriter(
+        output_dir,
+        extneurondb_filename=extneurondb_filename,
+        mecombo_emodel_filename=mecombo_emodel_filename,
+        sort_key=sort_key,
+        make_names_neuron_compliant=make_names_neuron_compliant,
+        extra_value_errors=extra_value_errors,
+        sort_buffer_rows=len(extneurondb) + 1)
+    writer.add(extneurondb)
+    return writer.close()
 
 
 def write_mecomboreleasejson(
         output_dir,
         emodels_hoc_path,
         extneurondb_path,
-        mecombo_emodel_path):
+        mecombo_emodel_path,
+        mecombo_release_h5_path=None):
     """Write json file contain info about release"""
 
     output_paths = {}
     output_paths['emodels_hoc'] = os.path.abspath(emodels_hoc_path)
     output_paths['extneurondb.dat'] = os.path.abspath(extneurondb_path)
     output_paths['mecombo_emodel.tsv'] = os.path.abspath(mecombo_emodel_path)
+    if mecombo_release_h5_path is not None:
+        output_paths['mecombo_release.h5'] = os.path.abspath(
+            mecombo_release_h5_path)
     release = {'version': '1.0', 'output_paths': output_paths}
     tools.write_json(
         output_dir,
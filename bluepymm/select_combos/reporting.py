@@ -24,9 +24,13 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 # pylama: ignore=E402
 
 import os
+import shutil
+import tempfile
+import multiprocessing
 
 import pandas
 import numpy
+import pypdf
 
 import matplotlib
 matplotlib.use('Agg')
@@ -34,8 +38,8 @@ from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 plt.style.use('ggplot')
 
-from . import table_processing
-from bluepymm import tools
+from . import table_processing, aggregation
+from bluepymm import tools, profiling
 
 
 BLUE = 'C1'
@@ -65,8 +69,10 @@ def add_plot_to_report(pp, plot_function, *args):
         plot_function: function that returns figure
         args: arguments to plot_function
     """
-    fig = plot_function(*args)
-    pp.savefig(fig, bbox_inches='tight')
+    with profiling.stage(plot_function.__name__):
+        fig = plot_function(*args)
+    with profiling.stage('save figures'):
+        pp.savefig(fig, bbox_inches='tight')
     plt.close()
 
 
@@ -170,13 +176,7 @@ def plot_morphs_per_mtype_for_emodel(emodel, fullmtypes, megate_scores):
         Figure with plot of stacked bars. Passed and failed simulations are
         colored blue and red, respectively.
     """
-    sums = pandas.DataFrame()
-    for mtype in fullmtypes.unique():
-        megate_scores_mtype = megate_scores[fullmtypes == mtype]
-        mtype_passed = megate_scores_mtype[megate_scores_mtype['Passed all']]
-        sums.loc[mtype, 'passed'] = len(mtype_passed)
-        sums.loc[mtype, 'failed'] = (len(megate_scores_mtype) -
-                                     sums.loc[mtype, 'passed'])
+    sums = aggregation.count_passed_per_mtype(fullmtypes, megate_scores)
 
     return plot_stacked_bars(
         sums, '# morphologies', '',
@@ -212,20 +212,7 @@ def plot_emodels_per_morphology(data, final_db):
         Figure with plot of stacked bars. Simulations that passed, threw an
         error, and failed are colored blue, yellow and red, respectively.
     """
-    sums = pandas.DataFrame()
-    non_exemplars = data[data['is_exemplar'] == 0]
-    for morph_name in non_exemplars['morph_name'].unique():
-        nb_matches = len(final_db[final_db['morph_name'] == morph_name])
-        non_exemplars_morph = non_exemplars[
-            non_exemplars['morph_name'] == morph_name]
-        nb_errors = len(
-            non_exemplars_morph[non_exemplars_morph['exception'].notnull()])
-        nb_combos = len(non_exemplars_morph)
-
-        label = create_morphology_label(non_exemplars_morph)
-        sums.loc[label, 'passed'] = nb_matches
-        sums.loc[label, 'error'] = nb_errors
-        sums.loc[label, 'failed'] = nb_combos - nb_matches - nb_errors
+    sums = aggregation.count_results_per_morphology(data, final_db)
 
     return plot_stacked_bars(
         sums, '# tested e-models', 'Morphology name',
@@ -243,29 +230,7 @@ def plot_emodels_per_metype(data, final_db):
         Figure with plot of stacked bars. Simulations that passed, threw an
         error, and failed are colored blue, yellow and red, respectively.
     """
-    # Add helper column 'metype'
-    def create_metype(x):
-        """Create me-type from m-type and e-type"""
-        return '%s_%s' % (x['etype'], x['fullmtype'])
-    data['metype'] = data.apply(create_metype, axis=1)
-    final_db['metype'] = final_db.apply(create_metype, axis=1)
-
-    sums = pandas.DataFrame()
-    non_exemplars = data[data['is_exemplar'] == 0]
-    for metype in non_exemplars['metype'].unique():
-        nb_matches = len(final_db[(final_db['metype'] == metype)])
-        nb_errors = len(
-            non_exemplars[
-                (non_exemplars['metype'] == metype) & (
-                    non_exemplars['exception'].notnull())])
-        nb_combos = len(non_exemplars[non_exemplars['metype'] == metype])
-        sums.loc[metype, 'passed'] = nb_matches
-        sums.loc[metype, 'error'] = nb_errors
-        sums.loc[metype, 'failed'] = nb_combos - nb_matches - nb_errors
-
-    # Remove helper column 'metype'
-    del data['metype']
-    del final_db['metype']
+    sums = aggregation.count_results_per_metype(data, final_db)
 
     return plot_stacked_bars(
         sums, '# tested (e-model, morphology) combinations', 'me-type',
@@ -278,23 +243,39 @@ def create_metype(x):
     return '%s_%s' % (x['etype'], x['fullmtype'])
 
 
-def plot_median_per_metype(combos, passed_median_scores, csv_path):
-    """Display result median score per me-type"""
+def calc_metype_median_scores(combos, passed_median_scores):
+    """Calculate the median of the median scores of the passed combos per
+    me-type.
+
+    Args:
+        combos: pandas.DataFrame with combo data
+        passed_median_scores: pandas.DataFrame with column 'median_score',
+            indexed like combos
 
+    Returns:
+        pandas.DataFrame with m-types as index and e-types as columns
+    """
     metype_medians = passed_median_scores.join(combos)[
         ['mtype', 'etype', 'median_score']]
 
     metype_medians = metype_medians.groupby(
         ['mtype', 'etype']).median().reset_index()
 
-    metype_medians = metype_medians.pivot(
+    return metype_medians.pivot(
         index='mtype',
         columns='etype',
         values='median_score')
 
-    metype_medians.to_csv(csv_path)
-    print('Wrote me-type median scores to %s' % os.path.abspath(csv_path))
 
+def plot_median_per_metype(metype_medians):
+    """Display result median score per me-type
+
+    Args:
+        metype_medians: pandas.DataFrame created by calc_metype_median_scores
+
+    Returns:
+        Figure with a color map of the median scores
+    """
     ax = plt.pcolor(metype_medians)
     ax = plt.gca()
     cbar = plt.colorbar()
@@ -314,7 +295,81 @@ def plot_median_per_metype(combos, passed_median_scores, csv_path):
 
     return plt.gcf()
 
-# TODO: can this function be split into processing and reporting?
+
+def render_report_part(args):
+    """Render pages of the report into a PDF file.
+
+    Args:
+        args: tuple with the path of the PDF file and a list of
+            (plot_function, plot_args)-tuples, one per page
+
+    Returns:
+        The path of the PDF file
+    """
+    part_filename, pages = args
+    with pdf_file(part_filename) as pp:
+        for plot_function, plot_args in pages:
+            add_plot_to_report(pp, plot_function, *plot_args)
+    plt.close('all')
+    return part_filename
+
+
+def merge_pdf_files(part_filenames, pdf_filename):
+    """Concatenate PDF files with pypdf.
+
+    Args:
+        part_filenames: list of paths to the PDF files to concatenate
+        pdf_filename: path to the merged PDF file
+    """
+    writer = pypdf.PdfWriter()
+    for part_filename in part_filenames:
+        writer.append(part_filename)
+    with open(pdf_filename, 'wb') as pdf:
+        writer.write(pdf)
+    writer.close()
+
+
+def render_report(pdf_filename, page_groups, n_processes=None):
+    """Render the pages of the report and write them to a PDF file.
+
+    With more than one process, every group of pages is rendered into a
+    separate file by a process pool, and the files are merged afterwards with
+    pypdf.
+
+    Args:
+        pdf_filename: path to PDF file
+        page_groups: list of lists of (plot_function, plot_args)-tuples, one
+            tuple per page
+        n_processes: integer number of processes, `None` will use all of them
+    """
+    if n_processes == 1:
+        with pdf_file(pdf_filename) as pp:
+            for pages in page_groups:
+                for plot_function, plot_args in pages:
+                    add_plot_to_report(pp, plot_function, *plot_args)
+                plt.close('all')
+        return
+
+    pdf_dir = tools.makedirs(os.path.dirname(os.path.abspath(pdf_filename)))
+    parts_dir = tempfile.mkdtemp(prefix='report_parts_', dir=pdf_dir)
+    try:
+        arg_list = [(os.path.join(parts_dir, 'part_%06d.pdf' % index), pages)
+                    for index, pages in enumerate(page_groups)]
+        print('Rendering %d parts of the report in parallel' % len(arg_list))
+        pool = multiprocessing.Pool(processes=n_processes,
+                                    initializer=profiling.init_worker)
+        try:
+            with profiling.stage('render report parts'):
+                part_filenames = pool.map(render_report_part, arg_list,
+                                          chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        with profiling.stage('merge report parts'):
+            merge_pdf_files(part_filenames, pdf_filename)
+    finally:
+        shutil.rmtree(parts_dir)
 
 
 def create_final_db_and_write_report(pdf_filename,
@@ -329,123 +384,123 @@ def create_final_db_and_write_report(pdf_filename,
                                      enable_plot_emodels_per_morphology,
                                      output_dir,
                                      select_perc_best,
-                                     n_processes=None):
-    """Create the final output files and report"""
-    ext_neurondb = pandas.DataFrame()
-
-    emodel_infos = None
-    megate_passed_all = pandas.DataFrame()
-    median_scores = pandas.DataFrame()
-    passed_combos = pandas.DataFrame()
-
-    '''
-    median_scores = score_values.median(
-        axis=1,
-        skipna=True).to_frame(name='median_score')
-    '''
-
-    with pdf_file(pdf_filename) as pp:
-        # Plot input configuration details
-        add_plot_to_report(pp, plot_dict, to_skip_features,
-                           'Ignored feature patterns')
-        add_plot_to_report(pp, plot_dict, megate_thresholds,
-                           'MEGating thresholds (last match counts)')
-
-        # Process all the e-models
-        emodels = sorted(scores[scores.is_original == 0].emodel.unique())
-
-        emodel_infos = table_processing.process_emodels(emodels,
-                                                        scores,
-                                                        score_values,
-                                                        to_skip_patterns,
-                                                        megate_patterns,
-                                                        skip_repaired_exemplar,
-                                                        check_opt_scores,
-                                                        select_perc_best,
-                                                        n_processes=n_processes
-                                                        )
-
-        print("All emodels processed, generating output files")
-
-        for emodel, emodel_info in emodel_infos.items():
-            if emodel_info is not None:
-                emodel_ext_neurondb_rows, \
-                    megate_scores, emodel_score_values, fullmtypes, \
-                    emodel_megate_passed_all, emodel_median_scores, \
-                    emodel_passed_combos = \
-                    emodel_info
-                ext_neurondb = pandas.concat(
-                    [ext_neurondb, emodel_ext_neurondb_rows], axis=0
-                ).reset_index(drop=True)
-
-                megate_passed_all = pandas.concat(
-                    [megate_passed_all, emodel_megate_passed_all], axis=0
-                ).reset_index(drop=True)
-
-                median_scores = pandas.concat(
-                    [median_scores, emodel_median_scores], axis=0
-                ).reset_index(drop=True)
-
-                passed_combos = pandas.concat(
-                    [passed_combos, emodel_passed_combos], axis=0
-                ).reset_index(drop=True)
-
-                # Reporting per e-model
-                add_plot_to_report(
-                    pp,
-                    plot_morphs_per_feature_for_emodel,
-                    emodel,
-                    megate_scores,
-                    emodel_score_values)
-                add_plot_to_report(
-                    pp,
-                    plot_morphs_per_mtype_for_emodel,
-                    emodel,
-                    fullmtypes,
-                    megate_scores)
-                plt.close('all')
-            else:
-                print('WARNING: no info for emodel %s, skipping !' % emodel)
-
-        # Get median score for every passed combo
-        passed_median_scores = median_scores.loc[passed_combos.index]
-
-        extra_data_dir = os.path.join(output_dir, 'extra_data')
-        if not os.path.exists(extra_data_dir):
-            os.makedirs(extra_data_dir)
-
-        all_median_csv_path = os.path.join(
-            extra_data_dir,
-            'all_median_scores.csv')
-        scores[scores['is_exemplar'] == 0].join(median_scores)[
-            ['fullmtype',
-             'etype',
-             'emodel',
-             'median_score']].to_csv(all_median_csv_path)
-
-        passed_median_csv_path = os.path.join(
-            extra_data_dir,
-            'passed_median_scores.csv')
-        scores[
-            scores['is_exemplar'] == 0].join(
-            passed_median_scores, how='right')[
-            ['fullmtype', 'etype', 'emodel', 'median_score']].to_csv(
-            passed_median_csv_path)
-
-        metype_median_csv_path = os.path.join(
-            extra_data_dir,
-            'metype_median_scores.csv')
-        add_plot_to_report(
-            pp,
-            plot_median_per_metype,
-            scores,
-            passed_median_scores,
-            metype_median_csv_path)
-
-        # More reporting
-        if enable_plot_emodels_per_morphology:
-            add_plot_to_report(pp, plot_emodels_per_morphology, scores,
-                               ext_neurondb)
-        add_plot_to_report(pp, plot_emodels_per_metype, scores, ext_neurondb)
+                                     n_processes=None,
+                                     write_report=True,
+                                     results_writer=None):
+    """Create the final output files and report.
+
+    All the data is computed first. The report is only rendered afterwards,
+    and is skipped if write_report is False. If results_writer, a
+    megate_output.MegateResultsWriter, is given, the database rows of every
+    e-model are added to it. The e-models are then processed one by one, and
+    their data is only kept if it is needed for the report.
+
+    Returns:
+        pandas.DataFrame with the final database, or None if results_writer
+        is given and the report is not written
+    """
+    keep_ext_neurondb = write_report or results_writer is None
+    results = aggregation.ResultAccumulator(['ext_neurondb', 'median_scores',
+                                             'passed_combos'])
+
+    # Plot input configuration details
+    page_groups = [[(plot_dict, (to_skip_features,
+                                 'Ignored feature patterns')),
+                    (plot_dict, (megate_thresholds,
+                                 'MEGating thresholds (last match counts)'))]]
+
+    # Process all the e-models
+    emodels = sorted(scores[scores.is_original == 0].emodel.unique())
+
+    emodel_infos = table_processing.iter_process_emodels(
+        emodels,
+        scores,
+        score_values,
+        to_skip_patterns,
+        megate_patterns,
+        skip_repaired_exemplar,
+        check_opt_scores,
+        select_perc_best,
+        n_processes=n_processes)
+
+    for emodel, emodel_info in profiling.iter_stage('process e-models',
+                                                    emodel_infos):
+        if emodel_info is not None:
+            emodel_ext_neurondb_rows, \
+                megate_scores, emodel_score_values, fullmtypes, \
+                _, emodel_median_scores, emodel_passed_combos = \
+                emodel_info
+            if results_writer is not None:
+                results_writer.add(emodel_ext_neurondb_rows)
+            if keep_ext_neurondb:
+                results.add(ext_neurondb=emodel_ext_neurondb_rows)
+            results.add(median_scores=emodel_median_scores,
+                        passed_combos=emodel_passed_combos)
+
+            # Reporting per e-model
+            if write_report:
+                page_groups.append([
+                    (plot_morphs_per_feature_for_emodel,
+                     (emodel, megate_scores, emodel_score_values)),
+                    (plot_morphs_per_mtype_for_emodel,
+                     (emodel, fullmtypes, megate_scores))])
+        else:
+            print('WARNING: no info for emodel %s, skipping !' % emodel)
+
+    print("All emodels processed, generating output files")
+
+    # The median scores and passed combos keep the indices of the combos
+    ext_neurondb = None
+    if keep_ext_neurondb:
+        ext_neurondb = results.concat('ext_neurondb').reset_index(drop=True)
+    median_scores = results.concat('median_scores')
+    passed_combos = results.concat('passed_combos')
+
+    # Get median score for every passed combo
+    passed_median_scores = median_scores.loc[passed_combos.index]
+
+    extra_data_dir = os.path.join(output_dir, 'extra_data')
+    if not os.path.exists(extra_data_dir):
+        os.makedirs(extra_data_dir)
+
+    all_median_csv_path = os.path.join(
+        extra_data_dir,
+        'all_median_scores.csv')
+    scores[scores['is_exemplar'] == 0].join(median_scores)[
+        ['fullmtype',
+         'etype',
+         'emodel',
+         'median_score']].to_csv(all_median_csv_path)
+
+    passed_median_csv_path = os.path.join(
+        extra_data_dir,
+        'passed_median_scores.csv')
+    scores[
+        scores['is_exemplar'] == 0].join(
+        passed_median_scores, how='right')[
+        ['fullmtype', 'etype', 'emodel', 'median_score']].to_csv(
+        passed_median_csv_path)
+
+    metype_median_csv_path = os.path.join(
+        extra_data_dir,
+        'metype_median_scores.csv')
+    metype_medians = calc_metype_median_scores(scores, passed_median_scores)
+    metype_medians.to_csv(metype_median_csv_path)
+    print('Wrote me-type median scores to %s' %
+          os.path.abspath(metype_median_csv_path))
+
+    if not write_report:
+        print('Skipping the report')
+        return ext_neurondb
+
+    # More reporting
+    page_groups.append([(plot_median_per_metype, (metype_medians,))])
+    if enable_plot_emodels_per_morphology:
+        page_groups.append([(plot_emodels_per_morphology,
+                             (scores, ext_neurondb))])
+    page_groups.append([(plot_emodels_per_metype, (scores, ext_neurondb))])
+
+    with profiling.stage('render report'):
+        render_report(pdf_filename, page_groups, n_processes=n_processes)
 
     return ext_neurondb
@@ -24,10 +24,11 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import math
 import json
+import numpy
 import pandas
 import multiprocessing
 
-from bluepymm import tools
+from bluepymm import tools, profiling
 
 
 def _row_transform(row, exemplar_row, to_skip_patterns,
@@ -75,6 +76,31 @@ def convert_extra_values(row):
     return row
 
 
+def extract_extra_values(extra_values):
+    """Extract 'threshold_current' and 'holding_current' from the JSON strings
+    of column 'extra_values'. All strings are decoded at once.
+
+    Args:
+        extra_values: pandas.Series with JSON strings or None
+
+    Returns:
+        pandas.DataFrame with float columns 'threshold_current' and
+        'holding_current', indexed like extra_values. Missing values are NaN.
+    """
+    fields = ['threshold_current', 'holding_current']
+    present = extra_values.notnull()
+    decoded = json.loads('[%s]' % ','.join(extra_values[present]))
+
+    values = numpy.full((len(extra_values), len(fields)), numpy.nan)
+    for row, row_values in zip(numpy.flatnonzero(present.values), decoded):
+        if isinstance(row_values, dict):
+            for column, field in enumerate(fields):
+                if row_values.get(field) is not None:
+                    values[row, column] = row_values[field]
+
+    return pandas.DataFrame(values, index=extra_values.index, columns=fields)
+
+
 def row_threshold_transform(row, megate_patterns):
     """Transform threshold row based on me-gate rule: add matching me-gate
     patterns to row data.
@@ -191,14 +217,18 @@ def _create_extneurondb_rows(selected_combinations):
     # 2. create additional columns: combo_name, threshold current, and
     #    holding current
     if len(emodel_ext_neurondb) > 0:
-        emodel_ext_neurondb['combo_name'] = emodel_ext_neurondb.apply(
-            lambda x: '%s_%s_%s_%s' %
-            (x['emodel'], x['fullmtype'], x['layer'], x['morph_name']), axis=1)
-
-        emodel_ext_neurondb['threshold_current'] = None
-        emodel_ext_neurondb['holding_current'] = None
-        emodel_ext_neurondb = emodel_ext_neurondb.apply(
-            convert_extra_values, axis=1)
+        emodel_ext_neurondb['combo_name'] = \
+            emodel_ext_neurondb['emodel'].astype(str) + '_' + \
+            emodel_ext_neurondb['fullmtype'].astype(str) + '_' + \
+            emodel_ext_neurondb['layer'].astype(str) + '_' + \
+            emodel_ext_neurondb['morph_name'].astype(str)
+
+        extra_values = extract_extra_values(
+            emodel_ext_neurondb['extra_values'])
+        emodel_ext_neurondb['threshold_current'] = \
+            extra_values['threshold_current']
+        emodel_ext_neurondb['holding_current'] = \
+            extra_values['holding_current']
         del emodel_ext_neurondb['extra_values']
 
     return emodel_ext_neurondb
@@ -215,6 +245,7 @@ def select_passed_combos(
     passed_indices = pandas.DataFrame()
 
     if select_perc_best is not None:
+        best_scores = []
         metype_inds = emodel_combos['etype'] + emodel_combos['fullmtype']
         for metype in metype_inds.unique():
             metype_scores = emodel_megate_scores.loc[
@@ -230,13 +261,15 @@ def select_passed_combos(
             n_of_combos = len(metype_scores_nonan_no250_sorted.index)
             n_of_best = int(math.ceil(select_perc_best * n_of_combos))
 
-            passed_indices = passed_indices.append(
-                metype_scores_nonan_no250_sorted.head(n_of_best))
+            best_scores.append(metype_scores_nonan_no250_sorted.head(
+                n_of_best))
 
-            if len(passed_indices) == 0:
+            if len(best_scores[-1]) == 0:
                 print(
                     'WARNING: no combos for me-type %s in emodel %s' %
                     (metype, emodel))
+        if best_scores:
+            passed_indices = pandas.concat(best_scores, axis=0)
     else:
         passed_indices = \
                 emodel_megate_pass[
@@ -262,16 +295,56 @@ def calc_median_scores(emodel_score_values, to_skip_patterns):
     return emodel_median_scores
 
 
-def process_emodels(emodels,
-                    scores,
-                    score_values,
-                    to_skip_patterns,
-                    megate_patterns,
-                    skip_repaired_exemplar,
-                    enable_check_opt_scores,
-                    select_perc_best,
-                    n_processes=None):
+def get_exemplar_row(emodel, combos, score_values):
+    """Get the score values of the repaired exemplar of an e-model.
 
+    Args:
+        emodel: e-model name
+        combos: pandas.DataFrame with combo data
+        score_values: pandas.DataFrame with score values
+
+    Returns:
+        dict mapping features to the scores of the exemplar, without the
+        features that have no score, or None if there is no repaired exemplar
+
+    Raises:
+        Exception, if more than one exemplar is found.
+    """
+    exemplar_morph = combos[combos.emodel == emodel].morph_name.values[0]
+    exemplar_score_values = score_values[
+        (combos.emodel == emodel) &
+        (combos.is_exemplar == 1) &
+        (combos.is_repaired == 1) &
+        (combos.is_original == 0) &
+        (combos.morph_name == exemplar_morph)]
+
+    if len(exemplar_score_values) > 1:
+        raise Exception('Too many exemplars found for e-model %s: %s' %
+                        (emodel, exemplar_score_values))
+
+    exemplar_score_values = exemplar_score_values.head(1).copy()
+    exemplar_score_values.dropna(axis=1, how='all', inplace=True)
+
+    if len(exemplar_score_values) == 0:
+        return None
+    return exemplar_score_values.iloc[0].to_dict()
+
+
+def iter_process_emodels(emodels,
+                         scores,
+                         score_values,
+                         to_skip_patterns,
+                         megate_patterns,
+                         skip_repaired_exemplar,
+                         enable_check_opt_scores,
+                         select_perc_best,
+                         n_processes=None):
+    """Process the e-models, see process_emodel.
+
+    Yields:
+        (emodel, emodel_info)-tuples in the order of emodels, as soon as the
+        e-model is processed
+    """
     arg_list = [(emodel,
                  scores,
                  score_values,
@@ -281,24 +354,41 @@ def process_emodels(emodels,
                  enable_check_opt_scores,
                  select_perc_best) for emodel in emodels]
 
-    emodel_infos = {}
-
     if n_processes == 1:
         for args in arg_list:
-            emodel, emodel_info = process_emodel(args)
-            emodel_infos[emodel] = emodel_info
+            yield process_emodel(args)
     else:
         print('Parallelising selection processing of e-models')
-        pool = multiprocessing.Pool(maxtasksperchild=1, processes=n_processes)
-        for emodel, emodel_info in pool.imap(process_emodel, arg_list,
-                                             chunksize=1):
-            print('Received processed info from e-model %s' % emodel)
-            emodel_infos[emodel] = emodel_info
+        pool = multiprocessing.Pool(maxtasksperchild=1, processes=n_processes,
+                                    initializer=profiling.init_worker)
+        try:
+            for emodel, emodel_info in pool.imap(process_emodel, arg_list,
+                                                 chunksize=1):
+                print('Received processed info from e-model %s' % emodel)
+                yield emodel, emodel_info
+        finally:
+            pool.terminate()
+            pool.join()
 
-        pool.terminate()
-        pool.join()
 
-    return emodel_infos
+def process_emodels(emodels,
+                    scores,
+                    score_values,
+                    to_skip_patterns,
+                    megate_patterns,
+                    skip_repaired_exemplar,
+                    enable_check_opt_scores,
+                    select_perc_best,
+                    n_processes=None):
+    """Process the e-models, see process_emodel.
+
+    Returns:
+        dict mapping the e-models to their info
+    """
+    return dict(iter_process_emodels(
+        emodels, scores, score_values, to_skip_patterns, megate_patterns,
+        skip_repaired_exemplar, enable_check_opt_scores, select_perc_best,
+        n_processes=n_processes))
 
 
 def process_emodel(args):
@@ -343,27 +433,11 @@ def process_emodel(args):
     # if applicable, skip exemplar rows from combos and score values
     exemplar_row = None
     if not skip_repaired_exemplar:
-        exemplar_morph = combos[combos.emodel == emodel].morph_name.values[0]
-        exemplar_score_values = score_values[
-            (combos.emodel == emodel) &
-            (combos.is_exemplar == 1) &
-            (combos.is_repaired == 1) &
-            (combos.is_original == 0) &
-            (combos.morph_name == exemplar_morph)]
-
-        if len(exemplar_score_values) > 1:
-            raise Exception('Too many exemplars found for e-model %s: %s' %
-                            (emodel, exemplar_score_values))
-
-        exemplar_score_values = exemplar_score_values.head(1).copy()
-        exemplar_score_values.dropna(axis=1, how='all', inplace=True)
-
-        if len(exemplar_score_values) == 0:
+        exemplar_row = get_exemplar_row(emodel, combos, score_values)
+        if exemplar_row is None:
             print('Skipping e-model %s: no repaired exemplars' % emodel)
             return
 
-        exemplar_row = exemplar_score_values.iloc[0].to_dict()
-
     # identify relevant me-gate feature thresholds for each row
     emodel_mtype_etypes = combos[(combos.emodel == emodel) &
                                  (combos.is_exemplar == 0)].copy()
@@ -377,9 +451,10 @@ def process_emodel(args):
     emodel_mtype_etype_thresholds['megate_feature_threshold'] = None
 
     print('Getting megating thresholds for emodel %s' % emodel)
-    emodel_mtype_etype_thresholds = emodel_mtype_etype_thresholds.apply(
-        lambda row: row_threshold_transform(row, megate_patterns),
-        axis=1)
+    with profiling.stage('megate thresholds'):
+        emodel_mtype_etype_thresholds = emodel_mtype_etype_thresholds.apply(
+            lambda row: row_threshold_transform(row, megate_patterns),
+            axis=1)
 
     # select score values relevant to this e-model
     emodel_score_values = score_values[(combos.emodel == emodel) &
@@ -388,18 +463,20 @@ def process_emodel(args):
 
     print('Applying megating to emodel %s' % emodel)
     # me-gating: compare score values to applicable feature thresholds
-    emodel_megate_pass = _apply_megating(
-        emodel_mtype_etype_thresholds,
-        emodel_score_values,
-        exemplar_row,
-        to_skip_patterns,
-        skip_repaired_exemplar)
+    with profiling.stage('apply megating'):
+        emodel_megate_pass = _apply_megating(
+            emodel_mtype_etype_thresholds,
+            emodel_score_values,
+            exemplar_row,
+            to_skip_patterns,
+            skip_repaired_exemplar)
 
     print('Calculating median scores for emodel %s' % emodel)
 
-    emodel_median_scores = calc_median_scores(
-        emodel_score_values,
-        to_skip_patterns)
+    with profiling.stage('median scores'):
+        emodel_median_scores = calc_median_scores(
+            emodel_score_values,
+            to_skip_patterns)
 
     emodel_combos = combos[(combos.emodel == emodel) &
                            (combos.is_exemplar == 0)].copy()
@@ -428,20 +505,24 @@ def process_emodel(args):
                     emodel_median_scores, passed_combos)
 
 
-def process_combo_name(data, log_filename):
+def process_combo_name(data, log_filename, append=False):
     """Make value corresponding to key 'combo_name' compliant with NEURON rules
     for template names. A log file is written out in csv format.
 
     Args:
         data: pandas.DataFrame with key 'combo_name'
         log_filename: path to log file
+        append: append the rows to an existing log file, without header
     """
     log_data = pandas.DataFrame()
     log_data['original_combo_name'] = data['combo_name'].copy()
 
-    data['combo_name'] = data.apply(
-        lambda x: tools.get_neuron_compliant_template_name(x['combo_name']),
-        axis=1)
+    # every unique name is only transformed once
+    compliant_names = {
+        name: tools.get_neuron_compliant_template_name(name)
+        for name in data['combo_name'].unique()}
+    data['combo_name'] = data['combo_name'].map(compliant_names)
 
     log_data['neuron_compliant_combo_name'] = data['combo_name'].copy()
-    log_data.to_csv(log_filename, index=False)
+    log_data.to_csv(log_filename, index=False, mode='a' if append else 'w',
+                    header=not append)
@@ -0,0 +1,214 @@
+"""Pass rates of the me-gating for a grid of thresholds"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""A combo passes the me-gating with threshold t if every gated feature has
+
+    score <= max(t, t * exemplar score)
+
+or equivalently, for t >= 0,
+
+    score / max(1, exemplar score) <= t
+
+The smallest threshold at which a combo passes is thus the maximum of these
+normalised scores over its gated features. It is computed once per combo, and
+the pass counts of all thresholds of the grid follow from a binary search in
+the sorted critical thresholds of every me-type.
+
+The swept threshold replaces the megate_threshold of every pattern of the
+configuration, the patterns still select the features that are gated.
+Features that no pattern gates are ignored. For select_perc_best, the number
+of selected combos of a me-type follows directly from the number of combos
+with a median score, see table_processing.select_passed_combos.
+"""
+
+# pylint: disable=C0325
+
+import os
+import math
+
+import numpy
+import pandas
+
+from bluepymm import tools
+
+from . import table_processing
+
+
+# Median scores from this value on are never selected by select_perc_best
+MAX_MEDIAN_SCORE = 250.0
+SWEEP_COLUMNS = ['emodel', 'fullmtype', 'etype', 'criterion', 'value',
+                 'n_combos', 'n_passed', 'pass_rate']
+
+
+def _gated_features(features, megate_patterns, emodel, fullmtype, etype):
+    """Boolean array of the features that a me-type is gated on"""
+    gated = numpy.zeros(len(features), dtype=bool)
+    for pattern in megate_patterns:
+        if (pattern['emodel'].match(emodel) and
+                pattern['fullmtype'].match(fullmtype) and
+                pattern['etype'].match(etype)):
+            features_regex = pattern['megate_feature_threshold']['features']
+            gated |= numpy.array([features_regex.match(feature) is not None
+                                  for feature in features], dtype=bool)
+    return gated
+
+
+def critical_thresholds(combos, score_values, to_skip_patterns,
+                        megate_patterns, skip_repaired_exemplar):
+    """Compute the smallest me-gate threshold at which every combo passes.
+
+    Args:
+        combos: pandas.DataFrame with combo data
+        score_values: pandas.DataFrame with score values
+        to_skip_patterns: list of compiled regular expressions
+        megate_patterns: list of dictionaries with megate patterns
+        skip_repaired_exemplar: boolean
+
+    Returns:
+        pandas.DataFrame with columns 'emodel', 'fullmtype', 'etype',
+        'critical_threshold' (inf if the combo never passes) and
+        'median_score', one row per non-exemplar combo. E-models without
+        repaired exemplar are left out, unless skip_repaired_exemplar is set.
+    """
+    features = [column for column in score_values.columns
+                if not any(pattern.match(column)
+                           for pattern in to_skip_patterns)]
+
+    parts = []
+    # the combos are split by e-model once
+    for emodel, emodel_rows in combos.groupby(
+            'emodel', sort=False).indices.items():
+        all_emodel_combos = combos.iloc[emodel_rows]
+        all_emodel_score_values = score_values.iloc[emodel_rows]
+        if skip_repaired_exemplar:
+            exemplar_row = {}
+        else:
+            exemplar_row = table_processing.get_exemplar_row(
+                emodel, all_emodel_combos, all_emodel_score_values)
+            if exemplar_row is None:
+                print('Skipping e-model %s: no repaired exemplars' % emodel)
+                continue
+
+        selection = (all_emodel_combos['is_exemplar'] == 0).values
+        emodel_combos = all_emodel_combos.loc[
+            selection, ['emodel', 'fullmtype', 'etype']].copy()
+        if len(emodel_combos) == 0:
+            continue
+
+        # same features as in table_processing.process_emodel
+        values = all_emodel_score_values.loc[selection, features]
+        values = values.loc[:, values.notnull().any(axis=0)]
+        emodel_features = list(values.columns)
+        scale = numpy.fmax(1.0, numpy.array(
+            [exemplar_row.get(feature, numpy.nan)
+             for feature in emodel_features], dtype=float))
+        normalised = values.values.astype(float) / scale
+        normalised[numpy.isnan(normalised)] = numpy.inf
+
+        critical = numpy.full(len(emodel_combos), -numpy.inf)
+        for (fullmtype, etype), rows in emodel_combos.groupby(
+                ['fullmtype', 'etype'], sort=False).indices.items():
+            gated = _gated_features(emodel_features, megate_patterns,
+                                    emodel, fullmtype, etype)
+            if gated.any():
+                critical[rows] = normalised[rows][:, gated].max(axis=1)
+
+        emodel_combos['critical_threshold'] = critical
+        emodel_combos['median_score'] = values.median(axis=1, skipna=True)
+        parts.append(emodel_combos)
+
+    if not parts:
+        return pandas.DataFrame(columns=['emodel', 'fullmtype', 'etype',
+                                         'critical_threshold',
+                                         'median_score'])
+    return pandas.concat(parts, axis=0)
+
+
+def sweep(thresholds, megate_thresholds=(), select_perc_best=()):
+    """Count the combos that pass for a grid of thresholds.
+
+    Args:
+        thresholds: pandas.DataFrame created by critical_thresholds
+        megate_thresholds: list of me-gate thresholds, at least 0
+        select_perc_best: list of fractions of best combos per me-type
+
+    Returns:
+        pandas.DataFrame with columns SWEEP_COLUMNS, one row per me-type and
+        value of a criterion ('megate_threshold' or 'select_perc_best')
+    """
+    megate_thresholds = numpy.asarray(sorted(megate_thresholds), dtype=float)
+    if (megate_thresholds < 0).any():
+        raise ValueError('Swept me-gate thresholds should be at least 0: %s'
+                         % megate_thresholds)
+
+    rows = []
+    for (emodel, fullmtype, etype), metype in thresholds.groupby(
+            ['emodel', 'fullmtype', 'etype'], sort=False):
+        n_combos = len(metype)
+
+        critical = numpy.sort(metype['critical_threshold'].values)
+        n_passed = numpy.searchsorted(critical, megate_thresholds,
+                                      side='right')
+        for value, count in zip(megate_thresholds, n_passed):
+            rows.append((emodel, fullmtype, etype, 'megate_threshold',
+                         value, n_combos, int(count)))
+
+        median_scores = metype['median_score']
+        n_valid = int((median_scores < MAX_MEDIAN_SCORE).sum())
+        for value in select_perc_best:
+            rows.append((emodel, fullmtype, etype, 'select_perc_best',
+                         float(value), n_combos,
+                         int(math.ceil(value * n_valid))))
+
+    result = pandas.DataFrame(rows, columns=SWEEP_COLUMNS[:-1])
+    result['pass_rate'] = result['n_passed'] / result['n_combos']
+    return result
+
+
+def write_threshold_sweep(output_dir, combos, score_values, to_skip_patterns,
+                          megate_patterns, skip_repaired_exemplar,
+                          sweep_conf):
+    """Compute the pass rates of a threshold sweep and write them to
+    <output_dir>/threshold_sweep.csv.
+
+    Args:
+        output_dir: output directory
+        combos, score_values, to_skip_patterns, megate_patterns,
+        skip_repaired_exemplar: see critical_thresholds
+        sweep_conf: dict with keys 'megate_thresholds' and/or
+            'select_perc_best', with the lists of values to sweep
+
+    Returns:
+        path of the written file
+    """
+    thresholds = critical_thresholds(combos, score_values, to_skip_patterns,
+                                     megate_patterns, skip_repaired_exemplar)
+    result = sweep(thresholds,
+                   megate_thresholds=sweep_conf.get('megate_thresholds', []),
+                   select_perc_best=sweep_conf.get('select_perc_best', []))
+
+    tools.makedirs(output_dir)
+    sweep_path = os.path.join(output_dir, 'threshold_sweep.csv')
+    result.to_csv(sweep_path, index=False)
+    print('Wrote threshold sweep of %d me-types to %s' %
+          (len(thresholds.groupby(['emodel', 'fullmtype', 'etype'])),
+           sweep_path))
+    return sweep_path
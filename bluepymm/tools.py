@@ -25,6 +25,8 @@ import importlib
 import json
 import os
 import sys
+import socket
+import resource
 import hashlib
 import multiprocessing.pool
 from string import digits
@@ -100,6 +102,33 @@ def check_all_combos_have_run(database, description):
         return True
 
 
+def get_worker_id():
+    """Return string identifying the current process across nodes:
+    <hostname>:<pid>"""
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def get_peak_rss_mb():
+    """Return the peak resident set size (in MB) of the current process"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is expressed in bytes on macOS, and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak_rss / 1024.0 ** 2
+    else:
+        return peak_rss / 1024.0
+
+
+def get_rss_mb(pid):
+    """Return the current resident set size (in MB) of a process, or None if
+    it can't be determined on this platform or the process doesn't exist"""
+    try:
+        with open('/proc/%d/statm' % pid) as statm_file:
+            n_pages = int(statm_file.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return n_pages * resource.getpagesize() / 1024.0 ** 2
+
+
 def load_module(name, path):
     """Try and load module `name` but *only* in `path`
 
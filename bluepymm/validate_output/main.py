@@ -22,10 +22,12 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 # pylint: disable=R0914, C0325, W0640
 
+import os
+
 import bluepymm.tools as bpmmtools
+from bluepymm import profiling
 
-# from . import sqlite_io, reporting, megate_output
-# from . import process_megate_config as proc_config
+from . import validate_release, resimulation
 
 
 def validate_output(conf_filename):
@@ -37,15 +39,49 @@ def validate_output(conf_filename):
 
     mecombo_release = bpmmtools.load_json(mecombo_release_path)
 
-    print(mecombo_release)
-
     extneurondbdat_path = mecombo_release['output_paths']['extneurondb.dat']
     mecombotsv_path = mecombo_release['output_paths']['mecombo_emodel.tsv']
     emodelshoc_path = mecombo_release['output_paths']['emodels_hoc']
-
-    print(extneurondbdat_path, mecombotsv_path, emodelshoc_path)
-
-    # extneurondbdat = read_extneurondb_dat(extneurondbdat_path)
+    morph_path = conf_dict.get('morph_path', None)
+
+    print('Validating %s, %s and %s' % (extneurondbdat_path, mecombotsv_path,
+                                        emodelshoc_path))
+
+    with profiling.stage('load release'):
+        extneurondb, mecombo_emodel, emodels_hoc, morphologies = \
+            validate_release.load_release(extneurondbdat_path,
+                                          mecombotsv_path,
+                                          emodelshoc_path,
+                                          morph_dir=morph_path)
+
+    with profiling.stage('check release'):
+        issues = validate_release.check_release(
+            extneurondb, mecombo_emodel, emodels_hoc,
+            morphologies=morphologies,
+            check_currents=conf_dict.get('check_currents', True))
+
+    # re-simulate a sample of the combos
+    report = issues
+    if 'resimulation' in conf_dict:
+        with profiling.stage('re-simulate sample'):
+            resimulation_issues, summary = resimulation.resimulate(
+                mecombo_emodel, conf_dict['resimulation'])
+        issues.update(resimulation_issues)
+        report = dict(issues, resimulation=summary)
+    print(validate_release.format_issues(issues))
+
+    if 'output_dir' in conf_dict:
+        bpmmtools.makedirs(conf_dict['output_dir'])
+        report_path = bpmmtools.write_json(conf_dict['output_dir'],
+                                           'validation_report.json', report)
+        print('Wrote validation report to %s' % os.path.abspath(report_path))
+
+    n_failed = sum(1 for values in issues.values() if values)
+    if n_failed:
+        raise ValueError('Validation of %s failed %d of %d checks' %
+                         (mecombo_release_path, n_failed, len(issues)))
+    print('Validated %d me-combos' % len(mecombo_emodel))
+    return issues
 
 
 def add_parser(action):
@@ -54,73 +90,3 @@ def add_parser(action):
     parser = action.add_parser('validate',
                                help='Validate me-combo output')
     parser.add_argument('conf_filename')
-
-
-'''
-
-    select_combos_from_conf(conf_dict)
-
-def select_combos(conf_filename):
-    """Parse conf file and run select combos"""
-    # Parse configuration file
-    conf_dict = tools.load_json(conf_filename)
-
-    select_combos_from_conf(conf_dict)
-
-
-def select_combos_from_conf(conf_dict):
-    """Compare scores of me-combinations to thresholds, select successful
-    combinations, and write results out to file.
-
-    Args:
-        conf_filename: filename of configuration (.json file)
-    """
-    scores_db_filename = conf_dict['scores_db']
-    pdf_filename = conf_dict['pdf_filename']
-    output_dir = conf_dict['output_dir']
-
-    # read skip features
-    to_skip_patterns, to_skip_features = proc_config.read_to_skip_features(
-        conf_dict)
-
-    # read megate thresholds
-    megate_patterns, megate_thresholds = proc_config.read_megate_thresholds(
-        conf_dict)
-
-    # read score tables
-    scores, score_values = sqlite_io.read_and_process_sqlite_score_tables(
-        scores_db_filename)
-    tools.check_all_combos_have_run(scores, scores_db_filename)
-
-    # create final database and write report
-    ext_neurondb = reporting.create_final_db_and_write_report(
-        pdf_filename,
-        to_skip_features,
-        to_skip_patterns,
-        megate_thresholds,
-        megate_patterns,
-        conf_dict.get('skip_repaired_exemplar', False),
-        conf_dict.get('check_opt_scores', True),
-        scores, score_values,
-        conf_dict.get('plot_emodels_per_morphology', False))
-    print('Wrote pdf to %s' % pdf_filename)
-
-    # write output files
-    compliant = conf_dict.get('make_names_neuron_compliant', False)
-    extneurondb_path, mecombo_emodel_path = megate_output.save_megate_results(
-        ext_neurondb,
-        output_dir,
-        sort_key='combo_name',
-        make_names_neuron_compliant=compliant)
-
-    emodels_hoc_path = conf_dict['emodels_hoc_dir']
-
-    megate_output.write_mecomboreleasejson(
-        output_dir,
-        emodels_hoc_path,
-        extneurondb_path,
-        mecombo_emodel_path)
-
-
-
-'''
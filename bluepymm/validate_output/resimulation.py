@@ -0,0 +1,373 @@
+"""Re-simulation of a sample of the combos of a release"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""A random sample of the combos of every stratum (by default every me-type
+of every e-model) is run again, and its scores and currents are compared to
+those in the scores database and the release. Since every stratum is sampled,
+a problem that is specific to an e-model or me-type shows up in the sample.
+The fraction of combos of the release that are not reproducible is estimated
+by weighting every stratum by its size, and bounded with a Clopper-Pearson
+upper confidence limit on the effective sample size of the weighted sample.
+"""
+
+# pylint: disable=C0325
+
+import os
+import json
+import math
+import sqlite3
+import collections
+
+import numpy
+import pandas
+
+from bluepymm import tools, profiling
+from bluepymm.run_combos import calculate_scores
+
+
+KEY_COLUMNS = ['morph_name', 'layer', 'fullmtype', 'etype', 'emodel']
+STRATA = ['emodel', 'fullmtype', 'etype']
+CURRENT_COLUMNS = ['threshold_current', 'holding_current']
+# Maximal number of parameters of an SQL query
+MAX_QUERY_PARAMETERS = 500
+
+
+def stratified_sample(mecombo_emodel, n_per_stratum, strata=None, seed=None):
+    """Draw a random sample of combos from every stratum.
+
+    Args:
+        mecombo_emodel: pandas.DataFrame with the contents of
+            mecombo_emodel.tsv
+        n_per_stratum: number of combos per stratum, strata with fewer combos
+            are sampled completely
+        strata: list of columns that define the strata, by default STRATA
+        seed: seed of the random generator
+
+    Returns:
+        pandas.DataFrame with the sampled rows, in the original order
+    """
+    strata = STRATA if strata is None else list(strata)
+    shuffled = mecombo_emodel.sample(frac=1, random_state=seed)
+    return shuffled.groupby(strata, sort=False).head(n_per_stratum) \
+        .sort_index()
+
+
+def read_scores_rows(scores_db_filename, sample):
+    """Read the rows of the scores database of the sampled combos.
+
+    Only the rows of the morphologies in the sample are read.
+
+    Args:
+        scores_db_filename: path to .sqlite database
+        sample: pandas.DataFrame with the sampled rows of mecombo_emodel.tsv
+
+    Returns:
+        pandas.DataFrame with the sample, merged with the columns 'uid'
+        (the index of the row), 'morph_dir', 'morph_ext', 'original_emodel',
+        'scores' and 'extra_values' of the scores database. Combos that
+        aren't found in the database have null values in these columns.
+    """
+    morph_names = sorted(sample['morph_name'].unique())
+    parts = []
+    with sqlite3.connect(scores_db_filename) as scores_db:
+        for start in range(0, len(morph_names), MAX_QUERY_PARAMETERS):
+            names = morph_names[start:start + MAX_QUERY_PARAMETERS]
+            parts.append(pandas.read_sql(
+                'SELECT `index` AS uid, morph_dir, morph_name, morph_ext, '
+                'layer, fullmtype, etype, emodel, original_emodel, scores, '
+                'extra_values FROM scores WHERE is_exemplar=0 AND '
+                'morph_name IN (%s)' % ', '.join('?' * len(names)),
+                scores_db, params=names))
+    scores_db.close()
+
+    rows = pandas.concat(parts, axis=0) if parts else pandas.DataFrame(
+        columns=['uid', 'morph_dir', 'original_emodel', 'morph_ext',
+                 'scores', 'extra_values'] + KEY_COLUMNS)
+    rows[KEY_COLUMNS] = rows[KEY_COLUMNS].astype(str)
+    rows = rows.drop_duplicates(subset=KEY_COLUMNS)
+    return sample.merge(rows, how='left', on=KEY_COLUMNS)
+
+
+def create_input_args(rows, emodel_dirs, final_dict, use_apical_points=True):
+    """Create the arguments of run_emodel_morph_isolated for every row.
+
+    Args:
+        rows: pandas.DataFrame created by read_scores_rows, every row should
+            have been found in the scores database
+        emodel_dirs: a dict mapping e-models to the directories with e-model
+            input files
+        final_dict: a dict mapping e-models to dicts with e-model parameters
+        use_apical_points: boolean to use apical points or not
+
+    Returns:
+        list of tuples, see calculate_scores.run_emodel_morph_isolated
+    """
+    apical_points_index = {}
+    if use_apical_points:
+        apical_points_index = calculate_scores.read_apical_points_index(
+            rows['morph_dir'].unique())
+
+    input_args = []
+    for row in rows.itertuples(index=False):
+        morph_ext = row.morph_ext if isinstance(row.morph_ext, str) \
+            else '.asc'
+        morph_path = os.path.abspath(os.path.join(
+            row.morph_dir, row.morph_name + morph_ext))
+        input_args.append((
+            int(row.uid),
+            row.emodel,
+            os.path.abspath(emodel_dirs[row.emodel]),
+            final_dict[row.original_emodel]['params'],
+            morph_path,
+            apical_points_index.get(row.morph_dir, {}).get(row.morph_name),
+            False))
+    return input_args
+
+
+def run_sample(input_args, n_processes=None):
+    """Run the combos in parallel.
+
+    Args:
+        input_args: list created by create_input_args
+        n_processes: the integer number of processes. If `None`, all
+            processes are going to be used.
+
+    Returns:
+        dict mapping the uids of the combos to the results of
+        calculate_scores.run_emodel_morph_isolated
+    """
+    results = {}
+    pool = tools.NestedPool(processes=n_processes,
+                            initializer=profiling.init_worker)
+    try:
+        for result in pool.imap_unordered(
+                calculate_scores.run_emodel_morph_isolated, input_args):
+            results[result['uid']] = result
+            print('Re-simulated %d/%d me-combos' %
+                  (len(results), len(input_args)))
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def _to_float(value):
+    """Convert a value to float, None to NaN"""
+    return numpy.nan if value is None else float(value)
+
+
+def scores_match(scores, other_scores, rtol=1e-5, atol=1e-8):
+    """Whether two dicts map the same features to scores that are equal
+    within tolerance"""
+    if set(scores) != set(other_scores):
+        return False
+    features = sorted(scores)
+    return bool(numpy.isclose(
+        [_to_float(scores[feature]) for feature in features],
+        [_to_float(other_scores[feature]) for feature in features],
+        rtol=rtol, atol=atol, equal_nan=True).all())
+
+
+def compare_results(rows, results, rtol=1e-5, atol=1e-8):
+    """Compare the results of the re-simulation to the release.
+
+    Args:
+        rows: pandas.DataFrame created by read_scores_rows
+        results: dict created by run_sample
+        rtol, atol: relative and absolute tolerance, see numpy.isclose
+
+    Returns:
+        OrderedDict mapping the names of the checks to sorted lists of combo
+        names, which are empty if the check passed
+    """
+    issues = collections.OrderedDict([
+        ('combos not found in scores db', []),
+        ('combos that failed on re-simulation', []),
+        ('combos with different scores on re-simulation', []),
+        ('combos with different currents on re-simulation', [])])
+    for row in rows.itertuples(index=False):
+        if pandas.isnull(row.uid):
+            issues['combos not found in scores db'].append(row.combo_name)
+            continue
+        result = results[int(row.uid)]
+        if result['exception'] is not None:
+            issues['combos that failed on re-simulation'].append(
+                row.combo_name)
+            continue
+        if not scores_match(json.loads(row.scores), result['scores'],
+                            rtol=rtol, atol=atol):
+            issues['combos with different scores on re-simulation'].append(
+                row.combo_name)
+        currents = [getattr(row, column) for column in CURRENT_COLUMNS]
+        resimulated = [_to_float(result['extra_values'].get(column))
+                       for column in CURRENT_COLUMNS]
+        if not numpy.isclose(currents, resimulated, rtol=rtol, atol=atol,
+                             equal_nan=True).all():
+            issues['combos with different currents on re-simulation'].append(
+                row.combo_name)
+
+    for values in issues.values():
+        values.sort()
+    return issues
+
+
+def upper_confidence_limit(n_failed, n_total, confidence=0.95):
+    """Clopper-Pearson upper confidence limit of a failure rate.
+
+    Args:
+        n_failed: number of failures
+        n_total: number of trials
+        confidence: confidence level
+
+    Returns:
+        The failure rate p for which observing at most n_failed failures has
+        probability 1 - confidence
+    """
+    if n_total == 0 or n_failed >= n_total:
+        return 1.0
+
+    def binomial_cdf(p):
+        """Probability of at most n_failed failures"""
+        return sum(math.exp(
+            math.lgamma(n_total + 1) - math.lgamma(k + 1) -
+            math.lgamma(n_total - k + 1) + k * math.log(p) +
+            (n_total - k) * math.log1p(-p)) for k in range(n_failed + 1))
+
+    # the cdf decreases with p
+    low, high = 0.0, 1.0
+    for _ in range(60):
+        middle = (low + high) / 2.0
+        if binomial_cdf(middle) > 1.0 - confidence:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def upper_failure_rate(stratum_sizes, n_sampled, n_failed, confidence=0.95):
+    """Estimate and bound the failure rate of a release from a stratified
+    sample.
+
+    Every stratum is weighted by its number of combos in the release. Unless
+    the strata are sampled proportionally to their size, the weighted sample
+    carries less information than a simple random sample of the same size.
+    The Clopper-Pearson limit is therefore computed for the Kish effective
+    sample size, with the effective number of failures rounded up and the
+    effective sample size rounded down.
+
+    Args:
+        stratum_sizes: sequence with the number of combos of every stratum in
+            the release
+        n_sampled: sequence with the number of sampled combos of every stratum
+        n_failed: sequence with the number of failed combos in the sample of
+            every stratum
+        confidence: confidence level
+
+    Returns:
+        tuple with the weighted failure rate, the effective sample size and
+        the upper confidence limit of the failure rate
+    """
+    stratum_sizes = numpy.asarray(stratum_sizes, dtype=float)
+    n_sampled = numpy.asarray(n_sampled, dtype=float)
+    n_failed = numpy.asarray(n_failed, dtype=float)
+    if len(stratum_sizes) == 0 or (n_sampled == 0).any():
+        # a stratum without sample can't be bounded
+        return float('nan'), 0.0, 1.0
+
+    weights = stratum_sizes / stratum_sizes.sum()
+    failure_rate = float((weights * n_failed / n_sampled).sum())
+    n_effective = float(1.0 / (weights ** 2 / n_sampled).sum())
+
+    limit = upper_confidence_limit(
+        int(math.ceil(round(failure_rate * n_effective, 9))),
+        int(math.floor(round(n_effective, 9))),
+        confidence=confidence)
+    return failure_rate, n_effective, limit
+
+
+def resimulate(mecombo_emodel, resimulation_conf):
+    """Re-simulate a stratified sample of a release.
+
+    Args:
+        mecombo_emodel: pandas.DataFrame with the contents of
+            mecombo_emodel.tsv
+        resimulation_conf: dict with keys
+            - 'scores_db': path to the scores database of the release
+            - 'output_dir': output directory of the prepare step, with
+              final.json and emodel_dirs.json
+            - 'n_per_stratum' (default 1), 'strata' and 'seed': see
+              stratified_sample
+            - 'rtol' (default 1e-5) and 'atol' (default 1e-8): tolerances of
+              the scores and currents
+            - 'use_apical_points' (default True)
+            - 'n_processes': number of processes, all of them by default
+
+    Returns:
+        tuple with an OrderedDict created by compare_results and a dict with
+        keys 'n_strata', 'n_combos', 'n_failed', 'failure_rate',
+        'n_effective' and 'upper_failure_rate', see upper_failure_rate
+    """
+    output_dir = resimulation_conf['output_dir']
+    final_dict = tools.load_json(os.path.join(output_dir, 'final.json'))
+    emodel_dirs = tools.load_json(os.path.join(output_dir,
+                                               'emodel_dirs.json'))
+    strata = resimulation_conf.get('strata', STRATA)
+    rtol = resimulation_conf.get('rtol', 1e-5)
+    atol = resimulation_conf.get('atol', 1e-8)
+
+    sample = stratified_sample(
+        mecombo_emodel, resimulation_conf.get('n_per_stratum', 1),
+        strata=strata, seed=resimulation_conf.get('seed'))
+    rows = read_scores_rows(resimulation_conf['scores_db'], sample)
+    found_rows = rows[rows['uid'].notnull()]
+    n_strata = len(sample.groupby(strata))
+    print('Re-simulating %d me-combos of %d strata' % (len(rows), n_strata))
+
+    results = run_sample(
+        create_input_args(
+            found_rows, emodel_dirs, final_dict,
+            use_apical_points=resimulation_conf.get('use_apical_points',
+                                                    True)),
+        n_processes=resimulation_conf.get('n_processes'))
+    issues = compare_results(rows, results, rtol=rtol, atol=atol)
+
+    failed_combos = set().union(*issues.values())
+    n_failed = len(failed_combos)
+    stratum_sizes = mecombo_emodel.groupby(strata).size()
+    strata_stats = rows.assign(
+        failed=rows['combo_name'].isin(failed_combos)).groupby(strata).agg(
+            n_sampled=('failed', 'size'), n_failed=('failed', 'sum')) \
+        .reindex(stratum_sizes.index, fill_value=0)
+    failure_rate, n_effective, upper_rate = upper_failure_rate(
+        stratum_sizes, strata_stats['n_sampled'],
+        strata_stats['n_failed'])
+    summary = {'n_strata': n_strata,
+               'n_combos': len(rows),
+               'n_failed': n_failed,
+               'failure_rate': failure_rate,
+               'n_effective': n_effective,
+               'upper_failure_rate': upper_rate}
+    print('%d of %d re-simulated me-combos differ from the release. Weighted '
+          'by the size of the strata, the fraction of irreproducible '
+          'me-combos in the release is %.3g, and at most %.3g with 95%% '
+          'confidence (effective sample size %.1f)' %
+          (n_failed, len(rows), failure_rate, upper_rate, n_effective))
+    return issues, summary
@@ -0,0 +1,233 @@
+"""Cross-checks of a me-combo release"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+"""The release files and the hoc and morphology directories are loaded
+concurrently, every directory with a single scan. The checks are hash-based
+set operations on whole columns, and the references to e-models and
+morphologies are only checked for their unique values.
+"""
+
+# pylint: disable=C0325
+
+import os
+import collections
+import multiprocessing.pool
+
+import numpy
+import pandas
+
+from bluepymm.select_combos import megate_output, mecombo_release
+
+
+HOC_EXTENSION = '.hoc'
+CURRENT_COLUMNS = mecombo_release.CURRENT_COLUMNS
+# Maximal number of offending values printed per check
+N_PRINTED = 10
+
+
+def read_extneurondb_dat(extneurondb_path):
+    """Read extneurondb.dat.
+
+    Returns:
+        pandas.DataFrame with the string columns of extneurondb.dat
+    """
+    columns = megate_output.EXTNEURONDB_COLUMNS
+    return pandas.read_csv(extneurondb_path, sep=' ', header=None,
+                           names=columns, usecols=range(len(columns)),
+                           dtype=str, keep_default_na=False)
+
+
+def scan_dir(path, extension=None):
+    """Names of the files in a directory, without extension.
+
+    Args:
+        path: directory
+        extension: if not None, only files with this extension are returned
+
+    Returns:
+        set of names
+    """
+    names = set()
+    for entry in os.scandir(path):
+        name, ext = os.path.splitext(entry.name)
+        if extension is None or ext == extension:
+            names.add(name)
+    return names
+
+
+def _load(task):
+    """Run a loading task"""
+    function, args = task
+    return function(*args)
+
+
+def load_release(extneurondb_path, mecombo_emodel_path, emodels_hoc_dir,
+                 morph_dir=None):
+    """Load the release files and scan the directories concurrently.
+
+    Args:
+        extneurondb_path: path of extneurondb.dat
+        mecombo_emodel_path: path of mecombo_emodel.tsv
+        emodels_hoc_dir: directory with the .hoc file of every e-model
+        morph_dir: directory with the morphologies, None to skip it
+
+    Returns:
+        tuple with the contents of extneurondb.dat and mecombo_emodel.tsv,
+        the set of e-models with a .hoc file and the set of morphologies, the
+        latter is None if morph_dir is None
+    """
+    tasks = [(read_extneurondb_dat, (extneurondb_path,)),
+             (mecombo_release.read_mecombo_emodel_tsv, (mecombo_emodel_path,)),
+             (scan_dir, (emodels_hoc_dir, HOC_EXTENSION))]
+    if morph_dir is not None:
+        tasks.append((scan_dir, (morph_dir,)))
+
+    # threads, since the results are large and the work is mostly I/O
+    pool = multiprocessing.pool.ThreadPool(len(tasks))
+    try:
+        results = pool.map(_load, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    if morph_dir is None:
+        results.append(None)
+    return tuple(results)
+
+
+def _duplicates(names):
+    """Sorted unique values that appear more than once"""
+    if names.is_monotonic_increasing:
+        # the release files are sorted, duplicates are adjacent
+        values = names.to_numpy(dtype=object)
+        return sorted(set(values[1:][values[1:] == values[:-1]]))
+    return sorted(names[names.duplicated()].unique())
+
+
+def _missing(columns, available):
+    """Sorted unique names of the columns that are not in available"""
+    unique_names = pandas.Series(
+        pandas.concat([pandas.Series(column.unique())
+                       for column in columns]).unique())
+    return sorted(unique_names[~unique_names.isin(list(available))])
+
+
+def _not_in(names, other_names):
+    """Sorted names that are not in the pandas.Series other_names"""
+    return sorted(names[~names.isin(other_names)].unique())
+
+
+def _same_order(ext_names, tsv_names):
+    """Whether both files list the same combos in the same order"""
+    return len(ext_names) == len(tsv_names) and (
+        ext_names.to_numpy(dtype=object) ==
+        tsv_names.to_numpy(dtype=object)).all()
+
+
+def _inconsistent_combos(extneurondb, mecombo_emodel, same_order):
+    """Names of combos of which the columns of extneurondb.dat differ from
+    those in mecombo_emodel.tsv"""
+    columns = megate_output.EXTNEURONDB_COLUMNS
+    if same_order:
+        ext, tsv = extneurondb, mecombo_emodel
+    else:
+        merged = extneurondb[columns].merge(
+            mecombo_emodel[columns], on='combo_name', suffixes=('', '_tsv'))
+        ext = merged[columns]
+        tsv = merged[[column if column == 'combo_name'
+                      else column + '_tsv' for column in columns]].set_axis(
+                          columns, axis=1)
+
+    differs = numpy.zeros(len(ext), dtype=bool)
+    for column in columns:
+        if column != 'combo_name':
+            differs |= ext[column].to_numpy(dtype=object) != \
+                tsv[column].to_numpy(dtype=object)
+    return sorted(ext['combo_name'].to_numpy(dtype=object)[differs])
+
+
+def check_release(extneurondb, mecombo_emodel, emodels_hoc, morphologies=None,
+                  check_currents=True):
+    """Cross-check the contents of a release.
+
+    Args:
+        extneurondb: pandas.DataFrame with the contents of extneurondb.dat
+        mecombo_emodel: pandas.DataFrame with the contents of
+            mecombo_emodel.tsv
+        emodels_hoc: set of e-models with a .hoc file
+        morphologies: set of available morphologies, None to skip the check
+        check_currents: check that every combo has a threshold and holding
+            current
+
+    Returns:
+        OrderedDict mapping the names of the checks to sorted lists of the
+        offending values, which are empty if the check passed
+    """
+    tsv_names = mecombo_emodel['combo_name']
+    ext_names = extneurondb['combo_name']
+    # usually both files are written in the same order, in which case most
+    # of the combo name checks are trivial
+    same_order = _same_order(ext_names, tsv_names)
+
+    issues = collections.OrderedDict()
+    issues['duplicate combo names in mecombo_emodel.tsv'] = _duplicates(
+        tsv_names)
+    if same_order:
+        issues['duplicate combo names in extneurondb.dat'] = list(
+            issues['duplicate combo names in mecombo_emodel.tsv'])
+        issues['combos missing in extneurondb.dat'] = []
+        issues['combos missing in mecombo_emodel.tsv'] = []
+    else:
+        issues['duplicate combo names in extneurondb.dat'] = _duplicates(
+            ext_names)
+        issues['combos missing in extneurondb.dat'] = _not_in(tsv_names,
+                                                              ext_names)
+        issues['combos missing in mecombo_emodel.tsv'] = _not_in(ext_names,
+                                                                 tsv_names)
+    issues['combos that differ between extneurondb.dat and '
+           'mecombo_emodel.tsv'] = _inconsistent_combos(
+               extneurondb, mecombo_emodel, same_order)
+    issues['e-models without .hoc file'] = _missing(
+        [mecombo_emodel['emodel']], emodels_hoc)
+    if morphologies is not None:
+        issues['missing morphologies'] = _missing(
+            [mecombo_emodel['morph_name'], extneurondb['morph_name']],
+            morphologies)
+    if check_currents:
+        for column in CURRENT_COLUMNS:
+            issues['combos without %s' % column] = sorted(
+                tsv_names[mecombo_emodel[column].isnull()])
+    return issues
+
+
+def format_issues(issues):
+    """Format the result of check_release as a string"""
+    lines = []
+    for check, values in issues.items():
+        if values:
+            line = '%s: %d' % (check, len(values))
+            line += ' (%s%s)' % (', '.join(str(value) for value
+                                           in values[:N_PRINTED]),
+                                 ', ...' if len(values) > N_PRINTED else '')
+        else:
+            line = '%s: none' % check
+        lines.append(line)
+    return '\n'.join(lines)
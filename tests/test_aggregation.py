@@ -0,0 +1,108 @@
+"""Tests for select_combos/aggregation.py"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import pandas
+import pandas.testing
+
+import pytest
+
+from bluepymm.select_combos import aggregation
+
+
+def _combos():
+    """Helper function to create run combos and selected combos"""
+    data = pandas.DataFrame({
+        'morph_name': ['morph2', 'morph1', 'morph2', 'morph1', 'morph3',
+                       'morph2'],
+        'fullmtype': ['mtype2', 'mtype1', 'mtype2', 'mtype1', 'mtype1',
+                      'mtype2'],
+        'etype': ['etype1', 'etype1', 'etype2', 'etype2', 'etype1',
+                  'etype1'],
+        'is_exemplar': [0, 0, 0, 0, 0, 1],
+        'exception': [None, 'error', None, None, 'error', None]},
+        index=[10, 11, 12, 13, 14, 15])
+    final_db = data.loc[[10, 13]]
+    return data, final_db
+
+
+@pytest.mark.unit
+def test_metype_column():
+    """select_combos.aggregation: test metype_column"""
+    data, _ = _combos()
+    ret = aggregation.metype_column(data)
+    assert ret.tolist() == ['etype1_mtype2', 'etype1_mtype1',
+                            'etype2_mtype2', 'etype2_mtype1',
+                            'etype1_mtype1', 'etype1_mtype2']
+
+
+@pytest.mark.unit
+def test_count_passed_per_mtype():
+    """select_combos.aggregation: test count_passed_per_mtype"""
+    fullmtypes = pandas.Series(['mtype2', 'mtype1', 'mtype2', 'mtype2'])
+    megate_scores = pandas.DataFrame(
+        {'Passed all': [True, False, False, True]})
+    ret = aggregation.count_passed_per_mtype(fullmtypes, megate_scores)
+    assert ret.index.tolist() == ['mtype2', 'mtype1']
+    assert ret['passed'].tolist() == [2, 0]
+    assert ret['failed'].tolist() == [1, 1]
+
+
+@pytest.mark.unit
+def test_count_results_per_morphology():
+    """select_combos.aggregation: test count_results_per_morphology"""
+    data, final_db = _combos()
+    ret = aggregation.count_results_per_morphology(data, final_db)
+    expected = pandas.DataFrame(
+        {'passed': [1, 1, 0], 'error': [0, 1, 1], 'failed': [1, 0, 0]},
+        columns=['passed', 'error', 'failed'],
+        index=['morph2 (mtype2, etype1)', 'morph1 (mtype1, etype1)',
+               'morph3 (mtype1, etype1)'])
+    pandas.testing.assert_frame_equal(ret, expected, check_dtype=False)
+
+
+@pytest.mark.unit
+def test_count_results_per_metype():
+    """select_combos.aggregation: test count_results_per_metype"""
+    data, final_db = _combos()
+    ret = aggregation.count_results_per_metype(data, final_db)
+    expected = pandas.DataFrame(
+        {'passed': [1, 0, 0, 1], 'error': [0, 2, 0, 0],
+         'failed': [0, 0, 1, 0]},
+        columns=['passed', 'error', 'failed'],
+        index=['etype1_mtype2', 'etype1_mtype1', 'etype2_mtype2',
+               'etype2_mtype1'])
+    pandas.testing.assert_frame_equal(ret, expected, check_dtype=False)
+    assert 'metype' not in data.columns
+    assert 'metype' not in final_db.columns
+
+
+@pytest.mark.unit
+def test_result_accumulator():
+    """select_combos.aggregation: test ResultAccumulator"""
+    results = aggregation.ResultAccumulator(['table1', 'table2'])
+    results.add(table1=pandas.DataFrame({'a': [1, 2]}, index=[5, 7]))
+    results.add(table1=pandas.DataFrame({'a': [3]}, index=[2]))
+
+    ret = results.concat('table1')
+    assert ret.index.tolist() == [5, 7, 2]
+    assert ret['a'].tolist() == [1, 2, 3]
+    assert results.concat('table2').empty
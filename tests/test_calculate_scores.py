@@ -61,14 +61,25 @@ def test_run_emodel_morph_isolated():
         None,
         False)
     ret = run_combos.calculate_scores.run_emodel_morph_isolated(input_args)
+    timings = ret.pop('timings')
 
-    expected_ret = {'exception': None,
+    expected_ret = {'early_stop_reason': None,
+                    'exception': None,
+                    'exception_type': None,
                     'extra_values': {'holding_current': None,
                                      'threshold_current': None},
                     'scores': {'Step1.SpikeCount': 20.0},
                     'uid': 0}
     assert ret == expected_ret
 
+    assert sorted(timings.keys()) == ['cpu_time', 'peak_rss_mb',
+                                      'protocol_times', 'wall_time', 'worker']
+    assert list(timings['protocol_times'].keys()) == ['Step1']
+    assert timings['wall_time'] >= timings['protocol_times']['Step1'] > 0
+    assert timings['cpu_time'] > 0
+    assert timings['peak_rss_mb'] > 0
+    assert timings['worker'] == tools.get_worker_id()
+
 
 @pytest.mark.unit
 def test_run_emodel_morph_isolated_exception():
@@ -95,14 +106,107 @@ def test_run_emodel_morph_isolated_exception():
     ret = run_combos.calculate_scores.run_emodel_morph_isolated(input_args)
 
     # verify output: exception thrown because of non-existing e-model
-    expected_ret = {'exception': 'this_is_a_placeholder',
+    expected_ret = {'early_stop_reason': None,
+                    'exception': 'this_is_a_placeholder',
+                    'exception_type': 'error',
                     'extra_values': None,
                     'scores': None,
+                    'timings': 'this_is_a_placeholder',
                     'uid': 0}
     assert ret.keys() == expected_ret.keys()
-    for k in ['extra_values', 'scores', 'uid']:
+    for k in ['exception_type', 'extra_values', 'scores', 'uid']:
         assert ret[k] == expected_ret[k]
     assert emodel in ret['exception']
+    assert ret['timings']['wall_time'] > 0
+    assert ret['timings']['protocol_times'] is None
+
+
+def _sleep(*_, **__):
+    """Helper function that runs longer than the tests' time limit."""
+    time.sleep(60)
+
+
+def _allocate(*_, **__):
+    """Helper function that exceeds the tests' memory limit."""
+    data = bytearray(200 * 1024 ** 2)
+    time.sleep(60)
+    return data
+
+
+def _crash(*_, **__):
+    """Helper function that kills its own process."""
+    os._exit(1)
+
+
+@pytest.mark.unit
+def test_wait_isolated():
+    """run_combos.calculate_scores: test wait_isolated."""
+    for function, limits, exception_type in [
+            (_sleep, (1, None), 'timeout'),
+            (_allocate, (None, 100), 'oom'),
+            (_crash, (None, None), 'crash')]:
+        pool = tools.NestedPool(1, maxtasksperchild=1)
+        async_result = pool.apply_async(function)
+        with pytest.raises(
+                run_combos.calculate_scores.ComboLimitError) as e:
+            run_combos.calculate_scores.wait_isolated(
+                pool, async_result, *limits)
+        assert e.value.exception_type == exception_type
+        pool.terminate()
+        pool.join()
+
+    pool = tools.NestedPool(1, maxtasksperchild=1)
+    async_result = pool.apply_async(max, (1, 2))
+    assert run_combos.calculate_scores.wait_isolated(
+        pool, async_result, 10, 1000) == 2
+    pool.terminate()
+    pool.join()
+
+
+@pytest.mark.unit
+def test_run_emodel_morph_isolated_timeout(monkeypatch):
+    """run_combos.calculate_scores: test run_emodel_morph_isolated timeout."""
+    monkeypatch.setattr(run_combos.calculate_scores,
+                        '_run_emodel_morph_timed', _sleep)
+    input_args = (5, 'emodel1', None, None, None, None, False)
+    ret = run_combos.calculate_scores.run_emodel_morph_isolated(
+        input_args, combo_timeout=1)
+
+    assert ret['uid'] == 5
+    assert ret['scores'] is None
+    assert ret['exception_type'] == 'timeout'
+    assert ret['exception'].startswith('timeout: ')
+    assert 1 <= ret['timings']['wall_time'] < 30
+
+
+@pytest.mark.unit
+def test_run_task():
+    """run_combos.calculate_scores: test run_task."""
+    emodel = 'emodel1'
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    morph_path = os.path.join(TEST_DIR, 'data/morphs/morph1.asc')
+    task_context = {'emodels': [(emodel, emodel_dir, {'cm': 1.0})],
+                    'morphs': [(morph_path, None)],
+                    'extra_values_error': False,
+                    'combo_timeout': None,
+                    'combo_max_rss_mb': None,
+                    'synthetic_evaluator': None}
+
+    run_combos.calculate_scores.init_task_context(task_context)
+    try:
+        ret = run_combos.calculate_scores.run_task((3, 0, 0))
+    finally:
+        run_combos.calculate_scores.init_task_context(None)
+    ret.pop('timings')
+
+    expected_ret = {'early_stop_reason': None,
+                    'exception': None,
+                    'exception_type': None,
+                    'extra_values': {'holding_current': None,
+                                     'threshold_current': None},
+                    'scores': {'Step1.SpikeCount': 20.0},
+                    'uid': 3}
+    assert ret == expected_ret
 
 
 @pytest.mark.unit
@@ -187,7 +291,6 @@ def test_create_arg_list():
     params = 'test'
     final_dict = {emodel: {'params': params}}
     extra_values_error = False
-    # from nose.tools import set_trace; set_trace()
     ret = run_combos.calculate_scores.create_arg_list(
         testsqlite_filename,
         emodel_dirs,
@@ -205,6 +308,61 @@ def test_create_arg_list():
     assert ret == expected_ret
 
 
+@pytest.mark.unit
+def test_create_task_list():
+    """run_combos.calculate_scores: test create_task_list."""
+    # write database
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_task_list.sqlite')
+    index = 0
+    morph_name = 'morph'
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    mtype = 'mtype'
+    etype = 'etype'
+    layer = 'layer'
+    emodel = 'emodel'
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    row = {'index': index,
+           'morph_name': morph_name,
+           'morph_ext': None,
+           'morph_dir': morph_dir,
+           'mtype': mtype,
+           'etype': etype,
+           'layer': layer,
+           'emodel': emodel,
+           'original_emodel': emodel,
+           'to_run': 1}
+    _write_test_scores_database(row, testsqlite_filename)
+
+    # extra input parameters
+    emodel_dirs = {emodel: emodel_dir}
+    params = 'test'
+    final_dict = {emodel: {'params': params}}
+    extra_values_error = False
+    task_context = run_combos.calculate_scores.create_task_context(
+        testsqlite_filename,
+        emodel_dirs,
+        final_dict,
+        extra_values_error)
+    ret = run_combos.calculate_scores.create_task_list(
+        testsqlite_filename, task_context)
+
+    # verify output
+    morph_path = os.path.join(morph_dir, '{}.asc'.format(morph_name))
+    expected_context = {
+        'emodels': [(emodel, os.path.abspath(emodel_dirs[emodel]), params)],
+        'emodel_ids': {(emodel, emodel): 0},
+        'morphs': [(os.path.abspath(morph_path), 0)],
+        'morph_ids': {(morph_dir, morph_name, None): 0},
+        'extra_values_error': extra_values_error,
+        'combo_timeout': None,
+        'combo_max_rss_mb': None,
+        'synthetic_evaluator': None,
+        'early_stop': None}
+    assert task_context == expected_context
+    expected_ret = [(index, 0, 0)]
+    assert ret == expected_ret
+
+
 @pytest.mark.unit
 def test_create_arg_list_exception():
     """run_combos.calculate_scores: test create_arg_list for ValueError."""
@@ -238,9 +396,106 @@ def test_create_arg_list_exception():
     # emodel is None -> raises ValueError
     with pytest.raises(ValueError):
         run_combos.calculate_scores.create_arg_list(
-            testsqlite_filename,
-            emodel_dirs,
-            final_dict)
+            testsqlite_filename, emodel_dirs, final_dict)
+
+    task_context = run_combos.calculate_scores.create_task_context(
+        testsqlite_filename,
+        emodel_dirs,
+        final_dict)
+    with pytest.raises(ValueError):
+        run_combos.calculate_scores.create_task_list(
+            testsqlite_filename, task_context)
+
+
+@pytest.mark.unit
+def test_create_task_context_no_apical_points():
+    """run_combos.calculate_scores: test create_task_context without apical
+    points file."""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_no_apical.sqlite')
+    emodel = 'emodel'
+    row = {'index': 0,
+           'morph_name': 'morph',
+           'morph_ext': None,
+           'morph_dir': os.path.join(TEST_DIR, 'data'),
+           'emodel': emodel,
+           'original_emodel': emodel,
+           'to_run': 1}
+    _write_test_scores_database(row, testsqlite_filename)
+    emodel_dirs = {emodel: os.path.join(TEST_DIR,
+                                        'data/emodels_dir/subdir/')}
+    final_dict = {emodel: {'params': 'test'}}
+
+    with pytest.raises(IOError):
+        run_combos.calculate_scores.create_task_context(
+            testsqlite_filename, emodel_dirs, final_dict)
+
+    task_context = run_combos.calculate_scores.create_task_context(
+        testsqlite_filename, emodel_dirs, final_dict,
+        use_apical_points=False)
+    assert task_context['morphs'][0][1] is None
+
+
+@pytest.mark.unit
+def test_iter_tasks():
+    """run_combos.calculate_scores: test iter_tasks reads all pages."""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_iter_tasks.sqlite')
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    rows = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2'] * 3,
+        'morph_ext': [None] * 6,
+        'morph_dir': [morph_dir] * 6,
+        'mtype': ['mtype'] * 6,
+        'etype': ['etype'] * 6,
+        'layer': ['layer'] * 6,
+        'emodel': ['emodel1'] * 3 + ['emodel2'] * 3,
+        'original_emodel': ['emodel1'] * 3 + ['emodel2'] * 3,
+        'to_run': [1, 1, 0, 1, 1, 1]})
+    with sqlite3.connect(testsqlite_filename) as conn:
+        rows.to_sql('scores', conn, if_exists='replace')
+
+    task_context = {'emodel_ids': {('emodel1', 'emodel1'): 0,
+                                   ('emodel2', 'emodel2'): 1},
+                    'morph_ids': {(morph_dir, 'morph1', None): 0,
+                                  (morph_dir, 'morph2', None): 1}}
+    tasks = run_combos.calculate_scores.iter_tasks(
+        testsqlite_filename, task_context, page_size=2)
+
+    expected_tasks = [(0, 0, 0), (1, 0, 1), (3, 1, 1), (4, 1, 0), (5, 1, 1)]
+    assert list(tasks) == expected_tasks
+    assert run_combos.calculate_scores.count_tasks(
+        testsqlite_filename) == len(expected_tasks)
+    assert run_combos.calculate_scores.count_tasks_per_emodel(
+        testsqlite_filename) == {'emodel1': 2, 'emodel2': 3}
+    assert run_combos.calculate_scores.count_tasks_per_emodel(
+        testsqlite_filename, index_range=(1, 3)) == {'emodel1': 1,
+                                                     'emodel2': 1}
+
+
+@pytest.mark.unit
+def test_imap_bounded():
+    """run_combos.calculate_scores: test imap_bounded."""
+    submitted = []
+
+    def submit(task, callback):
+        """Run task synchronously and keep track of the submissions"""
+        submitted.append(task)
+        callback(task * 2)
+
+    results = run_combos.calculate_scores.imap_bounded(
+        submit, iter(range(10)), max_pending=3)
+
+    # tasks are only consumed when the results are consumed
+    assert next(results) == 0
+    assert submitted == [0, 1, 2]
+    assert sorted(results) == [2 * task for task in range(1, 10)]
+
+    def submit_error(task, callback):
+        """Return an exception as result"""
+        callback(ValueError(task))
+
+    with pytest.raises(ValueError):
+        list(run_combos.calculate_scores.imap_bounded(
+            submit_error, [0], max_pending=1))
 
 
 def _dict_factory(cursor, row):
@@ -290,6 +545,34 @@ def test_save_scores():
         )
 
 
+@pytest.mark.unit
+def test_save_scores_timings():
+    """run_combos.calculate_scores: test save_scores with timings and
+    exception type"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test3_timings.sqlite')
+    row = {'scores': None,
+           'extra_values': None,
+           'exception': None,
+           'to_run': True}
+    _write_test_scores_database(row, testsqlite_filename)
+    run_combos.calculate_scores.add_result_columns(testsqlite_filename)
+    # adding the columns twice is harmless
+    run_combos.calculate_scores.add_result_columns(testsqlite_filename)
+
+    timings = {'wall_time': 2.0, 'cpu_time': 1.5, 'peak_rss_mb': 100.0,
+               'protocol_times': {'Step1': 1.0}, 'worker': 'host:1'}
+    run_combos.calculate_scores.save_scores(
+        testsqlite_filename, 0, {'score': 1}, {'extra': 2}, 'timeout: ...',
+        timings=timings, exception_type='timeout')
+
+    with sqlite3.connect(testsqlite_filename) as scores_db:
+        db_row = scores_db.execute(
+            'SELECT exception_type, wall_time, cpu_time, peak_rss_mb, '
+            'protocol_times, worker FROM scores').fetchone()
+    assert db_row == ('timeout', 2.0, 1.5, 100.0,
+                      json.dumps({'Step1': 1.0}), 'host:1')
+
+
 @pytest.mark.unit
 def test_expand_scores_to_score_values_table():
     """run_combos.calculate_scores: test expand_scores_to_score_values_table"""
@@ -401,7 +684,15 @@ def test_calculate_scores(ipp_cluster_fixture):
             scores_db.row_factory = _dict_factory
             scores_cursor = scores_db.execute('SELECT * FROM scores')
             db_row = scores_cursor.fetchall()[0]
+            db_timings = {column: db_row.pop(column) for column, _
+                          in run_combos.calculate_scores.RESULT_COLUMNS}
             assert db_row == expected_db_row
+            assert db_timings['exception_type'] is None
+            assert db_timings['early_stop_reason'] is None
+            assert db_timings['wall_time'] > 0
+            assert list(json.loads(db_timings['protocol_times']).keys()) == \
+                ['Step1']
+            assert db_timings['worker'] is not None
 
 
 @pytest.mark.unit
@@ -414,3 +705,220 @@ def test_read_apical_point():
         morph_dir, morph_name)
 
     assert apical_point_isec == 0
+    assert run_combos.calculate_scores.read_apical_point(
+        morph_dir, 'unknown_morph') is None
+
+
+@pytest.mark.unit
+def test_read_apical_points_index():
+    """run_combos.calculate_scores: test read_apical_points_index."""
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    no_apical_points_dir = os.path.join(TEST_DIR, 'data')
+
+    apical_points_index = \
+        run_combos.calculate_scores.read_apical_points_index(
+            [morph_dir, morph_dir])
+
+    expected_index = {morph_dir: {'morph': 0}}
+    assert apical_points_index == expected_index
+
+    with pytest.raises(IOError):
+        run_combos.calculate_scores.read_apical_points_index(
+            [morph_dir, no_apical_points_dir])
+
+
+@pytest.mark.unit
+def test_calculate_scores_sharded():
+    """run_combos.calculate_scores: test calculate_scores with shards"""
+    test_db_filename = os.path.join(TMP_DIR, 'test_sharded.sqlite')
+    for shard_db_filename in \
+            run_combos.calculate_scores.find_shard_db_filenames(
+                test_db_filename):
+        os.remove(shard_db_filename)
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    rows = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2', 'morph1'],
+        'morph_ext': [None] * 3,
+        'morph_dir': [morph_dir] * 3,
+        'mtype': ['mtype1'] * 3,
+        'etype': ['etype1'] * 3,
+        'layer': [1] * 3,
+        'emodel': ['emodel1'] * 3,
+        'original_emodel': ['emodel1'] * 3,
+        'to_run': [1] * 3,
+        'scores': [None] * 3,
+        'extra_values': [None] * 3,
+        'exception': [None] * 3})
+    with sqlite3.connect(test_db_filename) as conn:
+        rows.to_sql('scores', conn, if_exists='replace')
+
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    emodel_dirs = {'emodel1': emodel_dir}
+    final_dict = tools.load_json(os.path.join(emodel_dir, 'final.json'))
+
+    # run shard 0 of 2 twice: second run has nothing left to do
+    for _ in range(2):
+        run_combos.calculate_scores.calculate_scores(
+            final_dict, emodel_dirs, test_db_filename, n_processes=1,
+            shard=(0, 2))
+
+    shard_db_filename = run_combos.calculate_scores.get_shard_db_filename(
+        test_db_filename, 0, 2)
+    assert run_combos.calculate_scores.find_shard_db_filenames(
+        test_db_filename) == [shard_db_filename]
+    scores_db_id = run_combos.calculate_scores.get_scores_db_id(
+        test_db_filename)
+    assert run_combos.calculate_scores.read_shard_uids(
+        shard_db_filename, scores_db_id) == {0, 2}
+    # the scores database itself is not modified
+    assert run_combos.calculate_scores.count_tasks(test_db_filename) == 3
+
+    n_merged = run_combos.calculate_scores.merge_shard_scores(
+        test_db_filename, [shard_db_filename])
+    assert n_merged == 2
+    assert run_combos.calculate_scores.count_tasks(test_db_filename) == 1
+    assert run_combos.calculate_scores.count_tasks(
+        test_db_filename, shard=(1, 2)) == 1
+
+    # merging again has no effect
+    assert run_combos.calculate_scores.merge_shard_scores(
+        test_db_filename, [shard_db_filename]) == 0
+
+    with sqlite3.connect(test_db_filename) as scores_db:
+        scores_db.row_factory = _dict_factory
+        db_row = scores_db.execute(
+            'SELECT * FROM scores WHERE `index`=2').fetchone()
+    assert db_row['to_run'] == 0
+    assert json.loads(db_row['scores']) == {'Step1.SpikeCount': 20.0}
+
+
+@pytest.mark.unit
+def test_merge_shard_scores_stale():
+    """run_combos.calculate_scores: test shard databases of another scores
+    database are refused"""
+    test_db_filename = os.path.join(TMP_DIR, 'test_stale_shard.sqlite')
+    shard_db_filename = run_combos.calculate_scores.get_shard_db_filename(
+        test_db_filename, 0, 2)
+    for filename in [test_db_filename, shard_db_filename]:
+        if os.path.exists(filename):
+            os.remove(filename)
+    rows = pandas.DataFrame({'to_run': [1] * 3, 'scores': [None] * 3,
+                             'extra_values': [None] * 3,
+                             'exception': [None] * 3})
+    with sqlite3.connect(test_db_filename) as conn:
+        rows.to_sql('scores', conn)
+    run_combos.calculate_scores.save_shard_scores(
+        shard_db_filename, 0, {}, {}, None)
+    run_combos.calculate_scores.read_shard_uids(shard_db_filename, 'old_id')
+
+    scores_db_id = run_combos.calculate_scores.get_scores_db_id(
+        test_db_filename)
+    assert scores_db_id == run_combos.calculate_scores.get_scores_db_id(
+        test_db_filename)
+    with pytest.raises(ValueError):
+        run_combos.calculate_scores.read_shard_uids(shard_db_filename,
+                                                    scores_db_id)
+    with pytest.raises(ValueError):
+        run_combos.calculate_scores.merge_shard_scores(test_db_filename,
+                                                       [shard_db_filename])
+    assert run_combos.calculate_scores.count_tasks(test_db_filename) == 3
+
+
+@pytest.mark.unit
+def test_calculate_scores_claimed():
+    """run_combos.calculate_scores: test calculate_scores claiming batches"""
+    test_db_filename = os.path.join(TMP_DIR, 'test_claimed.sqlite')
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    rows = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2', 'morph1'],
+        'morph_ext': [None] * 3,
+        'morph_dir': [morph_dir] * 3,
+        'mtype': ['mtype1'] * 3,
+        'etype': ['etype1'] * 3,
+        'layer': [1] * 3,
+        'emodel': ['emodel1'] * 3,
+        'original_emodel': ['emodel1'] * 3,
+        'to_run': [1] * 3,
+        'scores': [None] * 3,
+        'extra_values': [None] * 3,
+        'exception': [None] * 3})
+    with sqlite3.connect(test_db_filename) as conn:
+        rows.to_sql('scores', conn, if_exists='replace')
+        conn.execute('DROP TABLE IF EXISTS claims')
+
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    emodel_dirs = {'emodel1': emodel_dir}
+    final_dict = tools.load_json(os.path.join(emodel_dir, 'final.json'))
+
+    run_combos.calculate_scores.calculate_scores(
+        final_dict, emodel_dirs, test_db_filename, n_processes=1,
+        claim=True, batch_size=2)
+
+    assert run_combos.calculate_scores.count_tasks(test_db_filename) == 0
+    with sqlite3.connect(test_db_filename) as conn:
+        batches = pandas.read_sql('SELECT * FROM claims', conn)
+        score_values = pandas.read_sql('SELECT * FROM score_values', conn)
+    assert (batches['status'] == 'done').all()
+    assert len(batches) == 2
+    assert len(score_values) == 3
+
+    with pytest.raises(ValueError):
+        run_combos.calculate_scores.calculate_scores(
+            final_dict, emodel_dirs, test_db_filename, n_processes=1,
+            claim=True, shard=(0, 2))
+
+
+@pytest.mark.unit
+def test_calculate_scores_early_stop():
+    """run_combos.calculate_scores: test calculate_scores with early stop"""
+    test_db_filename = os.path.join(TMP_DIR, 'test_early_stop.sqlite')
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    rows = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph1', 'morph1'],
+        'morph_ext': [None] * 3,
+        'morph_dir': [morph_dir] * 3,
+        'fullmtype': [None, 'mtype1', 'mtype2'],
+        'etype': ['etype1'] * 3,
+        'emodel': ['emodel1'] * 3,
+        'original_emodel': ['emodel1'] * 3,
+        'is_exemplar': [1, 0, 0],
+        'is_repaired': [1, 1, 1],
+        'is_original': [0, 0, 0],
+        'to_run': [1] * 3,
+        'scores': [None] * 3,
+        'extra_values': [None] * 3,
+        'exception': [None] * 3})
+    with sqlite3.connect(test_db_filename) as conn:
+        rows.to_sql('scores', conn, if_exists='replace')
+
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    emodel_dirs = {'emodel1': emodel_dir}
+    final_dict = tools.load_json(os.path.join(emodel_dir, 'final.json'))
+
+    # the score of Step1.SpikeCount is 20 for the exemplar, so the bound is
+    # 2 for mtype1 and 100 for mtype2
+    early_stop = run_combos.early_stop.read_early_stop_config({
+        'megate_thresholds': [
+            {'emodel': ['.*'], 'fullmtype': ['mtype1'], 'etype': ['.*'],
+             'features': ['.*'], 'megate_threshold': 0.1},
+            {'emodel': ['.*'], 'fullmtype': ['mtype2'], 'etype': ['.*'],
+             'features': ['.*'], 'megate_threshold': 5}]})
+    run_combos.calculate_scores.calculate_scores(
+        final_dict, emodel_dirs, test_db_filename, n_processes=1,
+        early_stop=early_stop)
+
+    with sqlite3.connect(test_db_filename) as conn:
+        results = conn.execute(
+            'SELECT to_run, scores, early_stop_reason FROM scores '
+            'ORDER BY `index`').fetchall()
+    scores = json.dumps({'Step1.SpikeCount': 20.0})
+    assert results[0] == (0, scores, None)
+    assert results[1][:2] == (0, scores)
+    assert results[1][2].startswith('Score 20.0 of Step1.SpikeCount is above '
+                                    'megate threshold 2.0')
+    assert results[2] == (0, scores, None)
+
+    with pytest.raises(ValueError):
+        run_combos.calculate_scores.calculate_scores(
+            final_dict, emodel_dirs, test_db_filename, n_processes=1,
+            early_stop=early_stop, shard=(0, 2))
@@ -0,0 +1,121 @@
+"""Tests for bluepymm.run_combos.claims"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import time
+import sqlite3
+
+import pandas
+import pytest
+
+from bluepymm.run_combos import claims
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
+
+
+def _write_test_scores_database(to_run, testsqlite_filename):
+    """Helper function to create test scores database."""
+    if os.path.exists(testsqlite_filename):
+        os.remove(testsqlite_filename)
+    df = pandas.DataFrame({'to_run': to_run})
+    with sqlite3.connect(testsqlite_filename) as conn:
+        df.to_sql('scores', conn, if_exists='replace')
+
+
+def _read_claims(testsqlite_filename):
+    """Helper function to read the claims table."""
+    with sqlite3.connect(testsqlite_filename) as conn:
+        return pandas.read_sql('SELECT * FROM claims', conn)
+
+
+@pytest.mark.unit
+def test_init_claims_table():
+    """run_combos.claims: test init_claims_table"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_init_claims.sqlite')
+    _write_test_scores_database([1, 0, 1, 1, 1, 1], testsqlite_filename)
+
+    assert claims.init_claims_table(testsqlite_filename, 2) == 3
+    batches = _read_claims(testsqlite_filename)
+    assert batches['first_index'].tolist() == [0, 3, 5]
+    assert batches['last_index'].tolist() == [2, 4, 5]
+    assert (batches['status'] == 'pending').all()
+
+    # existing table is reused
+    assert claims.init_claims_table(testsqlite_filename, 10) == 3
+    assert len(_read_claims(testsqlite_filename)) == 3
+
+
+@pytest.mark.unit
+def test_claim_complete_batches():
+    """run_combos.claims: test claiming and completing batches"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_claim_batches.sqlite')
+    _write_test_scores_database([1, 1, 1], testsqlite_filename)
+    claims.init_claims_table(testsqlite_filename, 2)
+
+    batch1 = claims.claim_batch(testsqlite_filename, 'worker1', 600)
+    batch2 = claims.claim_batch(testsqlite_filename, 'worker2', 600)
+    assert batch1 == (1, 0, 1)
+    assert batch2 == (2, 2, 2)
+    assert claims.claim_batch(testsqlite_filename, 'worker3', 600) is None
+
+    assert claims.renew_lease(testsqlite_filename, 1, 'worker1', 600)
+    assert not claims.renew_lease(testsqlite_filename, 1, 'worker2', 600)
+
+    # only the worker that completes the last batch gets True
+    assert not claims.complete_batch(testsqlite_filename, 1, 'worker1')
+    assert claims.complete_batch(testsqlite_filename, 2, 'worker2')
+    assert (_read_claims(testsqlite_filename)['status'] == 'done').all()
+
+
+@pytest.mark.unit
+def test_claim_expired_lease():
+    """run_combos.claims: test reclaiming a batch with an expired lease"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_expired_lease.sqlite')
+    _write_test_scores_database([1, 1], testsqlite_filename)
+    claims.init_claims_table(testsqlite_filename, 2)
+
+    assert claims.claim_batch(testsqlite_filename, 'worker1', 0.01) is not None
+    time.sleep(0.02)
+    assert claims.claim_batch(testsqlite_filename, 'worker2', 600) == \
+        (1, 0, 1)
+
+    # dead worker can't renew nor complete the batch anymore
+    assert not claims.renew_lease(testsqlite_filename, 1, 'worker1', 600)
+    assert not claims.complete_batch(testsqlite_filename, 1, 'worker1')
+    assert claims.complete_batch(testsqlite_filename, 1, 'worker2')
+    assert _read_claims(testsqlite_filename)['n_claims'].tolist() == [2]
+
+
+@pytest.mark.unit
+def test_lease_renewer():
+    """run_combos.claims: test LeaseRenewer"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_lease_renewer.sqlite')
+    _write_test_scores_database([1], testsqlite_filename)
+    claims.init_claims_table(testsqlite_filename, 1)
+    claims.claim_batch(testsqlite_filename, 'worker1', 0.3)
+
+    with claims.LeaseRenewer(testsqlite_filename, 1, 'worker1', 0.3):
+        time.sleep(0.5)
+        # lease was renewed, batch can't be claimed by other workers
+        assert claims.claim_batch(testsqlite_filename, 'worker2', 1) is None
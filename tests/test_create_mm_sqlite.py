@@ -24,6 +24,7 @@ import pandas
 import re
 import os
 import json
+import sqlite3
 
 import pytest
 
@@ -33,6 +34,7 @@ from bluepymm import tools
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 TEST_DIR = os.path.join(BASE_DIR, 'examples/simple1')
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
 
 
 @pytest.mark.unit
@@ -140,6 +142,32 @@ def test_remove_morph_regex_failures():
     pandas.testing.assert_frame_equal(ret, expected_ret)
 
 
+@pytest.mark.unit
+def test_write_scores_db():
+    """prepare_combos.create_mm_sqlite: test write_scores_db removes the
+    claims of a previous run and renews the creation id"""
+    output_filename = os.path.join(TMP_DIR, 'test_write_scores_db.sqlite')
+    full_map = pandas.DataFrame({'to_run': [True, True]})
+    tools.makedirs(TMP_DIR)
+
+    create_mm_sqlite.write_scores_db(full_map, output_filename)
+    with sqlite3.connect(output_filename) as conn:
+        conn.execute('CREATE TABLE claims (batch_id INTEGER PRIMARY KEY)')
+
+    with sqlite3.connect(output_filename) as conn:
+        creation_id = conn.execute(
+            "SELECT value FROM scores_info WHERE key='creation_id'").fetchone()
+
+    create_mm_sqlite.write_scores_db(full_map, output_filename)
+    with sqlite3.connect(output_filename) as conn:
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'")]
+        new_creation_id = conn.execute(
+            "SELECT value FROM scores_info WHERE key='creation_id'").fetchone()
+    assert sorted(tables) == ['scores', 'scores_info']
+    assert new_creation_id != creation_id
+
+
 @pytest.mark.unit
 def test_create_mm_sqlite():
     """prepare_combos.create_mm_sqlite: test create_mm_sqlite
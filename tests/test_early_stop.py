@@ -0,0 +1,176 @@
+"""Tests for bluepymm.run_combos.early_stop"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import pytest
+
+from bluepymm.run_combos import calculate_scores, early_stop
+
+
+SELECT_CONF = {
+    'to_skip_features': ['Skipped.*'],
+    'megate_thresholds': [
+        {'emodel': ['.*'], 'fullmtype': ['.*'], 'etype': ['.*'],
+         'features': ['.*'], 'megate_threshold': 5},
+        {'emodel': ['emodel1'], 'fullmtype': ['.*'], 'etype': ['.*'],
+         'features': ['Step2.*'], 'megate_threshold': 2}]}
+
+
+@pytest.mark.unit
+def test_read_early_stop_config():
+    """run_combos.early_stop: test read_early_stop_config"""
+    config = early_stop.read_early_stop_config(SELECT_CONF)
+    assert len(config['megate_patterns']) == 2
+    assert len(config['to_skip_patterns']) == 1
+    assert config['skip_repaired_exemplar'] is False
+
+    with pytest.raises(ValueError):
+        early_stop.read_early_stop_config(dict(SELECT_CONF,
+                                               select_perc_best=0.5))
+
+
+@pytest.mark.unit
+def test_get_score_bound():
+    """run_combos.early_stop: test get_score_bound and check_gate"""
+    config = early_stop.read_early_stop_config(SELECT_CONF)
+    gate = early_stop.create_gate(
+        config['megate_patterns'], config['to_skip_patterns'],
+        'emodel1', 'mtype1', 'etype1')
+    assert early_stop.get_score_bound(gate, 'Step1.SpikeCount') == 5
+    assert early_stop.get_score_bound(gate, 'Step2.SpikeCount') == 2
+    assert early_stop.get_score_bound(gate, 'Skipped.SpikeCount') is None
+
+    gate = early_stop.create_gate(
+        config['megate_patterns'], config['to_skip_patterns'],
+        'emodel2', 'mtype1', 'etype1',
+        exemplar_scores={'Step1.SpikeCount': 0.5, 'Step2.SpikeCount': 3})
+    assert early_stop.get_score_bound(gate, 'Step1.SpikeCount') == 5
+    assert early_stop.get_score_bound(gate, 'Step2.SpikeCount') == 15
+    assert early_stop.get_score_bound(gate, 'Step3.SpikeCount') is None
+
+    assert early_stop.check_gate(gate, {'Step2.SpikeCount': 15}) is None
+    assert early_stop.check_gate(gate, {'Step2.SpikeCount': 16}) == \
+        'Score 16 of Step2.SpikeCount is above megate threshold 15'
+
+    assert early_stop.create_gate(
+        config['megate_patterns'], config['to_skip_patterns'],
+        'emodel1', None, 'etype1') is None
+
+
+@pytest.mark.unit
+def test_order_protocols():
+    """run_combos.early_stop: test order_protocols"""
+    assert early_stop.order_protocols(
+        ['Step1', 'Step2', 'Step3', 'Step4'],
+        {'Step2': 3.0, 'Step4': 1.0}) == ['Step4', 'Step2', 'Step1', 'Step3']
+
+
+class _Feature(object):
+
+    """Feature that depends on a single recording"""
+
+    def __init__(self, recording_name):
+        self.recording_names = {'': recording_name}
+
+
+class _Objective(object):
+
+    """Objective of which the score is the response of a recording"""
+
+    def __init__(self, name, recording_name):
+        self.name = name
+        self.recording_name = recording_name
+        self.features = [_Feature(recording_name)]
+
+    def calculate_score(self, responses):
+        return responses[self.recording_name]
+
+
+class _FitnessCalculator(object):
+
+    """Fitness calculator with a list of objectives"""
+
+    def __init__(self, objectives):
+        self.objectives = objectives
+
+    def calculate_scores(self, responses):
+        return {objective.name: objective.calculate_score(responses)
+                for objective in self.objectives}
+
+
+class _Evaluator(object):
+
+    """Evaluator of which the protocols return fixed responses"""
+
+    def __init__(self, protocol_responses):
+        self.fitness_protocols = {name: name for name in protocol_responses}
+        self.protocol_responses = protocol_responses
+        self.fitness_calculator = _FitnessCalculator(
+            [_Objective('%s.score' % name, '%s.v' % name)
+             for name in protocol_responses])
+        self.protocols_run = []
+
+    def run_protocols(self, protocols, _):
+        responses = {}
+        for protocol in protocols:
+            self.protocols_run.append(protocol)
+            responses['%s.v' % protocol] = self.protocol_responses[protocol]
+        return responses
+
+
+@pytest.mark.unit
+def test_evaluate_protocols():
+    """run_combos.early_stop: test evaluate_protocols with early stop"""
+    config = early_stop.read_early_stop_config(SELECT_CONF)
+    gate = early_stop.create_gate(
+        config['megate_patterns'], config['to_skip_patterns'],
+        'emodel1', 'mtype1', 'etype1')
+    protocol_responses = {'Step1': 1.0, 'Step2': 10.0, 'Step3': 1.0}
+
+    # without early stop, all protocols run
+    evaluator = _Evaluator(protocol_responses)
+    _, scores = calculate_scores.evaluate_protocols(evaluator, {})
+    assert evaluator.protocols_run == ['Step1', 'Step2', 'Step3']
+    assert scores == {'Step1.score': 1.0, 'Step2.score': 10.0,
+                      'Step3.score': 1.0}
+
+    # Step2 fails the gate, Step1 is more expensive and never runs
+    evaluator = _Evaluator(protocol_responses)
+    early_stop_dict = {'gate': gate,
+                       'protocol_costs': {'Step1': 3.0, 'Step2': 2.0,
+                                          'Step3': 1.0}}
+    protocol_times = {}
+    _, scores = calculate_scores.evaluate_protocols(
+        evaluator, {}, protocol_times, early_stop_dict)
+    assert evaluator.protocols_run == ['Step3', 'Step2']
+    assert sorted(protocol_times.keys()) == ['Step2', 'Step3']
+    assert scores == {'Step2.score': 10.0, 'Step3.score': 1.0}
+    assert early_stop_dict['reason'] == \
+        'Score 10.0 of Step2.score is above megate threshold 2 after ' \
+        'protocol Step2'
+
+    # all scores pass the gate
+    evaluator = _Evaluator(dict(protocol_responses, Step2=1.0))
+    _, scores = calculate_scores.evaluate_protocols(
+        evaluator, {}, None, early_stop_dict)
+    assert len(evaluator.protocols_run) == 3
+    assert len(scores) == 3
+    assert early_stop_dict['reason'] is None
@@ -0,0 +1,86 @@
+"""Tests for legacy/hoc_archive.py"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+
+import pytest
+
+from bluepymm import tools
+from bluepymm.legacy import hoc_archive
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/hoc_archive')
+
+
+def _write_archive(archive_path, hocs):
+    """Helper function to write an archive"""
+    with hoc_archive.HocArchiveWriter(archive_path) as writer:
+        for model_name, hoc in hocs:
+            writer.add(model_name, hoc)
+    return writer.n_files
+
+
+@pytest.mark.unit
+def test_hoc_archive():
+    """legacy.hoc_archive: test HocArchiveWriter and HocArchive"""
+    tools.makedirs(TMP_DIR)
+    archive_path = os.path.join(TMP_DIR, 'test_hoc_archive.zip')
+    hocs = [('combo_%d' % i, 'begintemplate combo_%d\n' % i)
+            for i in range(5)]
+    assert _write_archive(archive_path, hocs) == 5
+
+    with hoc_archive.HocArchive(archive_path) as archive:
+        assert len(archive) == 5
+        assert archive.model_names() == [name for name, _ in hocs]
+        assert 'combo_3' in archive
+        assert 'combo_5' not in archive
+        assert archive.read('combo_3') == 'begintemplate combo_3\n'
+        with pytest.raises(KeyError):
+            archive.read('combo_5')
+
+
+@pytest.mark.unit
+def test_extract():
+    """legacy.hoc_archive: test extract and pack_hoc_dir"""
+    tools.makedirs(TMP_DIR)
+    archive_path = os.path.join(TMP_DIR, 'test_extract.zip')
+    hocs = [('a', 'hoc a'), ('b', 'hoc b')]
+    _write_archive(archive_path, hocs)
+
+    output_dir = os.path.join(TMP_DIR, 'test_extract_some')
+    assert hoc_archive.extract(archive_path, output_dir, ['b']) == \
+        [os.path.join(output_dir, 'b.hoc')]
+    assert os.listdir(output_dir) == ['b.hoc']
+
+    output_dir = os.path.join(TMP_DIR, 'test_extract_all')
+    hoc_archive.main([archive_path, output_dir])
+    assert sorted(os.listdir(output_dir)) == ['a.hoc', 'b.hoc']
+    with open(os.path.join(output_dir, 'a.hoc')) as hoc_file:
+        assert hoc_file.read() == 'hoc a'
+
+    # packing the extracted files results in the same archive content
+    packed_path = os.path.join(TMP_DIR, 'test_extract_packed.zip')
+    assert hoc_archive.pack_hoc_dir(output_dir, packed_path) == 2
+    with hoc_archive.HocArchive(packed_path) as archive:
+        assert archive.model_names() == ['a', 'b']
+        assert archive.read('b') == 'hoc b'
@@ -22,6 +22,7 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 import os
 import shutil
 import csv
+import multiprocessing.pool
 
 import pytest
 
@@ -49,6 +50,20 @@ def _new_prepare_json(original_filename, test_dir):
     return bluepymm.tools.write_json(test_dir, original_filename, config)
 
 
+def _run_create_and_write_hoc_file(emodel, setup_dir, hoc_dir, emodel_params,
+                                   template, morph_path, model_name):
+    """Helper function to create the .hoc file of a single combo in an
+    isolated process, as a reference for the .hoc files created per
+    e-model."""
+    pool = multiprocessing.pool.Pool(1, maxtasksperchild=1)
+    pool.apply(
+        bluepymm.prepare_combos.prepare_emodel_dirs.create_and_write_hoc_file,
+        (emodel, setup_dir, hoc_dir, emodel_params, template, morph_path,
+         model_name))
+    pool.terminate()
+    pool.join()
+
+
 def _prepare_config_jsons(prepare_config_template_filename,
                           hoc_config_template_filename):
     """Helper function to prepare configuration .json files."""
@@ -139,44 +154,6 @@ def test_load_combinations_dict():
     assert ret == expected_ret
 
 
-@pytest.mark.unit
-def test_run_create_and_write_hoc_file():
-    """bluepymm.legacy: test run_create_and_write_hoc_file"""
-    # create test directory, where output of this test will be created
-    test_dir = os.path.join(TMP_DIR, 'test_run_create_and_write_hoc_file')
-    bluepymm.tools.makedirs(test_dir)
-
-    # input parameters
-    prepare_conf_template = 'simple1_conf_prepare.json'
-
-    emodel = 'emodel1'
-    emodel_dir = os.path.join(test_dir, 'tmp', 'emodels', emodel)
-    hoc_dir = os.path.join(test_dir, 'emodels_hoc')
-    emodel_parameters = {'cm': 1.0}
-    template = 'cell_template_neuron.jinja2'
-    morph_path = 'morph.asc'
-    model_name = 'test'
-
-    with bluepymm.tools.cd(TEST_DATA_DIR):
-        # prepare input files
-        prepare_conf_path = _new_prepare_json(prepare_conf_template, test_dir)
-        bluepymm.prepare_combos.main.prepare_combos(prepare_conf_path, False)
-
-        # create output directory and run function
-        bluepymm.tools.makedirs(hoc_dir)
-        bluepymm.legacy.create_hoc_files.run_create_and_write_hoc_file(
-            emodel, emodel_dir, hoc_dir, emodel_parameters, template,
-            morph_path, model_name)
-
-        # verify output directory. TODO: test hoc file contents
-        expected_nb_files = 1
-        list_of_files = os.listdir(hoc_dir)
-        assert len(list_of_files) == expected_nb_files
-        hoc_filename = '{}.hoc'.format(model_name)
-        hoc_path = os.path.join(hoc_dir, hoc_filename)
-        assert os.path.isfile(hoc_path)
-
-
 @pytest.mark.unit
 def test_create_hoc_files():
     """bluepymm.legacy: test create_hoc_files"""
@@ -259,3 +236,83 @@ def test_create_hoc_files_example_simple1():
 
         # verify output
         _verify_output(hoc_config_path)
+
+
+def test_create_hoc_files_example_simple1_archive():
+    """bluepymm.legacy: test creation of a legacy .hoc archive for example
+    simple1"""
+    prepare_config_template_filename = 'simple1_conf_prepare.json'
+    hoc_config_template_filename = 'simple1_conf_hoc.json'
+    with bluepymm.tools.cd(TEST_DATA_DIR):
+        prepare_config_path, hoc_config_path = _prepare_config_jsons(
+            prepare_config_template_filename, hoc_config_template_filename)
+        hoc_config = bluepymm.tools.load_json(hoc_config_path)
+        archive_path = os.path.join(TMP_DIR, 'hoc_archive', 'hoc.zip')
+        hoc_config['hoc_output_archive'] = archive_path
+        archive_config_path = bluepymm.tools.write_json(
+            TMP_DIR, 'simple1_conf_hoc_archive.json', hoc_config)
+
+        # run combination preparation and create hoc files
+        bluepymm.prepare_combos.main.prepare_combos(prepare_config_path, False)
+        bluepymm.legacy.create_hoc_files.main([hoc_config_path])
+        bluepymm.legacy.create_hoc_files.main([archive_config_path])
+
+        with open(hoc_config['mecombo_emodel_filename']) as f:
+            combo_names = [row['combo_name']
+                           for row in csv.DictReader(f, delimiter='\t')]
+
+    # the archive contains the .hoc files of the hoc directory
+    with bluepymm.legacy.hoc_archive.HocArchive(archive_path) as archive:
+        assert sorted(archive.model_names()) == sorted(combo_names)
+        for combo_name in combo_names:
+            hoc_path = os.path.join(hoc_config['hoc_output_dir'],
+                                    '{}.hoc'.format(combo_name))
+            with open(hoc_path) as hoc_file:
+                expected_hoc = hoc_file.read()
+            # the banner contains the creation time
+            assert archive.read(combo_name).splitlines()[3:] == \
+                expected_hoc.splitlines()[3:]
+
+
+@pytest.mark.unit
+def test_create_emodel_hoc_files():
+    """bluepymm.legacy: test create_emodel_hoc_files"""
+    test_dir = os.path.join(TMP_DIR, 'test_create_emodel_hoc_files')
+    bluepymm.tools.makedirs(test_dir)
+
+    emodel = 'emodel1'
+    emodel_dir = os.path.join(test_dir, 'tmp', 'emodels', emodel)
+    hoc_dir = os.path.join(test_dir, 'emodels_hoc')
+    expected_hoc_dir = os.path.join(test_dir, 'emodels_hoc_expected')
+    emodel_parameters = {'cm': 1.0}
+    template = 'cell_template.jinja2'
+    combos = [('combo1', 'morph1.asc'), ('combo2', 'dir/morph2.asc')]
+
+    with bluepymm.tools.cd(TEST_DATA_DIR):
+        prepare_conf_path = _new_prepare_json('simple1_conf_prepare.json',
+                                              test_dir)
+        bluepymm.prepare_combos.main.prepare_combos(prepare_conf_path, False)
+
+        bluepymm.tools.makedirs(hoc_dir)
+        ret = bluepymm.legacy.create_hoc_files.create_emodel_hoc_files(
+            (emodel, emodel_dir, hoc_dir, emodel_parameters, template,
+             combos))
+        assert ret == 2
+
+        # the .hoc files equal those created for every combo separately
+        bluepymm.tools.makedirs(expected_hoc_dir)
+        for combination, morph_path in combos:
+            _run_create_and_write_hoc_file(
+                emodel, emodel_dir, expected_hoc_dir, emodel_parameters,
+                template, morph_path, combination)
+
+    for combination, _ in combos:
+        hoc_filename = '{}.hoc'.format(combination)
+        with open(os.path.join(hoc_dir, hoc_filename)) as hoc_file:
+            hoc = hoc_file.read()
+        with open(os.path.join(expected_hoc_dir, hoc_filename)) as hoc_file:
+            expected_hoc = hoc_file.read()
+        # the banner contains the creation time
+        assert hoc.splitlines()[3:] == expected_hoc.splitlines()[3:]
+        assert 'begintemplate {}'.format(combination) in hoc
+        assert 'Placeholder' not in hoc
@@ -126,6 +126,8 @@ def _new_select_json(original_filename, test_dir):
     config['scores_db'] = os.path.join(test_dir, 'output', 'scores.sqlite')
     config['pdf_filename'] = os.path.join(test_dir, 'megating.pdf')
     config['output_dir'] = os.path.join(test_dir, 'output')
+    config['emodels_hoc_dir'] = os.path.join(config['output_dir'],
+                                             'emodels_hoc')
     return bluepymm.tools.write_json(test_dir, original_filename, config)
 
 
@@ -168,6 +170,21 @@ def _test_main(test_data_dir, prepare_config_json, run_config_json,
         _verify_select_combos_output('output_megate_expected',
                                      select_config['output_dir'])
 
+        # validate the release, re-simulating one combo per me-type
+        validate_config = {
+            'mecombo_release_path': os.path.join(
+                select_config['output_dir'], 'mecombo_release.json'),
+            'morph_path': prepare_config['morph_path'],
+            'check_currents': False,
+            'resimulation': {'scores_db': run_config['scores_db'],
+                             'output_dir': run_config['output_dir'],
+                             'n_per_stratum': 1,
+                             'seed': 1}}
+        validate_config_json = bluepymm.tools.write_json(
+            test_dir, 'validate.json', validate_config)
+        args_list = ['validate', validate_config_json]
+        bluepymm.main.run(args_list)
+
 
 def test_main_from_dir():
     """bluepymm.main: test full BluePyMM workflow with plain directory input
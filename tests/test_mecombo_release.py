@@ -0,0 +1,101 @@
+"""Tests for select_combos/mecombo_release.py"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+
+import numpy
+import pandas
+import pandas.testing
+import pytest
+
+from bluepymm import tools
+from bluepymm.select_combos import mecombo_release
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TEST_DATA_DIR = os.path.join(BASE_DIR, 'examples/simple1')
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/mecombo_release')
+
+
+def _extneurondb(n_combos):
+    """Helper function to create an extended neuron database"""
+    rows = []
+    for index in range(n_combos):
+        emodel = 'emodel%d' % (index % 3)
+        morph_name = 'morph%d' % (index % 7)
+        fullmtype = 'mtype%d' % (index % 5)
+        rows.append((morph_name, str(index % 2 + 1), fullmtype,
+                     'etype%d' % (index % 2), emodel,
+                     '%s_%s_%d_%s' % (emodel, fullmtype, index, morph_name),
+                     0.1 * index if index % 4 else numpy.nan, -0.01 * index))
+    return pandas.DataFrame(rows, columns=mecombo_release.COLUMNS)
+
+
+@pytest.mark.unit
+def test_mecombo_release():
+    """select_combos.mecombo_release: test writing and lookups"""
+    tools.makedirs(TMP_DIR)
+    release_path = os.path.join(TMP_DIR, 'test_mecombo_release.h5')
+    extneurondb = _extneurondb(50)
+    mecombo_release.write_mecombo_release(extneurondb, release_path)
+
+    expected = extneurondb.sort_values('combo_name').reset_index(drop=True)
+    with mecombo_release.MEComboRelease(release_path) as release:
+        assert len(release) == 50
+        pandas.testing.assert_frame_equal(release.to_dataframe(), expected,
+                                          check_dtype=False)
+
+        combo = release.get_combo(extneurondb['combo_name'][5])
+        for column in ['morph_name', 'layer', 'fullmtype', 'etype',
+                       'emodel', 'combo_name']:
+            assert combo[column] == extneurondb[column][5]
+        assert combo['threshold_current'] == pytest.approx(0.5)
+        assert combo['holding_current'] == pytest.approx(-0.05)
+        assert release.get_combo('unknown') is None
+
+        ret = release.find_by_morph_name('morph3')
+        assert sorted(ret['combo_name']) == sorted(
+            extneurondb[extneurondb.morph_name == 'morph3']['combo_name'])
+        assert release.find_by_morph_name('unknown').empty
+
+        ret = release.find_by_metype('mtype2', 'etype1')
+        selected = extneurondb[(extneurondb.fullmtype == 'mtype2') &
+                               (extneurondb.etype == 'etype1')]
+        assert len(ret) > 0
+        assert sorted(ret['combo_name']) == sorted(selected['combo_name'])
+        assert release.find_by_metype('mtype2', 'unknown').empty
+
+
+@pytest.mark.unit
+def test_mecombo_release_from_tsv():
+    """select_combos.mecombo_release: test release of mecombo_emodel.tsv"""
+    tools.makedirs(TMP_DIR)
+    release_path = os.path.join(TMP_DIR, 'test_mecombo_release_tsv.h5')
+    data = mecombo_release.read_mecombo_emodel_tsv(os.path.join(
+        TEST_DATA_DIR, 'output_megate_expected', 'mecombo_emodel.tsv'))
+    mecombo_release.write_mecombo_release(data, release_path)
+
+    with mecombo_release.MEComboRelease(release_path) as release:
+        assert len(release) == len(data)
+        combo = release.get_combo(data['combo_name'][0])
+        assert combo['morph_name'] == data['morph_name'][0]
+        assert numpy.isnan(combo['holding_current'])
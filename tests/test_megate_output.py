@@ -99,3 +99,72 @@ def test_save_megate_results_compliant():
     test_dir = os.path.join(TMP_DIR, 'test_save_megate_results_compliant')
     tools.makedirs(test_dir)
     _test_save_megate_results(data, None, test_dir, True)
+
+
+@pytest.mark.unit
+def test_megate_results_writer():
+    """bluepymm.select_combos: test MegateResultsWriter with sorted runs."""
+    columns = ['morph_name', 'layer', 'fullmtype', 'etype', 'emodel',
+               'combo_name', 'threshold_current', 'holding_current']
+    df = pandas.DataFrame(
+        [('morph%d' % (index % 7), 1, 'mtype1', 'etype1',
+          'emodel%d' % (index % 3),
+          'emodel%d_mtype1_1_morph%d' % (index % 3, index), 0.1 * index,
+          -0.01 * index) for index in range(20)], columns=columns)
+
+    expected_dir = os.path.join(TMP_DIR, 'test_megate_results_writer_exp')
+    expected_paths = select_combos.megate_output.save_megate_results(
+        df.copy(), expected_dir, sort_key='combo_name',
+        make_names_neuron_compliant=True)
+
+    # one chunk per e-model, sorted in runs of at most 4 rows
+    test_dir = os.path.join(TMP_DIR, 'test_megate_results_writer')
+    writer = select_combos.megate_output.MegateResultsWriter(
+        test_dir, sort_key='combo_name', make_names_neuron_compliant=True,
+        sort_buffer_rows=4)
+    for _, chunk in df.groupby('emodel'):
+        writer.add(chunk)
+    writer.add(df.iloc[:0])
+    paths = writer.close()
+    assert writer.n_chunks == 3
+    assert not [filename for filename in os.listdir(test_dir)
+                if filename.startswith('sorted_runs_')]
+
+    for expected_path, path in zip(expected_paths, paths):
+        assert filecmp.cmp(expected_path, path, shallow=False)
+    log = pandas.read_csv(os.path.join(test_dir,
+                                       'log_neuron_compliance.csv'))
+    assert len(log) == 20
+
+    # without sort key, the chunks are written in order
+    test_dir = os.path.join(TMP_DIR, 'test_megate_results_writer_no_sort')
+    writer = select_combos.megate_output.MegateResultsWriter(test_dir)
+    writer.add(df.iloc[:10])
+    writer.add(df.iloc[10:])
+    _, mecombo_emodel_path = writer.close()
+    ret = pandas.read_csv(mecombo_emodel_path, sep='\t')
+    assert ret['combo_name'].tolist() == df['combo_name'].tolist()
+
+
+@pytest.mark.unit
+def test_megate_results_writer_abort():
+    """bluepymm.select_combos: test MegateResultsWriter removes the sorted
+    runs after an exception."""
+    columns = ['morph_name', 'layer', 'fullmtype', 'etype', 'emodel',
+               'combo_name', 'threshold_current', 'holding_current']
+    df = pandas.DataFrame(
+        [('morph%d' % index, 1, 'mtype1', 'etype1', 'emodel1',
+          'emodel1_mtype1_1_morph%d' % index, 0.1, -0.01)
+         for index in range(10)], columns=columns)
+
+    test_dir = os.path.join(TMP_DIR, 'test_megate_results_writer_abort')
+    with pytest.raises(RuntimeError):
+        with select_combos.megate_output.MegateResultsWriter(
+                test_dir, sort_key='combo_name',
+                sort_buffer_rows=4) as writer:
+            writer.add(df)
+            assert [filename for filename in os.listdir(test_dir)
+                    if filename.startswith('sorted_runs_')]
+            raise RuntimeError('stop')
+    assert not [filename for filename in os.listdir(test_dir)
+                if filename.startswith('sorted_runs_')]
@@ -0,0 +1,135 @@
+"""Tests for bluepymm.profiling"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import argparse
+import tracemalloc
+import multiprocessing
+
+import pytest
+
+from bluepymm import profiling
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
+
+
+@pytest.mark.unit
+def test_stage_profiler():
+    """profiling: test StageProfiler"""
+    profile_dir = os.path.join(TMP_DIR, 'test_profile')
+    profiler = profiling.StageProfiler(use_cprofile=True,
+                                       use_tracemalloc=True,
+                                       output_dir=profile_dir)
+    profiler.start()
+    with profiler.stage('outer'):
+        for _ in range(2):
+            with profiler.stage('inner'):
+                data = [0] * 1000000
+                del data
+    profiler.stop()
+
+    assert list(profiler.stages) == [('outer',), ('outer', 'inner')]
+    assert profiler.stages[('outer',)]['calls'] == 1
+    assert profiler.stages[('outer', 'inner')]['calls'] == 2
+    outer = profiler.stages[('outer',)]
+    inner = profiler.stages[('outer', 'inner')]
+    assert outer['wall_time'] >= inner['wall_time']
+    # a list of a million references takes about 7.6 MB
+    assert inner['peak_mb'] > 7.0
+    assert outer['peak_mb'] >= inner['peak_mb']
+    assert list(profiler.cprofile_stats) == ['outer']
+
+    report = profiler.report()
+    assert report.splitlines()[1].startswith('outer ')
+    assert report.splitlines()[2].startswith('  inner ')
+    assert 'cProfile of stage outer:' in report
+
+    profiler.write()
+    assert os.path.isfile(os.path.join(profile_dir, 'profile.txt'))
+    assert os.path.isfile(os.path.join(profile_dir, 'outer.prof'))
+
+
+def _worker_profiling_state(_):
+    """Helper function returning the profiling state of a worker"""
+    return profiling._profiler is None, tracemalloc.is_tracing()
+
+
+@pytest.mark.unit
+def test_init_worker():
+    """profiling: test that workers don't inherit the profiler"""
+    profiling.enable(use_cprofile=True, use_tracemalloc=True)
+    try:
+        with profiling.stage('pool'):
+            pool = multiprocessing.Pool(1, initializer=profiling.init_worker)
+            try:
+                states = pool.map(_worker_profiling_state, [0])
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        profiling.disable()
+
+    assert states == [(True, False)]
+
+
+@pytest.mark.unit
+def test_stage_disabled():
+    """profiling: test that stage and iter_stage do nothing when disabled"""
+    assert profiling.disable() is None
+    with profiling.stage('stage'):
+        pass
+    assert list(profiling.iter_stage('stage', [1, 2])) == [1, 2]
+    assert profiling.disable() is None
+
+
+@pytest.mark.unit
+def test_profile_from_args(capsys):
+    """profiling: test add_arguments and profile_from_args"""
+    parser = argparse.ArgumentParser()
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args([])
+    args.action = 'select'
+    with profiling.profile_from_args(args):
+        assert profiling._profiler is None
+
+    args = parser.parse_args(['--profile'])
+    args.action = 'select'
+    with profiling.profile_from_args(args):
+        profiler = profiling._profiler
+        assert not profiler.use_cprofile
+        assert not profiler.use_tracemalloc
+        for _ in profiling.iter_stage('wait', [1, 2, 3]):
+            with profiling.stage('work'):
+                pass
+    assert profiling._profiler is None
+    assert list(profiler.stages) == [('select',), ('select', 'wait'),
+                                     ('select', 'work')]
+    # the last call of 'wait' raises StopIteration
+    assert profiler.stages[('select', 'wait')]['calls'] == 4
+    assert profiler.stages[('select', 'work')]['calls'] == 3
+    assert 'Profile per stage:' in capsys.readouterr().out
+
+    args = parser.parse_args(['--profile', 'cprofile', 'tracemalloc'])
+    assert args.profile == ['cprofile', 'tracemalloc']
@@ -0,0 +1,86 @@
+"""Tests for bluepymm.run_combos.progress"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import json
+
+import pytest
+
+from bluepymm.run_combos import progress
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
+
+
+@pytest.mark.unit
+def test_progress_reporter(capsys):
+    """run_combos.progress: test ProgressReporter"""
+    status_filename = os.path.join(TMP_DIR, 'test_progress.jsonl')
+    if os.path.exists(status_filename):
+        os.remove(status_filename)
+
+    reporter = progress.ProgressReporter(interval=10.0, window=20.0,
+                                         status_filename=status_filename,
+                                         worker='worker1')
+    start_time = reporter.start_time
+    reporter.add_tasks({'emodel1': 2, 'emodel2': 10})
+    reporter.skip_task('emodel2')
+    assert reporter.n_tasks == 11
+
+    # no report before the interval has passed
+    reporter.update('emodel1', now=start_time + 1)
+    reporter.update('emodel1', exception_type='timeout', now=start_time + 2)
+    assert capsys.readouterr().out == ''
+    assert not os.path.exists(status_filename)
+
+    reporter.update('emodel2', early_stop_reason='Score too high',
+                    now=start_time + 10)
+    out = capsys.readouterr().out
+    assert out == ('Progress: 3/11 me-combos (27.3%), 0.30 combos/s, ETA '
+                   '0:00:27, 1 errors (33.3%), 1 stopped early, 1/2 e-models '
+                   'complete\n')
+
+    # the throughput only counts the combos of the last window
+    reporter.update('emodel2', now=start_time + 25)
+    status = reporter.status(now=start_time + 25)
+    assert status['throughput'] == pytest.approx(2 / 20.0)
+    assert status['eta'] == pytest.approx(7 / 0.1)
+    assert status['emodels'] == {'emodel1': [2, 2], 'emodel2': [2, 9]}
+
+    with open(status_filename) as status_file:
+        lines = [json.loads(line) for line in status_file]
+    assert len(lines) == 2
+    assert lines[0]['n_done'] == 3
+    assert lines[0]['worker'] == 'worker1'
+    assert lines[1]['n_done'] == 4
+
+
+@pytest.mark.unit
+def test_format_status():
+    """run_combos.progress: test format_status without throughput"""
+    status = {'n_done': 0, 'n_tasks': 0, 'n_errors': 0,
+              'n_stopped_early': 0, 'throughput': 0.0, 'eta': None,
+              'emodels': {}}
+    assert progress.format_status(status) == (
+        'Progress: 0/0 me-combos (100.0%), 0.00 combos/s, ETA unknown, '
+        '0 errors (0.0%), 0/0 e-models complete')
@@ -23,6 +23,7 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 
 import os
+import re
 import pandas
 
 import matplotlib.pyplot as plt
@@ -150,3 +151,57 @@ def test_plot_emodels_per_metype():
                                  'etype': 'etype1'}, index=[0])
     fig = select_combos.reporting.plot_emodels_per_metype(data, final_db)
     assert 'me-type' in fig.get_axes()[0].get_title()
+
+
+@pytest.mark.unit
+def test_calc_metype_median_scores():
+    """select_combos.reporting: test calc_metype_median_scores"""
+    combos = pandas.DataFrame({'mtype': ['mtype1', 'mtype1', 'mtype2'],
+                               'etype': ['etype1', 'etype1', 'etype2']})
+    passed_median_scores = pandas.DataFrame({'median_score': [1.0, 3.0, 4.0]})
+    ret = select_combos.reporting.calc_metype_median_scores(
+        combos, passed_median_scores)
+    assert ret.loc['mtype1', 'etype1'] == 2.0
+    assert ret.loc['mtype2', 'etype2'] == 4.0
+    assert pandas.isnull(ret.loc['mtype1', 'etype2'])
+
+    fig = select_combos.reporting.plot_median_per_metype(ret)
+    assert 'me-types' in fig.get_axes()[0].get_title()
+    plt.close()
+
+
+def _count_pdf_pages(path):
+    """Helper function to count the pages of a PDF file written by
+    matplotlib"""
+    with open(path, 'rb') as pdf:
+        return len(re.findall(br'/Type /Page\b', pdf.read()))
+
+
+@pytest.mark.unit
+def test_render_report():
+    """select_combos.reporting: test render_report in a single process"""
+    path = os.path.join(TMP_DIR, 'test_render_report.pdf')
+    page_groups = [[(select_combos.reporting.plot_dict, (['a'], 'title1')),
+                    (select_combos.reporting.plot_dict, (['b'], 'title2'))],
+                   [(select_combos.reporting.plot_dict, (['c'], 'title3'))]]
+    select_combos.reporting.render_report(path, page_groups, n_processes=1)
+    assert _count_pdf_pages(path) == 3
+
+    part_path = os.path.join(TMP_DIR, 'test_render_report_part.pdf')
+    ret = select_combos.reporting.render_report_part(
+        (part_path, page_groups[0]))
+    assert ret == part_path
+    assert _count_pdf_pages(part_path) == 2
+
+
+@pytest.mark.unit
+def test_render_report_parallel():
+    """select_combos.reporting: test render_report with a process pool"""
+    path = os.path.join(TMP_DIR, 'test_render_report_parallel.pdf')
+    page_groups = [[(select_combos.reporting.plot_dict, ([str(index)],
+                                                         'title'))]
+                   for index in range(3)]
+    select_combos.reporting.render_report(path, page_groups, n_processes=2)
+    assert _count_pdf_pages(path) == 3
+    assert [filename for filename in os.listdir(TMP_DIR)
+            if filename.startswith('report_parts_')] == []
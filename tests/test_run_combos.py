@@ -21,6 +21,9 @@ Copyright (c) 2018, EPFL/Blue Brain Project
 
 import os
 import shutil
+import argparse
+
+import pytest
 
 from bluepymm import tools, run_combos
 
@@ -57,3 +60,28 @@ def test_run_combos():
         config['use_apical_points'] = False
         run_combos.main.run_combos_from_conf(config)
         _verify_run_combos_output(config['scores_db'])
+
+
+@pytest.mark.unit
+def test_parse_shard():
+    """bluepymm.run_combos: test parse_shard"""
+    assert run_combos.main.parse_shard('3/8') == (3, 8)
+    for shard_str in ['8/8', '-1/8', '3', 'a/b']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            run_combos.main.parse_shard(shard_str)
+
+
+def test_merge_combos():
+    """bluepymm.run_combos: test merge_combos based on example simple1"""
+    config_template_path = 'simple1_conf_run.json'
+    tmp_dir = os.path.join(BASE_DIR, 'tmp/merge_combos')
+
+    with tools.cd(TEST_DATA_DIR):
+        shutil.copytree('output_expected', tmp_dir)
+        config = tools.load_json(config_template_path)
+        config['scores_db'] = os.path.join(tmp_dir, 'scores.sqlite')
+        config['output_dir'] = tmp_dir
+
+        # no shards to merge, all combos have run
+        run_combos.main.merge_combos_from_conf(config)
+        _verify_run_combos_output(config['scores_db'])
@@ -25,6 +25,8 @@ import os
 import shutil
 import filecmp
 
+import pandas
+
 from bluepymm import tools, select_combos
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -32,7 +34,7 @@ TEST_DATA_DIR = os.path.join(BASE_DIR, 'examples/simple1')
 TMP_DIR = os.path.join(BASE_DIR, 'tmp/select_combos')
 
 
-def _verify_output(benchmark_dir, output_dir):
+def _verify_output(benchmark_dir, output_dir, write_h5=False):
     """Helper function to verify output of combination selection"""
     files = ['extneurondb.dat', 'mecombo_emodel.tsv']
     matches = filecmp.cmpfiles(benchmark_dir, output_dir, files)
@@ -40,6 +42,12 @@ def _verify_output(benchmark_dir, output_dir):
         print('Mismatch in files: {}'.format(matches[1]))
     assert len(matches[0]) == len(files)
     assert os.path.exists(os.path.join(output_dir, 'mecombo_release.json'))
+    release = tools.load_json(os.path.join(output_dir,
+                                           'mecombo_release.json'))
+    if write_h5:
+        assert os.path.isfile(release['output_paths']['mecombo_release.h5'])
+    else:
+        assert 'mecombo_release.h5' not in release['output_paths']
 
 
 def _config_select_combos(config_template_path, tmp_dir):
@@ -57,17 +65,18 @@ def _config_select_combos(config_template_path, tmp_dir):
 
 
 def _test_select_combos(test_data_dir, tmp_dir, config_template_path,
-                        benchmark_dir, n_processes=None):
+                        benchmark_dir, n_processes=None, write_h5=False):
     """Helper function to perform functional test of select_combos"""
     with tools.cd(test_data_dir):
         # prepare input data
         config = _config_select_combos(config_template_path, tmp_dir)
+        config['write_mecombo_release_h5'] = write_h5
 
         # run combination selection
         select_combos.main.select_combos_from_conf(config, n_processes)
 
         # verify output
-        _verify_output(benchmark_dir, config['output_dir'])
+        _verify_output(benchmark_dir, config['output_dir'], write_h5)
 
 
 def test_select_combos():
@@ -88,4 +97,25 @@ def test_select_combos_2():
     tmp_dir = os.path.join(TMP_DIR, 'test_select_combos_2')
 
     _test_select_combos(TEST_DATA_DIR, tmp_dir, config_template_path,
-                        benchmark_dir)
+                        benchmark_dir, write_h5=True)
+
+
+def test_select_combos_without_report():
+    """bluepymm.select_combos: test select_combos without report, with the
+    final database sorted on disk"""
+    tmp_dir = os.path.join(TMP_DIR, 'test_select_combos_without_report')
+
+    with tools.cd(TEST_DATA_DIR):
+        config = _config_select_combos('simple1_conf_select.json', tmp_dir)
+        config['write_report'] = False
+        # sort the final database in runs of one row
+        config['sort_buffer_rows'] = 1
+        select_combos.main.select_combos_from_conf(config, 1)
+
+        _verify_output('output_megate_expected', config['output_dir'])
+        assert not os.path.exists(config['pdf_filename'])
+
+        # the median scores are joined to the right combos
+        all_median_scores = pandas.read_csv(os.path.join(
+            config['output_dir'], 'extra_data', 'all_median_scores.csv'))
+        assert all_median_scores['median_score'].notnull().all()
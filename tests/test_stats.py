@@ -0,0 +1,93 @@
+"""Tests for bluepymm.run_combos.stats"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import json
+import sqlite3
+
+import pandas
+import pytest
+
+from bluepymm.run_combos import calculate_scores, stats
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
+
+
+def _write_test_scores_database(testsqlite_filename):
+    """Helper function to create test scores database with timings."""
+    df = pandas.DataFrame({
+        'emodel': ['emodel1', 'emodel1', 'emodel2', 'emodel2'],
+        'morph_name': ['morph1', 'morph2', 'morph1', 'morph2'],
+        'to_run': [0, 0, 0, 1],
+        'exception': [None, 'error', None, None]})
+    with sqlite3.connect(testsqlite_filename) as conn:
+        df.to_sql('scores', conn, if_exists='replace')
+    calculate_scores.add_result_columns(testsqlite_filename)
+
+    for uid, wall_time in enumerate([1.0, 2.0, 4.0]):
+        with sqlite3.connect(testsqlite_filename) as conn:
+            conn.execute(
+                'UPDATE scores SET wall_time=?, cpu_time=?, peak_rss_mb=?, '
+                'protocol_times=?, worker=? WHERE `index`=?',
+                (wall_time, wall_time, 10.0 * (uid + 1),
+                 json.dumps({'Step1': wall_time / 2,
+                             'Step2': wall_time / 4}),
+                 'host:%d' % (uid % 2), uid))
+
+
+@pytest.mark.unit
+def test_read_timings():
+    """run_combos.stats: test read_timings"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_stats.sqlite')
+    _write_test_scores_database(testsqlite_filename)
+
+    timings = stats.read_timings(testsqlite_filename)
+    assert list(timings.index) == [0, 1, 2]
+    assert list(timings['wall_time']) == [1.0, 2.0, 4.0]
+
+    by_emodel = stats.summarise_by(timings, 'emodel')
+    assert list(by_emodel.index) == ['emodel2', 'emodel1']
+    assert list(by_emodel['n_combos']) == [1, 2]
+    assert list(by_emodel['total_wall_time']) == [4.0, 3.0]
+    assert list(by_emodel['max_peak_rss_mb']) == [30.0, 20.0]
+    assert list(by_emodel['n_exceptions']) == [0, 1]
+
+    by_protocol = stats.summarise_protocols(timings)
+    assert list(by_protocol.index) == ['Step1', 'Step2']
+    assert list(by_protocol['n_runs']) == [3, 3]
+    assert list(by_protocol['total_time']) == [3.5, 1.75]
+
+    stats.print_stats(testsqlite_filename)
+
+
+@pytest.mark.unit
+def test_read_timings_no_columns():
+    """run_combos.stats: test read_timings without timing columns"""
+    testsqlite_filename = os.path.join(TMP_DIR, 'test_stats_empty.sqlite')
+    df = pandas.DataFrame({'to_run': [0]})
+    with sqlite3.connect(testsqlite_filename) as conn:
+        df.to_sql('scores', conn, if_exists='replace')
+
+    assert len(stats.read_timings(testsqlite_filename)) == 0
+    stats.print_stats(testsqlite_filename)
@@ -0,0 +1,139 @@
+"""Tests for bluepymm.run_combos.synthetic"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import json
+import sqlite3
+
+import pandas
+import pytest
+
+from bluepymm import tools
+from bluepymm.run_combos import calculate_scores, synthetic
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TEST_DIR = os.path.join(BASE_DIR, 'examples/simple1')
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/')
+
+
+def _create_evaluator(morph_path='morph1.asc', **kwargs):
+    """Create synthetic evaluator for a morphology"""
+    evaluator = synthetic.create('emodel1', **kwargs)
+    evaluator.cell_model.morphology.morphology_path = morph_path
+    return evaluator
+
+
+@pytest.mark.unit
+def test_create():
+    """run_combos.synthetic: test create"""
+    evaluator = _create_evaluator(n_features=5, n_protocols=2)
+    assert sorted(evaluator.fitness_protocols) == ['Step1', 'Step2']
+    assert [objective.name for objective in
+            evaluator.fitness_calculator.objectives] == [
+        'Step1.soma.feature0', 'Step2.soma.feature1', 'Step1.soma.feature2',
+        'Step2.soma.feature3', 'Step1.soma.feature4']
+
+    evaluator = _create_evaluator(features=['A.f1', 'B.f2'])
+    assert sorted(evaluator.fitness_protocols) == ['A', 'B']
+
+
+@pytest.mark.unit
+def test_scores():
+    """run_combos.synthetic: test that scores only depend on the combo"""
+    evaluator = _create_evaluator()
+    responses = evaluator.run_protocols(
+        evaluator.fitness_protocols.values(), {})
+    assert responses['bpo_holding_current'] == -0.1
+    assert 'Step1.soma.v' in responses
+    scores = evaluator.fitness_calculator.calculate_scores(responses)
+    assert len(scores) == 10
+    assert all(score >= 0 for score in scores.values())
+
+    assert _create_evaluator().fitness_calculator.calculate_scores(
+        responses) == scores
+    assert _create_evaluator('morph2.asc').fitness_calculator.\
+        calculate_scores(responses) != scores
+    assert _create_evaluator(seed=1).fitness_calculator.calculate_scores(
+        responses) != scores
+
+    evaluator = _create_evaluator(score_mean=100.0, score_sd=0.0)
+    assert set(evaluator.fitness_calculator.calculate_scores(
+        responses).values()) == {100.0}
+
+
+@pytest.mark.unit
+def test_failure_rate():
+    """run_combos.synthetic: test failure rate"""
+    evaluator = _create_evaluator(failure_rate=1.0)
+    with pytest.raises(synthetic.SyntheticFailure):
+        evaluator.run_protocols(evaluator.fitness_protocols.values(), {})
+
+    n_failures = 0
+    for index in range(200):
+        evaluator = _create_evaluator('morph%d.asc' % index,
+                                      failure_rate=0.5)
+        try:
+            evaluator.run_protocols(evaluator.fitness_protocols.values(), {})
+        except synthetic.SyntheticFailure:
+            n_failures += 1
+    assert 50 < n_failures < 150
+
+
+@pytest.mark.unit
+def test_calculate_scores_synthetic():
+    """run_combos.synthetic: test calculate_scores with synthetic evaluator"""
+    test_db_filename = os.path.join(TMP_DIR, 'test_synthetic.sqlite')
+    morph_dir = os.path.join(TEST_DIR, 'data/morphs')
+    rows = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2'],
+        'morph_ext': [None] * 2,
+        'morph_dir': [morph_dir] * 2,
+        'emodel': ['emodel1', 'emodel2'],
+        'original_emodel': ['emodel1', 'emodel2'],
+        'to_run': [1] * 2,
+        'scores': [None] * 2,
+        'extra_values': [None] * 2,
+        'exception': [None] * 2})
+    with sqlite3.connect(test_db_filename) as conn:
+        rows.to_sql('scores', conn, if_exists='replace')
+
+    emodel_dir = os.path.join(TEST_DIR, 'data/emodels_dir/subdir/')
+    emodel_dirs = {'emodel1': emodel_dir, 'emodel2': emodel_dir}
+    final_dict = tools.load_json(os.path.join(emodel_dir, 'final.json'))
+
+    calculate_scores.calculate_scores(
+        final_dict, emodel_dirs, test_db_filename, n_processes=1,
+        synthetic_evaluator={'n_features': 3})
+
+    with sqlite3.connect(test_db_filename) as conn:
+        results = conn.execute(
+            'SELECT to_run, scores, extra_values, exception FROM scores '
+            'ORDER BY `index`').fetchall()
+    for to_run, scores, extra_values, exception in results:
+        assert to_run == 0
+        assert exception is None
+        assert sorted(json.loads(scores)) == [
+            'Step1.soma.feature0', 'Step2.soma.feature1',
+            'Step3.soma.feature2']
+        assert json.loads(extra_values) == {'holding_current': -0.1,
+                                            'threshold_current': 0.2}
@@ -364,3 +364,71 @@ def test_process_combo_name():
     # clear output
     if os.path.isfile(log_filename):
         os.remove(log_filename)
+
+
+@pytest.mark.unit
+def test_extract_extra_values():
+    """select_combos.table_processing: test extract_extra_values"""
+    extra_values = pandas.Series(
+        [json.dumps({'threshold_current': 0.2, 'holding_current': -0.1}),
+         None,
+         json.dumps({'threshold_current': 1}),
+         json.dumps(None),
+         json.dumps({})],
+        index=[3, 5, 7, 9, 11])
+    ret = table_processing.extract_extra_values(extra_values)
+    assert ret.index.tolist() == [3, 5, 7, 9, 11]
+    assert ret.dtypes.tolist() == [float, float]
+    assert ret.loc[3].tolist() == [0.2, -0.1]
+    assert ret.loc[7, 'threshold_current'] == 1.0
+    assert ret.loc[[5, 9, 11]].isnull().all().all()
+    assert pandas.isnull(ret.loc[7, 'holding_current'])
+
+    ret = table_processing.extract_extra_values(pandas.Series([None]))
+    assert ret.isnull().all().all()
+
+
+@pytest.mark.unit
+def test_select_passed_combos(capsys):
+    """select_combos.table_processing: test select_passed_combos"""
+    combos = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2', 'morph3', 'morph4', 'morph5'],
+        'etype': ['etype1', 'etype1', 'etype1', 'etype1', 'etype1'],
+        'fullmtype': ['mtype1', 'mtype1', 'mtype1', 'mtype2', 'mtype3']},
+        index=[2, 4, 6, 8, 10])
+    megate_scores = pandas.DataFrame(
+        {'median_score': [3.0, 1.0, 2.0, 300.0, 5.0]}, index=combos.index)
+    megate_pass = pandas.DataFrame(
+        {'Passed all': [True, False, True, False, True]}, index=combos.index)
+
+    ret = table_processing.select_passed_combos(
+        'emodel1', combos, megate_pass, megate_scores, select_perc_best=0.5)
+    assert ret.index.tolist() == [4, 6, 10]
+    # only the me-type without any combo below 250 is reported
+    assert capsys.readouterr().out == \
+        'WARNING: no combos for me-type etype1mtype2 in emodel emodel1\n'
+
+    ret = table_processing.select_passed_combos(
+        'emodel1', combos, megate_pass, megate_scores)
+    assert ret.index.tolist() == [2, 6, 10]
+
+
+@pytest.mark.unit
+def test_create_extneurondb_rows():
+    """select_combos.table_processing: test _create_extneurondb_rows"""
+    combos = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2'], 'layer': [1, 23],
+        'fullmtype': ['mtype1', 'mtype2'], 'etype': ['etype1', 'etype1'],
+        'emodel': ['emodel1', 'emodel1'],
+        'extra_values': [json.dumps({'threshold_current': 0.5,
+                                     'holding_current': -0.05}), None],
+        'scores': [None, None]}, index=[4, 6])
+    ret = table_processing._create_extneurondb_rows(combos)
+    assert ret.index.tolist() == [4, 6]
+    assert ret['combo_name'].tolist() == ['emodel1_mtype1_1_morph1',
+                                          'emodel1_mtype2_23_morph2']
+    assert ret.loc[4, 'threshold_current'] == 0.5
+    assert ret.loc[4, 'holding_current'] == -0.05
+    assert ret.loc[[6], ['threshold_current',
+                         'holding_current']].isnull().all().all()
+    assert 'extra_values' not in ret.columns
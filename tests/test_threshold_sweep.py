@@ -0,0 +1,171 @@
+"""Tests for select_combos/threshold_sweep.py"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import re
+import shutil
+
+import numpy
+import pandas
+import pytest
+
+from bluepymm import tools
+from bluepymm.select_combos import main, sqlite_io, threshold_sweep
+from bluepymm.select_combos import process_megate_config as proc_config
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TEST_DATA_DIR = os.path.join(BASE_DIR, 'examples/simple1')
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/threshold_sweep')
+
+
+def _combos():
+    """Helper function to create combos and score values of one e-model"""
+    combos = pandas.DataFrame({
+        'emodel': ['emodel1'] * 5,
+        'fullmtype': ['mtype1', 'mtype1', 'mtype1', 'mtype2', 'mtype2'],
+        'etype': ['etype1'] * 5,
+        'morph_name': ['morph1', 'morph2', 'morph3', 'morph4', 'morph1'],
+        'is_exemplar': [0, 0, 0, 0, 1],
+        'is_repaired': [1, 1, 1, 1, 1],
+        'is_original': [0, 0, 0, 0, 0]})
+    score_values = pandas.DataFrame({
+        'feature1': [1.0, 4.0, 3.0, numpy.nan, 2.0],
+        'feature2': [2.0, 1.0, numpy.nan, 1.0, 0.5],
+        'skipped': [100.0, 100.0, 100.0, 100.0, 100.0],
+        'no_scores': [numpy.nan] * 5})
+    return combos, score_values
+
+
+def _megate_patterns(megate_thresholds):
+    """Helper function to create megate patterns"""
+    return proc_config.read_megate_thresholds(
+        {'megate_thresholds': megate_thresholds})[0]
+
+
+@pytest.mark.unit
+def test_critical_thresholds():
+    """select_combos.threshold_sweep: test critical_thresholds"""
+    combos, score_values = _combos()
+    megate_patterns = _megate_patterns([
+        {'features': ['.*'], 'megate_threshold': 5},
+        {'fullmtype': ['mtype2'], 'features': ['feature2'],
+         'megate_threshold': 5}])
+    to_skip_patterns = [re.compile('skipped')]
+
+    # the scores of feature1 are scaled by the exemplar score
+    thresholds = threshold_sweep.critical_thresholds(
+        combos, score_values, to_skip_patterns, megate_patterns, False)
+    assert thresholds.index.tolist() == [0, 1, 2, 3]
+    numpy.testing.assert_allclose(thresholds['critical_threshold'],
+                                  [2.0, 2.0, numpy.inf, numpy.inf])
+    numpy.testing.assert_allclose(thresholds['median_score'],
+                                  [1.5, 2.5, 3.0, 1.0])
+
+    thresholds = threshold_sweep.critical_thresholds(
+        combos, score_values, to_skip_patterns, megate_patterns, True)
+    numpy.testing.assert_allclose(thresholds['critical_threshold'],
+                                  [2.0, 4.0, numpy.inf, numpy.inf])
+
+    # mtype2 is only gated on feature2
+    megate_patterns = _megate_patterns([
+        {'fullmtype': ['mtype2'], 'features': ['feature2'],
+         'megate_threshold': 5}])
+    thresholds = threshold_sweep.critical_thresholds(
+        combos, score_values, to_skip_patterns, megate_patterns, True)
+    numpy.testing.assert_allclose(thresholds['critical_threshold'],
+                                  [-numpy.inf, -numpy.inf, -numpy.inf, 1.0])
+
+
+@pytest.mark.unit
+def test_sweep():
+    """select_combos.threshold_sweep: test sweep"""
+    thresholds = pandas.DataFrame({
+        'emodel': ['emodel1'] * 4,
+        'fullmtype': ['mtype1', 'mtype1', 'mtype1', 'mtype2'],
+        'etype': ['etype1'] * 4,
+        'critical_threshold': [2.0, 4.0, numpy.inf, 1.0],
+        'median_score': [1.0, 300.0, 2.0, numpy.nan]})
+    result = threshold_sweep.sweep(thresholds, megate_thresholds=[4, 1],
+                                   select_perc_best=[0.5])
+    assert result.columns.tolist() == threshold_sweep.SWEEP_COLUMNS
+    assert result['criterion'].tolist() == [
+        'megate_threshold', 'megate_threshold', 'select_perc_best'] * 2
+    assert result['value'].tolist() == [1, 4, 0.5] * 2
+    assert result['n_combos'].tolist() == [3, 3, 3, 1, 1, 1]
+    assert result['n_passed'].tolist() == [0, 2, 1, 1, 1, 0]
+    numpy.testing.assert_allclose(result['pass_rate'],
+                                  [0, 2.0 / 3, 1.0 / 3, 1, 1, 0])
+
+    with pytest.raises(ValueError):
+        threshold_sweep.sweep(thresholds, megate_thresholds=[-1])
+
+
+def _count_selected(mecombo_emodel_path):
+    """Helper function to count the selected combos per me-type"""
+    mecombo_emodel = pandas.read_csv(mecombo_emodel_path, sep='\t')
+    return mecombo_emodel.groupby(['emodel', 'fullmtype', 'etype']).size()
+
+
+def test_threshold_sweep_example_simple1():
+    """select_combos.threshold_sweep: test the sweep against the selection
+    of example simple1"""
+    tmp_dir = os.path.join(TMP_DIR, 'test_threshold_sweep_example_simple1')
+    with tools.cd(TEST_DATA_DIR):
+        shutil.copytree('output_expected', tmp_dir)
+        config = tools.load_json('simple1_conf_select.json')
+    config['scores_db'] = os.path.join(tmp_dir, 'scores.sqlite')
+    config['output_dir'] = os.path.join(tmp_dir, 'output')
+    config['emodels_hoc_dir'] = os.path.join(tmp_dir, 'output/emodels_hoc')
+    config['write_report'] = False
+    config['threshold_sweep'] = {'megate_thresholds': [0, 5, 1000],
+                                 'select_perc_best': [0.5]}
+
+    main.select_combos_from_conf(config, 1, sweep_only=True)
+    sweep_path = os.path.join(config['output_dir'], 'threshold_sweep.csv')
+    result = pandas.read_csv(sweep_path)
+    assert not os.path.exists(os.path.join(config['output_dir'],
+                                           'mecombo_emodel.tsv'))
+
+    # the pass counts equal the number of combos selected by select
+    for criterion, value, conf_key, conf_value in [
+            ('megate_threshold', 5, 'megate_thresholds',
+             [{'features': ['.*'], 'megate_threshold': 5}]),
+            ('select_perc_best', 0.5, 'select_perc_best', 0.5)]:
+        output_dir = os.path.join(tmp_dir, 'output_%s' % criterion)
+        main.select_combos_from_conf(
+            dict(config, output_dir=output_dir, **{conf_key: conf_value}), 1)
+        selected = _count_selected(os.path.join(output_dir,
+                                                'mecombo_emodel.tsv'))
+        swept = result[(result['criterion'] == criterion) &
+                       (result['value'] == value)].set_index(
+                           ['emodel', 'fullmtype', 'etype'])['n_passed']
+        swept = swept[swept > 0]
+        assert sorted(swept.items()) == sorted(selected.items())
+
+    # all combos fail at threshold 0
+    scores, _ = sqlite_io.read_and_process_sqlite_score_tables(
+        config['scores_db'])
+    at_zero = result[(result['criterion'] == 'megate_threshold') &
+                     (result['value'] == 0)]
+    assert at_zero['n_passed'].sum() == 0
+    assert at_zero['n_combos'].sum() == (scores['is_exemplar'] == 0).sum()
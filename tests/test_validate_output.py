@@ -0,0 +1,218 @@
+"""Tests for validate_output/validate_release.py"""
+
+"""
+Copyright (c) 2018, EPFL/Blue Brain Project
+
+ This file is part of BluePyMM <https://github.com/BlueBrain/BluePyMM>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+
+import os
+import json
+
+import pandas
+import pytest
+
+from bluepymm import tools, validate_output
+from bluepymm.validate_output import validate_release, resimulation
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TEST_DATA_DIR = os.path.join(BASE_DIR, 'examples/simple1')
+TMP_DIR = os.path.join(BASE_DIR, 'tmp/validate_output')
+
+
+def _release_frames():
+    """Helper function to create the contents of a valid release"""
+    mecombo_emodel = pandas.DataFrame({
+        'morph_name': ['morph1', 'morph2', 'morph1'],
+        'layer': ['1', '1', '1'],
+        'fullmtype': ['mtype1', 'mtype2', 'mtype1'],
+        'etype': ['etype1', 'etype1', 'etype2'],
+        'emodel': ['emodel1', 'emodel1', 'emodel2'],
+        'combo_name': ['combo1', 'combo2', 'combo3'],
+        'threshold_current': [0.1, 0.2, 0.3],
+        'holding_current': [-0.1, -0.2, -0.3]})
+    extneurondb = mecombo_emodel[['morph_name', 'layer', 'fullmtype', 'etype',
+                                  'combo_name']].copy()
+    return extneurondb, mecombo_emodel
+
+
+@pytest.mark.unit
+def test_check_release():
+    """validate_output: test check_release"""
+    extneurondb, mecombo_emodel = _release_frames()
+    issues = validate_release.check_release(
+        extneurondb, mecombo_emodel, {'emodel1', 'emodel2'},
+        morphologies={'morph1', 'morph2', 'neuronDB'})
+    assert len(issues) == 9
+    assert not any(issues.values())
+
+    # inconsistent release
+    mecombo_emodel.loc[2, 'combo_name'] = 'combo1'
+    mecombo_emodel.loc[1, 'holding_current'] = float('nan')
+    extneurondb.loc[1, 'etype'] = 'etype2'
+    extneurondb = extneurondb.iloc[::-1]
+    issues = validate_release.check_release(
+        extneurondb, mecombo_emodel, {'emodel2'}, morphologies={'morph1'})
+    assert issues['duplicate combo names in mecombo_emodel.tsv'] == \
+        ['combo1']
+    assert issues['duplicate combo names in extneurondb.dat'] == []
+    assert issues['combos missing in extneurondb.dat'] == []
+    assert issues['combos missing in mecombo_emodel.tsv'] == ['combo3']
+    assert issues['combos that differ between extneurondb.dat and '
+                  'mecombo_emodel.tsv'] == ['combo1', 'combo2']
+    assert issues['e-models without .hoc file'] == ['emodel1']
+    assert issues['missing morphologies'] == ['morph2']
+    assert issues['combos without threshold_current'] == []
+    assert issues['combos without holding_current'] == ['combo2']
+
+    text = validate_release.format_issues(issues)
+    assert 'missing morphologies: 1 (morph2)' in text
+    assert 'combos missing in extneurondb.dat: none' in text
+
+
+def _write_release(test_dir):
+    """Helper function to write the release json of the example output"""
+    tools.makedirs(test_dir)
+    hoc_dir = tools.makedirs(os.path.join(test_dir, 'emodels_hoc'))
+    for emodel in ['emodel1', 'emodel2']:
+        with open(os.path.join(hoc_dir, '%s.hoc' % emodel), 'w') as hoc_file:
+            hoc_file.write('')
+    output_dir = os.path.join(TEST_DATA_DIR, 'output_megate_expected')
+    release = {'version': '1.0',
+               'output_paths': {
+                   'emodels_hoc': hoc_dir,
+                   'extneurondb.dat': os.path.join(output_dir,
+                                                   'extneurondb.dat'),
+                   'mecombo_emodel.tsv': os.path.join(output_dir,
+                                                      'mecombo_emodel.tsv')}}
+    return tools.write_json(test_dir, 'mecombo_release.json', release)
+
+
+@pytest.mark.unit
+def test_validate_output():
+    """validate_output: test validate_output with the example output"""
+    test_dir = os.path.join(TMP_DIR, 'test_validate_output')
+    conf = {'mecombo_release_path': _write_release(test_dir),
+            'morph_path': os.path.join(TEST_DATA_DIR, 'data/morphs'),
+            'output_dir': test_dir}
+
+    # the example output has no currents
+    conf_path = tools.write_json(test_dir, 'conf.json', conf)
+    with pytest.raises(ValueError, match='failed 2 of 9 checks'):
+        validate_output.validate_output(conf_path)
+    with open(os.path.join(test_dir, 'validation_report.json')) as fd:
+        report = json.load(fd)
+    assert len(report['combos without threshold_current']) == 3
+
+    conf['check_currents'] = False
+    conf_path = tools.write_json(test_dir, 'conf.json', conf)
+    issues = validate_output.validate_output(conf_path)
+    assert len(issues) == 7
+    assert not any(issues.values())
+
+
+@pytest.mark.unit
+def test_stratified_sample():
+    """validate_output: test stratified_sample"""
+    mecombo_emodel = pandas.DataFrame({
+        'emodel': ['emodel1'] * 6 + ['emodel2'],
+        'fullmtype': ['mtype1'] * 3 + ['mtype2'] * 3 + ['mtype1'],
+        'etype': ['etype1'] * 7,
+        'combo_name': ['combo%d' % i for i in range(7)]})
+    sample = resimulation.stratified_sample(mecombo_emodel, 2, seed=1)
+    assert len(sample) == 5
+    assert sample.index.is_monotonic_increasing
+    assert sample.groupby(['emodel', 'fullmtype']).size().tolist() == \
+        [2, 2, 1]
+    pandas.testing.assert_frame_equal(
+        sample, resimulation.stratified_sample(mecombo_emodel, 2, seed=1))
+
+    sample = resimulation.stratified_sample(mecombo_emodel, 1,
+                                            strata=['emodel'], seed=1)
+    assert sample['emodel'].tolist() == ['emodel1', 'emodel2']
+
+
+@pytest.mark.unit
+def test_compare_results():
+    """validate_output: test scores_match and compare_results"""
+    assert resimulation.scores_match({'a': 1.0, 'b': None},
+                                     {'a': 1.0 + 1e-9, 'b': None})
+    assert not resimulation.scores_match({'a': 1.0}, {'a': 1.1})
+    assert not resimulation.scores_match({'a': 1.0}, {'b': 1.0})
+
+    rows = pandas.DataFrame({
+        'combo_name': ['combo1', 'combo2', 'combo3', 'combo4', 'combo5'],
+        'uid': [1, 2, 3, 4, None],
+        'scores': [json.dumps({'a': 1.0})] * 4 + [None],
+        'threshold_current': [0.1, 0.1, 0.1, 0.1, None],
+        'holding_current': [float('nan')] * 5})
+
+    def result(scores, threshold_current=0.1, exception=None):
+        """Result of run_emodel_morph_isolated"""
+        return {'scores': scores, 'exception': exception,
+                'extra_values': {'threshold_current': threshold_current,
+                                 'holding_current': None}}
+    results = {1: result({'a': 1.0}),
+               2: result(None, exception='error'),
+               3: result({'a': 2.0}),
+               4: result({'a': 1.0}, threshold_current=0.2)}
+    issues = resimulation.compare_results(rows, results)
+    assert list(issues.values()) == [['combo5'], ['combo2'], ['combo3'],
+                                     ['combo4']]
+
+
+@pytest.mark.unit
+def test_upper_confidence_limit():
+    """validate_output: test upper_confidence_limit"""
+    # without failures, the limit is 1 - (1 - confidence) ** (1 / n)
+    assert resimulation.upper_confidence_limit(0, 3) == \
+        pytest.approx(1.0 - 0.05 ** (1.0 / 3))
+    assert resimulation.upper_confidence_limit(0, 300) == \
+        pytest.approx(0.00994, abs=1e-5)
+    # the Clopper-Pearson limit of 1 failure in 10 trials
+    assert resimulation.upper_confidence_limit(1, 10) == \
+        pytest.approx(0.3942, abs=1e-4)
+    assert resimulation.upper_confidence_limit(0, 0) == 1.0
+
+
+@pytest.mark.unit
+def test_upper_failure_rate():
+    """validate_output: test upper_failure_rate"""
+    # strata sampled proportionally to their size: a simple random sample
+    failure_rate, n_effective, limit = resimulation.upper_failure_rate(
+        [200, 100], [20, 10], [1, 0])
+    assert failure_rate == pytest.approx(1.0 / 30)
+    assert n_effective == pytest.approx(30.0)
+    assert limit == resimulation.upper_confidence_limit(1, 30)
+
+    # one combo of a large and of many small strata: the sample says little
+    # about the large stratum
+    failure_rate, n_effective, limit = resimulation.upper_failure_rate(
+        [9900] + [1] * 99, [1] * 100, [0] * 100)
+    assert failure_rate == 0.0
+    assert n_effective == pytest.approx(1.02, abs=1e-2)
+    assert limit == resimulation.upper_confidence_limit(0, 1)
+
+    # the failure of the large stratum dominates the estimate
+    failure_rate, _, _ = resimulation.upper_failure_rate(
+        [9900, 100], [1, 1], [1, 0])
+    assert failure_rate == pytest.approx(0.99)
+
+    # a stratum without sample can't be bounded
+    assert resimulation.upper_failure_rate([10, 10], [5, 0], [0, 0])[2] == \
+        1.0